@@ -0,0 +1,174 @@
+# chat/answer_cache.py
+import hashlib
+import math
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from config.env import settings
+from config.logging import logger
+from retriever.pinecone.rule.base import BaseRuleRetriever, RuleSnippet
+from utils.resource_cache import resource_cache
+
+_WS = re.compile(r"\s+")
+_EDGE_PUNCT = " ?!.,;:\"'`"
+
+
+def normalize_question(text: str) -> str:
+    """Chuẩn hoá câu hỏi để so khớp: lowercase, gộp khoảng trắng, bỏ dấu câu đầu/cuối."""
+    return _WS.sub(" ", (text or "").lower()).strip(_EDGE_PUNCT)
+
+
+def snippets_signature(snippets: Iterable[RuleSnippet]) -> str:
+    """Chữ ký tập snippet (source_path + hash nội dung), không phụ thuộc thứ tự/score."""
+    parts = sorted(
+        f"{s.source_path}\0{hashlib.sha1((s.summary or '').encode('utf-8')).hexdigest()}" for s in snippets
+    )
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@dataclass
+class _Entry:
+    answer: str
+    language: str
+    signature: str
+    question_vec: Optional[List[float]]
+    created_at: float
+
+
+class RuleAnswerCache:
+    """
+    Cache câu trả lời search_rule theo (language, câu hỏi đã chuẩn hoá, chữ ký snippet).
+    - TTL + giới hạn số entry (LRU).
+    - Tuỳ chọn similarity_threshold (0 < t ≤ 1) + embed: câu hỏi gần giống (cosine ≥ t)
+      với cùng language và cùng tập snippet sẽ dùng lại câu trả lời.
+    - Rule đổi không cần invalidate để đúng: key có chữ ký snippet, rule mới/sửa → snippet khác → miss.
+    - invalidate(language) chỉ dọn entry cũ sớm: được gọi qua listener khi import rules bằng chính retriever
+      đã watch() trong process này (import_rules_from_txt / ingest_rule_files). Import bằng tmp/script/run_import.py
+      chạy ở process khác nên không chạm tới cache của app — entry cũ tự hết theo TTL/LRU.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float = 3600,
+        max_entries: int = 256,
+        similarity_threshold: float = 0.0,
+        embed: Optional[Callable[[str], List[float]]] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed if similarity_threshold > 0 else None
+        self._entries: "OrderedDict[Tuple[str, str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._watched: "weakref.WeakSet[BaseRuleRetriever]" = weakref.WeakSet()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def get(self, *, language: str, question: str, snippets: List[RuleSnippet]) -> Optional[str]:
+        lang = (language or "").strip().lower()
+        sig = snippets_signature(snippets)
+        key = (lang, normalize_question(question), sig)
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                logger.info("[answer-cache] Hit (exact)")
+                return entry.answer
+            candidates = [e for (l, _, s), e in self._entries.items() if l == lang and s == sig and e.question_vec]
+
+        if self.embed is not None and candidates:
+            vec = self._embed(question)
+            if vec is not None:
+                best = max(candidates, key=lambda e: _cosine(vec, e.question_vec))
+                score = _cosine(vec, best.question_vec)
+                if score >= self.similarity_threshold:
+                    with self._lock:
+                        self.similar_hits += 1
+                    logger.info(f"[answer-cache] Hit (similar, cosine={score:.3f})")
+                    return best.answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, *, language: str, question: str, snippets: List[RuleSnippet], answer: str) -> None:
+        if not (answer or "").strip():
+            return
+        lang = (language or "").strip().lower()
+        sig = snippets_signature(snippets)
+        vec = self._embed(question) if self.embed is not None else None
+        with self._lock:
+            key = (lang, normalize_question(question), sig)
+            self._entries[key] = _Entry(answer, lang, sig, vec, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, language: Optional[str] = None) -> None:
+        """Xoá entry của một ngôn ngữ (hoặc toàn bộ khi language=None)."""
+        lang = (language or "").strip().lower()
+        with self._lock:
+            if not lang:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == lang]:
+                    del self._entries[key]
+        logger.info(f"[answer-cache] Invalidate rules cache: {lang or 'all'}")
+
+    def watch(self, retriever: BaseRuleRetriever) -> None:
+        """Đăng ký invalidate() với retriever (mỗi instance 1 lần) → import rules qua retriever đó sẽ xoá entry."""
+        with self._lock:
+            if retriever in self._watched:
+                return
+            self._watched.add(retriever)
+        retriever.add_rules_changed_listener(self.invalidate)
+
+    def _expire(self, now: float) -> None:
+        # TTL tính từ lúc tạo, thứ tự LRU không phản ánh tuổi → quét toàn bộ (số entry nhỏ)
+        expired = [k for k, e in self._entries.items() if now - e.created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def _embed(self, text: str) -> Optional[List[float]]:
+        try:
+            return self.embed(text)
+        except Exception as e:
+            logger.warning(f"[answer-cache] Lỗi embed câu hỏi: {e}")
+            return None
+
+
+def get_rule_answer_cache(retriever: BaseRuleRetriever) -> RuleAnswerCache:
+    """
+    Cache câu trả lời dùng chung process-wide theo cấu hình retriever (manifest_key: backend + nơi lưu + index),
+    không theo id(retriever) — id có thể bị dùng lại sau khi retriever cũ bị thu hồi, và retriever tạo lại
+    cùng cấu hình vẫn dùng chung cache. Tự invalidate khi retriever import rules.
+    """
+    def _create() -> RuleAnswerCache:
+        embedding = getattr(retriever, "embedding", None)
+        return RuleAnswerCache(
+            ttl_seconds=settings.RULE_ANSWER_CACHE_TTL_S,
+            max_entries=settings.RULE_ANSWER_CACHE_MAX_ENTRIES,
+            similarity_threshold=settings.RULE_ANSWER_SIMILARITY,
+            embed=embedding.embed_query if embedding is not None else None,
+        )
+
+    cache = resource_cache.get_or_create("rule_answer_cache", retriever.manifest_key, _create)
+    cache.watch(retriever)
+    return cache
@@ -1,19 +1,47 @@
 # app/chat_conversasion.py
 from __future__ import annotations
+import asyncio
 import json
-from typing import Dict, List, Tuple, Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple,
+)
 
+from chat.answer_cache import RuleAnswerCache, get_rule_answer_cache
 from chat.chat_message import ChatMessage
-from chat.llm.chat_client import ChatClient
+from chat.llm.chat_client import AsyncChatClient, ChatClient
+from chat.llm.streaming import AsyncChatStream, ChatStream
 from chat.tools import TOOLS
+from config.env import settings
 from config.logging import logger
-from retriever.pinecone.rule.rule_retriever import PineconeRuleRetriever
+from retriever.factory import get_rule_retriever
+from retriever.pinecone.rule.base import BaseRuleRetriever, RuleSearchResult, merge_search_results
 from stores.session_state_store import SessionState, SessionStateStore
+from utils.code_chunks import ChunkedFixPlan, CodeChunk, file_outline, plan_chunked_fix, stitch_chunks
+from utils.code_diff import summarize_diff
 from utils.markdown import extract_code_block
+from utils.patch import apply_patch, parse_patch
 
-from chat.prompts import build_rule_answer_prompt
-from chat.prompts import build_fix_prompt, build_summary_prompt, build_system_context
-from utils.tokens import count_tokens_tiktoken
+from chat.prompts import build_rule_answer_prompt, build_rule_tool_result
+from chat.prompts import (
+    build_chunk_fix_prompt,
+    build_fix_prompt,
+    build_history_summary_prompt,
+    build_patch_fix_prompt,
+    build_planned_changes_prompt,
+    build_summary_prompt,
+)
+from chat.context_builder import build_system_context_sections, join_sections
+from chat.intent_router import classify_intent
+from chat.history_summary import (
+    HistoryFold,
+    HistorySummary,
+    format_transcript,
+    plan_history_fold,
+    summary_message,
+    unsummarized_messages,
+)
+from utils.tokens import TokenBudgeter, get_encoding, get_prompt_token_budget
 
 def _safe_json_parse(s: Optional[str]) -> Dict[str, Any]:
     if not s:
@@ -37,6 +65,300 @@ def _format_chat_messages(msgs: List[ChatMessage]) -> str:
         lines.append(f"{i:02d}. [{role}] {content}")
     return "\n".join(lines)
 
+def _bulletize(deltas: Iterable[str]) -> Iterator[str]:
+    """
+    Chuẩn hoá output tóm tắt thành gạch đầu dòng '- ...' ngay trên stream:
+    gom delta thành từng dòng hoàn chỉnh rồi mới phát ra.
+    """
+    buf = ""
+    for delta in deltas:
+        buf += delta
+        while "\n" in buf:
+            line, buf = buf.split("\n", 1)
+            if line.strip():
+                yield f"- {line.lstrip('- ').strip()}\n"
+    if buf.strip():
+        yield f"- {buf.lstrip('- ').strip()}\n"
+
+async def _abulletize(deltas: AsyncIterable[str]) -> AsyncIterator[str]:
+    """ Bản async của _bulletize: dòng hoàn chỉnh nào có trước thì phát trước. """
+    buf = ""
+    async for delta in deltas:
+        buf += delta
+        if "\n" in buf:
+            done, buf = buf.rsplit("\n", 1)
+            for line in _bulletize([done]):
+                yield line
+    for line in _bulletize([buf]):
+        yield line
+
+_FIX_REPLY_HEADER = "✅ Tôi đã thực hiện chỉnh sửa:\n"
+_FIX_REPLY_FALLBACK = "- Đã áp dụng yêu cầu chỉnh sửa và cập nhật bản sửa trong panel."
+_FIX_REPLY_NO_CHANGES = "ℹ️ Không có thay đổi nào: code hiện tại đã đáp ứng yêu cầu, bản sửa trong panel giữ nguyên."
+_MISSING_QUERY_REPLY = "Thiếu từ khóa để tìm rule."
+_NO_RULE_REPLY = "Không tìm thấy rule phù hợp với yêu cầu của bạn !"
+_DEFAULT_REPLY = "Bạn muốn mình giải thích/đánh giá phần nào của code?"
+_CONNECT_ERROR_REPLY = "Không thể kết nối model. Kiểm tra cấu hình Provider/API key."
+_NO_CHOICES_REPLY = "Mình chưa nhận được phản hồi từ model. Bạn thử hỏi lại nhé."
+_RULE_ANSWER_ERROR = "Hiện mình không thể trả lời dựa trên tài liệu. Bạn có muốn mình sửa code luôn không?"
+_NO_CODE_REPLY = "⚠️ Chưa có code để sửa. Hãy dán code hoặc yêu cầu review trước."
+_FIX_CONNECT_ERROR = "Không thể kết nối model để chạy fix. Kiểm tra cấu hình Provider/API key."
+_SUMMARY_MODES = ("local", "speculative", "llm")
+_FIX_OUTPUT_MODES = ("patch", "full")
+
+# Thread pool dùng chung cho các lời gọi LLM chạy song song (vd: tóm tắt speculative)
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat")
+# Pool riêng cho fix theo chunk (tránh tranh chỗ với tóm tắt speculative đang chạy song song)
+_CHUNK_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, settings.FIX_CHUNK_WORKERS), thread_name_prefix="chat-chunk")
+# Pool riêng cho các nhóm tool chạy song song trong 1 lượt (handler bên trong còn dùng _EXECUTOR → tránh deadlock)
+_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-tool")
+
+def _fix_messages(*, language: str, base_code: str, fix_instructions: str) -> List[ChatMessage]:
+    prompt = build_fix_prompt(language=language, base_code=base_code.strip(), fix_instructions=fix_instructions.strip())
+    messages = [ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])]
+    logger.info(f"[chat] Messages llm fix code: \n{_format_chat_messages(messages)}")
+    return messages
+
+def _patch_fix_messages(*, language: str, base_code: str, fix_instructions: str) -> List[ChatMessage]:
+    prompt = build_patch_fix_prompt(language=language, base_code=base_code.strip(), fix_instructions=fix_instructions.strip())
+    return [ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])]
+
+def _apply_patch_output(base_code: str, patch_text: Optional[str]) -> Optional[str]:
+    """ Áp patch model trả về lên base_code; None → patch không dùng được (caller xin cả file). """
+    logger.info(f"[chat] LLM trả về patch:\n{patch_text}")
+    blocks = parse_patch(patch_text or "")
+    if blocks is None:
+        logger.info("[chat] Output không đúng định dạng patch → fix cả file")
+        return None
+    if not blocks:
+        return base_code
+    fixed_code = apply_patch(base_code, blocks)
+    if fixed_code is None:
+        logger.info("[chat] Không áp được patch → fix cả file")
+    return fixed_code
+
+def _plan_chunked_fix(*, language: str, base_code: str, fix_instructions: str) -> Optional[ChunkedFixPlan]:
+    if settings.FIX_CHUNKED_MIN_LINES <= 0:
+        return None
+    return plan_chunked_fix(
+        base_code,
+        language,
+        fix_instructions,
+        min_lines=settings.FIX_CHUNKED_MIN_LINES,
+        max_chunk_lines=settings.FIX_CHUNK_MAX_LINES,
+        max_fraction=settings.FIX_CHUNK_MAX_FRACTION,
+    )
+
+def _chunk_fix_messages(*, language: str, chunk: CodeChunk, outline: str, fix_instructions: str) -> List[ChatMessage]:
+    prompt = build_chunk_fix_prompt(
+        language=language,
+        chunk_code=chunk.text,
+        chunk_label=f"dòng {chunk.start + 1}–{chunk.end}, {chunk.name}",
+        outline=outline,
+        fix_instructions=fix_instructions.strip(),
+    )
+    return [ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])]
+
+def _log_chunk_plan(plan: ChunkedFixPlan, total_lines: int) -> None:
+    sent = sum(c.end - c.start for c in plan.selected)
+    logger.info(
+        f"[chat] Fix theo chunk: {len(plan.selected)}/{len(plan.chunks)} vùng, {sent}/{total_lines} dòng "
+        f"({', '.join(c.name for c in plan.selected)})"
+    )
+
+def _history_summary_messages(fold: HistoryFold) -> List[ChatMessage]:
+    prompt = build_history_summary_prompt(
+        previous_summary=fold.previous_summary,
+        transcript=format_transcript(fold.messages),
+        max_chars=settings.HISTORY_SUMMARY_MAX_CHARS,
+    )
+    return [ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])]
+
+def _history_summary_result(fold: HistoryFold, text: Optional[str]) -> Optional[HistorySummary]:
+    """ Output của model → HistorySummary (cắt theo HISTORY_SUMMARY_MAX_CHARS); rỗng → None, giữ tóm tắt cũ. """
+    text = (text or "").strip()
+    if not text:
+        logger.info("[chat] Tóm tắt lịch sử rỗng → giữ tóm tắt cũ")
+        return None
+    limit = settings.HISTORY_SUMMARY_MAX_CHARS
+    if limit > 0 and len(text) > limit:
+        text = text[:limit].rsplit("\n", 1)[0].strip() or text[:limit]
+    logger.info(
+        f"[chat] Tóm tắt lịch sử: gộp {len(fold.messages)} message (#{fold.start}–#{fold.upto - 1}), "
+        f"{len(fold.previous_summary)} → {len(text)} ký tự"
+    )
+    return HistorySummary(text, fold.start, fold.upto, fold.messages[-1].get("content", ""))
+
+def _history_summary_model(model: str) -> str:
+    return (settings.HISTORY_SUMMARY_MODEL or "").strip() or model
+
+def _parse_fix_output(fixed_md: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """ Tách code đã fix khỏi markdown, trả về (fixed_code, error_reply). """
+    logger.info(f"[chat] LLM trả về bản fix (markdown):\n{fixed_md}")
+
+    # Extract code đã fix
+    fixed_code = extract_code_block(fixed_md or "")
+    if not fixed_code:
+        return None, ("❌ Không tạo được bản sửa. Hãy mô tả rõ hơn yêu cầu fix "
+                      "(ví dụ: 'theo PEP8, thêm type hints, giữ nguyên logic').")
+    return fixed_code, None
+
+def _planned_changes_messages(*, language: str, base_code: str, fix_instructions: str) -> List[ChatMessage]:
+    prompt = build_planned_changes_prompt(language=language, base_code=base_code, fix_instructions=fix_instructions)
+    return [ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])]
+
+def _summary_messages(*, language: str, base_code: str, fixed_code: str) -> List[ChatMessage]:
+    prompt = build_summary_prompt(language=language, base_code=base_code, fixed_code=fixed_code)
+    messages = [ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])]
+    logger.info(f"[chat] Messages llm tóm tắt thay đổi: \n{_format_chat_messages(messages)}")
+    return messages
+
+def _rule_answer_messages(*, question: str, rule_snippets: list[dict]) -> List[ChatMessage]:
+    prompt = build_rule_answer_prompt(question=question, rule_snippets=rule_snippets)
+    messages = [ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])]
+    logger.info(f"[chat] Messages LLM (answer-with-rules):\n{_format_chat_messages(messages)}")
+    return messages
+
+def _parse_tool_call(tc: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    fn = ((tc or {}).get("function") or {})
+    name = (fn.get("name") or "").strip()
+    args_raw = fn.get("arguments")
+    args = _safe_json_parse(args_raw) if not isinstance(args_raw, dict) else (args_raw or {})
+    return name, args
+
+def _fix_instructions_from_args(args: Dict[str, Any], question: str) -> str:
+    raw_ins = args.get("fix_instructions", question)
+    if isinstance(raw_ins, (list, tuple)):
+        raw_ins = "\n".join(map(str, raw_ins))
+    elif not isinstance(raw_ins, str):
+        raw_ins = str(raw_ins or "")
+    return raw_ins.strip()
+
+def _search_queries_from_args(args: Dict[str, Any], question: str) -> List[str]:
+    """ Lấy danh sách query từ tool args: `queries` (nhiều chủ đề) và/hoặc `query`, fallback câu hỏi. """
+    raw = args.get("queries") or []
+    if isinstance(raw, str):
+        raw = [raw]
+    queries = [str(q).strip() for q in raw if str(q or "").strip()]
+    query = args.get("query")
+    if isinstance(query, (list, tuple)):
+        queries.extend(str(q).strip() for q in query if str(q or "").strip())
+    elif str(query or "").strip():
+        queries.insert(0, str(query).strip())
+    if not queries and (question or "").strip():
+        queries = [question.strip()]
+    return list(dict.fromkeys(queries))
+
+# Tool trả lời thẳng cho người dùng (bản fix + tóm tắt thay đổi) → chạy xong là hết lượt.
+# search_rule trong tool loop chỉ trả rule về model (message "tool"), model viết câu trả lời ở lời gọi kế tiếp.
+_TERMINAL_TOOLS = frozenset({"run_fix"})
+_ASK_RULE_LANGUAGE = "Bạn muốn tìm rule cho ngôn ngữ nào (vd: python, java, javascript)?"
+
+
+class _ToolGroup(NamedTuple):
+    name: str
+    calls: List[Dict[str, Any]]   # các tool_call gốc của model được gộp vào nhóm
+    args: Dict[str, Any]          # tham số đã gộp
+
+def _group_tool_calls(tool_calls: List[Dict[str, Any]], language: str) -> List[_ToolGroup]:
+    """
+    Gom tool_calls để mỗi việc chạy đúng 1 lần, giữ thứ tự xuất hiện:
+    - run_fix: gộp fix_instructions (cùng sửa 1 bản code → 1 lời gọi fix).
+    - search_rule: gộp queries theo language (_search_rules chạy search_many song song cho nhiều query).
+    - tool lạ: mỗi call 1 nhóm (trả lỗi cho model).
+    """
+    groups: Dict[Tuple[str, str], _ToolGroup] = {}
+    for tc in tool_calls:
+        name, args = _parse_tool_call(tc)
+        if name == "run_fix":
+            key = (name, "")
+            ins = _fix_instructions_from_args(args, "")
+            merged: Dict[str, Any] = {"fix_instructions": [ins] if ins else []}
+        elif name == "search_rule":
+            lang = (args.get("language") or language or "").strip()
+            key = (name, lang.lower())
+            merged = {"queries": _search_queries_from_args(args, ""), "language": lang}
+        else:
+            key = (name, str(id(tc)))
+            merged = args
+        group = groups.get(key)
+        if group is None:
+            groups[key] = _ToolGroup(name, [tc], merged)
+            continue
+        group.calls.append(tc)
+        for field in ("fix_instructions", "queries"):
+            if field in merged:
+                group.args[field].extend(x for x in merged[field] if x not in group.args[field])
+    return list(groups.values())
+
+class _ToolRun:
+    """
+    1 nhóm tool sắp chạy, kèm dữ liệu chụp từ state trên thread gọi. Handler (có thể chạy trên _TOOL_EXECUTOR)
+    chỉ đọc/ghi object này; bản fix được merge vào state trên thread gọi sau khi nhóm chạy xong.
+    """
+
+    def __init__(self, group: _ToolGroup, state: SessionState, *, answer_rules: bool):
+        self.group = group
+        self.model = state.model
+        self.language = state.language or "text"
+        self.rule_language = _rule_language(state)
+        # Vòng sau sửa tiếp trên bản vừa fix ở vòng trước
+        self.base_code = ((state.fixed_code or "").strip() or (state.origin_code or "")).strip()
+        # True: search_rule trả lời thẳng người dùng (router local); False: trả rule về model (tool loop)
+        self.answer_rules = answer_rules
+        self.fixed_code: Optional[str] = None
+        self.model_result: Optional[str] = None   # kết quả gửi lại model; None → dùng phần đã hiển thị
+
+def _rule_language(state: SessionState) -> str:
+    """ Ngôn ngữ để lọc rule; "text" (chưa nhận diện được) không phải ngôn ngữ lập trình → "" (hỏi lại người dùng). """
+    lang = (state.language or "").strip()
+    return "" if lang.lower() == "text" else lang
+
+def _tool_key(group: _ToolGroup) -> str:
+    return json.dumps([group.name, group.args], sort_keys=True, ensure_ascii=False, default=str)
+
+def _tool_messages(
+    content: str, tool_calls: List[Dict[str, Any]], groups: List[_ToolGroup], results: Dict[str, str]
+) -> List[ChatMessage]:
+    """
+    assistant (kèm tool_calls) + 1 message role "tool" cho MỖI tool_call (API yêu cầu đủ).
+    Call đã gộp vào nhóm chỉ trỏ về call đầu của nhóm thay vì lặp lại kết quả.
+    """
+    messages = [ChatMessage("assistant", content or None, tool_calls=tool_calls)]
+    for group in groups:
+        first_id = group.calls[0].get("id")
+        for i, tc in enumerate(group.calls):
+            text = results.get(_tool_key(group)) if i == 0 else f"Đã gộp vào tool_call {first_id}, xem kết quả ở đó."
+            messages.append(ChatMessage("tool", text or "(không có kết quả)", tool_call_id=tc.get("id")))
+    return messages
+
+def _local_tool_group(question: str, state: SessionState) -> Optional[_ToolGroup]:
+    """
+    Router local (regex) đủ chắc → nhóm tool chạy thẳng, bỏ qua lời gọi LLM chỉ để định tuyến.
+    None → để model quyết định (trả lời trực tiếp / run_fix / search_rule).
+    """
+    if not settings.INTENT_ROUTER_ENABLED:
+        return None
+    pred = classify_intent(question, min_score=settings.INTENT_ROUTER_MIN_SCORE)
+    routed = pred.confidence >= settings.INTENT_ROUTER_MIN_CONFIDENCE
+    logger.info(
+        f"[chat] Intent local: {pred.intent} ({pred.confidence:.2f}, scores={pred.scores}) → "
+        f"{'chạy thẳng tool' if routed else 'hỏi LLM'}"
+    )
+    if not routed:
+        return None
+    if pred.intent == "run_fix" and ((state.fixed_code or "").strip() or (state.origin_code or "").strip()):
+        return _ToolGroup("run_fix", [], {"fix_instructions": [question.strip()]})
+    if pred.intent == "search_rule" and _rule_language(state):
+        return _ToolGroup("search_rule", [], {"queries": [question.strip()], "language": _rule_language(state)})
+    return None
+
+def _log_tool_round(iteration: int, max_iterations: int, tool_calls: List[Dict[str, Any]], groups: List[_ToolGroup]) -> None:
+    logger.info(
+        f"[chat] Vòng tool {iteration}/{max_iterations}: {len(tool_calls)} tool call → "
+        f"{len(groups)} nhóm ({', '.join(g.name for g in groups)})"
+    )
+
 def _build_messages_with_budget(
     *,
     base_messages: ChatMessage,
@@ -44,70 +366,279 @@ def _build_messages_with_budget(
     new_user_text: str,
     model: str,
     max_turns: int = 10,
-    max_tokens: int = 8000,
-) -> List[ChatMessage]:
+    max_tokens: Optional[int] = None,
+    token_cache: Optional[Dict[str, int]] = None,
+    history_summary: str = "",
+) -> Tuple[List[ChatMessage], int]:
     """
     Lấy tối đa max_turns lượt chat gần nhất + base_messages + user request mới nhất.
-    Nếu tổng token > max_tokens, ta giảm dần số lượt cho đến khi phù hợp.
+    Chọn số lượt lớn nhất vừa max_tokens trong 1 lượt (token mỗi message được cache trong token_cache).
+    history_summary (tóm tắt các lượt đã ra khỏi chat_history) được gửi kèm dạng 1 message system ngắn.
+    max_tokens=None → lấy theo bảng context của model.
+    Trả về (messages, số message history bị bỏ) — bỏ > 0 → cần tóm tắt lịch sử.
     """
+    if max_tokens is None:
+        max_tokens = get_prompt_token_budget(model, reserve_output=settings.MAX_TOKENS)
+
     # Chuẩn hóa lịch sử chat thành ChatMessage list
     history_msgs = [ChatMessage(m["role"], m["content"]) for m in chat_history]
 
-    # Tin nhắn người dùng mới
-    new_user_msg = ChatMessage("user", new_user_text)
+    budgeter = TokenBudgeter(model=model, cache=token_cache)
+    messages = budgeter.fit(
+        base_message=base_messages,
+        history=history_msgs,
+        new_user_message=ChatMessage("user", new_user_text),
+        max_turns=max_turns,
+        max_tokens=max_tokens,
+        summary_message=summary_message(history_summary),
+    )
+    logger.info(
+        f"[chat] Build messages với {len(history_msgs) - budgeter.last_dropped} lượt gần nhất"
+        f"{' + tóm tắt' if history_summary else ''}: {budgeter.last_total}/{max_tokens} tokens"
+        + (f" (bỏ {budgeter.last_dropped} message cũ chưa tóm tắt)" if budgeter.last_dropped else "")
+    )
+    return messages, budgeter.last_dropped
+
+def _system_context_message(*, state: SessionState, question: str) -> ChatMessage:
+    """
+    System message gọn (code mới nhất + diff, file lớn → dàn ý + đoạn liên quan) kèm log token từng phần.
+    """
+    encoding = get_encoding(state.model)
+    sections = build_system_context_sections(
+        origin_code=state.origin_code or "",
+        latest_fixed=(state.fixed_code or "").strip(),
+        language=state.language or "text",
+        question=question,
+        max_code_tokens=settings.CONTEXT_FULL_CODE_MAX_TOKENS,
+        max_diff_tokens=settings.CONTEXT_DIFF_MAX_TOKENS,
+        count_tokens=lambda text: len(encoding.encode(text)),
+    )
+    usage = {s.name: len(encoding.encode(s.text)) for s in sections}
+    logger.info(
+        "[chat] System context tokens: "
+        + ", ".join(f"{name}={tokens}" for name, tokens in usage.items())
+        + f", total={sum(usage.values())}"
+    )
+    return ChatMessage("system", join_sections(sections))
+
+class ReplyStream:
+    """
+    Kết quả của ChatConversation.reply_stream():
+    - Duyệt (hoặc đưa vào st.write_stream) → từng đoạn text của câu trả lời.
+    - Sau khi duyệt hết: .text (câu trả lời đầy đủ), .state, .used_tool, .history_dropped (số message
+      lịch sử bị ngân sách token bỏ khỏi prompt; None → lượt không gửi lịch sử, vd. router local chạy tool).
+    """
+
+    def __init__(self, state: SessionState):
+        self.state = state
+        self.used_tool = False
+        self.history_dropped: Optional[int] = None
+        self.text = ""
+        self._events: Iterator[str] = iter(())
 
-    # Thử lấy từ 10 → 0 lượt gần nhất
-    for keep in range(max_turns, -1, -1):
-        trial_messages = [base_messages] + history_msgs[-keep:] + [new_user_msg]
-        token_count = count_tokens_tiktoken(trial_messages, model)
-        logger.info(f"[chat] Thử build messages với {keep} lượt gần nhất: {token_count} tokens")
-        if token_count <= max_tokens:
-            return trial_messages  # cùng model, đủ token → dùng ngay
+    def __iter__(self) -> Iterator[str]:
+        parts: List[str] = []
+        for delta in self._events:
+            if not delta:
+                continue
+            parts.append(delta)
+            yield delta
+        self.text = "".join(parts).strip()
+
+
+class AsyncReplyStream:
+    """
+    Kết quả của ChatConversation.areply_stream(): như ReplyStream nhưng duyệt bằng async for
+    (st.write_stream(aiter(turn)) chạy async generator trên 1 event loop mới). Sau khi duyệt hết: .text, .state,
+    .used_tool, .history_dropped như ReplyStream.
+    """
+
+    def __init__(self, state: SessionState):
+        self.state = state
+        self.used_tool = False
+        self.history_dropped: Optional[int] = None
+        self.text = ""
+        self._events: Optional[AsyncIterator[str]] = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        parts: List[str] = []
+        async for delta in self._events:
+            if not delta:
+                continue
+            parts.append(delta)
+            yield delta
+        self.text = "".join(parts).strip()
 
-    # Quá giới hạn: chỉ dùng base + user
-    return [base_messages] + [new_user_msg]
 
 class ChatConversation:
-    def __init__(self, *, client: ChatClient, state_store: SessionStateStore):
+    def __init__(
+        self,
+        *,
+        client: ChatClient,
+        state_store: SessionStateStore,
+        rule_retriever: Optional[BaseRuleRetriever] = None,
+        summary_mode: Optional[str] = None,
+        answer_cache: Optional[RuleAnswerCache] = None,
+        fix_output_mode: Optional[str] = None,
+        async_client_factory: Optional[Callable[[], AsyncChatClient]] = None,
+    ):
         self.client = client
+        # Tạo AsyncChatClient mới cho mỗi lượt areply_stream (HTTP pool async gắn với event loop của lượt đó)
+        self.async_client_factory = async_client_factory
         self.state_store = state_store
-        self.rule_retriever = PineconeRuleRetriever(
-            index_name="code-rules"
-        )
+        self._rule_retriever = rule_retriever
+        self._answer_cache = answer_cache
+        mode = (summary_mode or settings.FIX_SUMMARY_MODE or "local").strip().lower()
+        self.summary_mode = mode if mode in _SUMMARY_MODES else "local"
+        output_mode = (fix_output_mode or settings.FIX_OUTPUT_MODE or "patch").strip().lower()
+        self.fix_output_mode = output_mode if output_mode in _FIX_OUTPUT_MODES else "patch"
+
+    @property
+    def rule_retriever(self) -> BaseRuleRetriever:
+        # Lazy + cache process-wide → rerun không gọi Pinecone, chỉ khởi tạo khi thật sự search
+        if self._rule_retriever is None:
+            self._rule_retriever = get_rule_retriever(index_name="code-rules")
+        return self._rule_retriever
+
+    @property
+    def answer_cache(self) -> RuleAnswerCache:
+        # Cache câu trả lời search_rule gắn với retriever (tự invalidate khi import rules)
+        if self._answer_cache is None:
+            self._answer_cache = get_rule_answer_cache(self.rule_retriever)
+        return self._answer_cache
 
-    def _summarize_changes(
+    def _stream_completion(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float,
+        error_reply: str,
+        error_log: str,
+        on_complete: Optional[Callable[[str], None]] = None,
+    ) -> Iterator[str]:
+        """
+        Stream content từ LLM; lỗi kết nối/giữa chừng → log và trả error_reply.
+        on_complete(text) chỉ được gọi khi stream kết thúc thành công.
+        """
+        parts: List[str] = []
+        try:
+            for delta in self.client.chat_completion_stream(model=model, messages=messages, temperature=temperature):
+                parts.append(delta)
+                yield delta
+        except Exception as e:
+            logger.exception(f"{error_log}: {e}")
+            yield error_reply
+            return
+        if on_complete is not None:
+            on_complete("".join(parts))
+
+    def _summarize_changes_stream(
         self, *, model: str, language: str, base_code: str, fixed_code: str
-    ) -> str:
-        """ Gọi LLM để tóm tắt thay đổi giữa base_code và fixed_code. Trả về chuỗi tóm tắt. """
+    ) -> Iterator[str]:
+        """ Gọi LLM (stream) để tóm tắt thay đổi giữa base_code và fixed_code. """
         logger.info("[chat] Gọi LLM để tóm tắt thay đổi code")
 
-        prompt = build_summary_prompt(language=language, base_code=base_code, fixed_code=fixed_code)
-        messages = [ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])]
-        logger.info(f"[chat] Messages llm tóm tắt thay đổi: \n{_format_chat_messages(messages)}")
+        return self._stream_completion(
+            model=model,
+            messages=_summary_messages(language=language, base_code=base_code, fixed_code=fixed_code),
+            temperature=0.1,
+            error_reply="",
+            error_log="[chat] Lỗi LLM khi tóm tắt thay đổi code",
+        )
 
+    def _summarize_planned_changes(
+        self, *, model: str, language: str, base_code: str, fix_instructions: str
+    ) -> str:
+        """ Tóm tắt speculative (chạy song song với lời gọi fix). Lỗi → chuỗi rỗng. """
+        logger.info("[chat] Gọi LLM tóm tắt dự kiến (speculative) song song với fix")
         try:
             return (self.client.chat_completion(
                 model=model,
-                messages=[ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])],
+                messages=_planned_changes_messages(language=language, base_code=base_code, fix_instructions=fix_instructions),
                 temperature=0.1,
             ) or "").strip()
         except Exception as e:
-            logger.exception(f"[chat] Lỗi LLM khi tóm tắt thay đổi code: {e}")
+            logger.exception(f"[chat] Lỗi LLM khi tóm tắt dự kiến: {e}")
             return ""
 
-    def _handle_fix_code(
+    def _fix_chunk(
+        self, *, model: str, language: str, chunk: CodeChunk, outline: str, fix_instructions: str
+    ) -> Optional[str]:
+        """ Fix 1 chunk; lỗi/không có code block → None (chunk giữ nguyên khi ghép). """
+        try:
+            fixed_md = self.client.chat_completion(
+                model=model,
+                messages=_chunk_fix_messages(language=language, chunk=chunk, outline=outline, fix_instructions=fix_instructions),
+                temperature=0.1,
+            )
+        except Exception as e:
+            logger.exception(f"[chat] Lỗi LLM khi fix chunk {chunk.name}: {e}")
+            return None
+        return extract_code_block(fixed_md or "") or None
+
+    def _request_fix_chunked(
         self, *, model: str, language: str, base_code: str, fix_instructions: str
-    ) -> Tuple[Optional[str], str]:
-        """ Thực hiện fix code hiện tại theo hướng dẫn, trả về (fixed_code, reply_message) """
+    ) -> Optional[str]:
+        """
+        File lớn: chỉ fix các chunk liên quan (song song) rồi ghép lại.
+        None → không áp dụng được (file nhỏ, không xác định được vùng, hoặc ghép lỗi) → fix cả file.
+        """
+        plan = _plan_chunked_fix(language=language, base_code=base_code, fix_instructions=fix_instructions)
+        if plan is None:
+            return None
+        _log_chunk_plan(plan, len(base_code.splitlines()))
+        outline = file_outline(plan.chunks)
+        futures = {
+            chunk: _CHUNK_EXECUTOR.submit(
+                self._fix_chunk,
+                model=model, language=language, chunk=chunk, outline=outline, fix_instructions=fix_instructions,
+            )
+            for chunk in plan.selected
+        }
+        fixed_code = stitch_chunks(base_code, language, {chunk: f.result() for chunk, f in futures.items()})
+        if fixed_code is None:
+            logger.info("[chat] Fix theo chunk không ghép được → fix cả file")
+        return fixed_code
+
+    def _request_fix_patch(
+        self, *, model: str, language: str, base_code: str, fix_instructions: str
+    ) -> Optional[str]:
+        """ Xin patch SEARCH/REPLACE rồi áp local; lỗi gọi/parse/áp → None (fallback xin cả file). """
+        try:
+            patch_text = self.client.chat_completion(
+                model=model,
+                messages=_patch_fix_messages(language=language, base_code=base_code, fix_instructions=fix_instructions),
+                temperature=0.1,
+            )
+        except Exception as e:
+            logger.exception(f"[chat] Lỗi LLM khi xin patch: {e}")
+            return None
+        return _apply_patch_output(base_code, patch_text)
+
+    def _request_fix(
+        self, *, model: str, language: str, base_code: str, fix_instructions: str
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """ Gọi LLM để fix code, trả về (fixed_code, error_reply) — đúng một trong hai khác None. """
         logger.info("[chat] Gọi LLM để fix code")
 
         if not (base_code or "").strip():
-            return None, "⚠️ Chưa có code để sửa. Hãy dán code hoặc yêu cầu review trước."
+            return None, _NO_CODE_REPLY
+
+        fixed_code = self._request_fix_chunked(
+            model=model, language=language, base_code=base_code, fix_instructions=fix_instructions
+        )
+        if fixed_code is not None:
+            return fixed_code, None
 
-        prompt = build_fix_prompt(language=language, base_code=base_code.strip(), fix_instructions=fix_instructions.strip())
-        messages = [ChatMessage("system", prompt["system"]), ChatMessage("user", prompt["user"])]
-        logger.info(f"[chat] Messages llm fix code: \n{_format_chat_messages(messages)}")
+        if self.fix_output_mode == "patch":
+            fixed_code = self._request_fix_patch(
+                model=model, language=language, base_code=base_code, fix_instructions=fix_instructions
+            )
+            if fixed_code is not None:
+                return fixed_code, None
 
+        messages = _fix_messages(language=language, base_code=base_code, fix_instructions=fix_instructions)
         try:
             fixed_md = self.client.chat_completion(
                 model=model,
@@ -116,163 +647,848 @@ class ChatConversation:
             )
         except Exception as e:
             logger.exception(f"[chat] Lỗi LLM khi thực hiện fix code: {e}")
-            return None, "Không thể kết nối model để chạy fix. Kiểm tra cấu hình Provider/API key."
+            return None, _FIX_CONNECT_ERROR
 
-        logger.info(f"[chat] LLM trả về bản fix (markdown):\n{fixed_md}")
-        
-        # Extract code đã fix
-        fixed_code = extract_code_block(fixed_md)
-        if not fixed_code:
-            return None, ("❌ Không tạo được bản sửa. Hãy mô tả rõ hơn yêu cầu fix "
-                          "(ví dụ: 'theo PEP8, thêm type hints, giữ nguyên logic').")
-        
-        # Tóm tắt thay đổi
-        summary = self._summarize_changes(model=model, language=language, base_code=base_code, fixed_code=fixed_code)
-        if summary:
-            reply = "✅ Tôi đã thực hiện chỉnh sửa:\n" + "\n".join(f"- {line.lstrip('- ').strip()}" for line in summary.splitlines() if line.strip())
+        return _parse_fix_output(fixed_md)
+
+    def _summary_lines_stream(
+        self, *, model: str, language: str, base_code: str, fixed_code: str, planned: Optional[Future] = None
+    ) -> Iterator[str]:
+        """ Các dòng '- ...' tóm tắt thay đổi theo summary_mode. """
+        if planned is not None:
+            yield from _bulletize([planned.result()])
+        elif self.summary_mode == "llm":
+            yield from _bulletize(self._summarize_changes_stream(
+                model=model, language=language, base_code=base_code, fixed_code=fixed_code
+            ))
         else:
-            reply = "✅ Đã áp dụng yêu cầu chỉnh sửa và cập nhật bản sửa trong panel."
+            # local: tóm tắt từ diff, không tốn thêm lời gọi LLM
+            for line in summarize_diff(base_code, fixed_code):
+                yield f"- {line}\n"
 
-        return fixed_code, reply
-    
-    def _answer_with_rules(
-        self, *, model: str, question: str, rule_snippets: list[dict]
-    ) -> str:
-        """Gọi LLM để trả lời câu hỏi dựa trên RULES + QUESTION. Trả về chuỗi trả lời."""
+    def _handle_fix_code_stream(
+        self,
+        *,
+        model: str,
+        language: str,
+        base_code: str,
+        fix_instructions: str,
+        on_fixed: Callable[[str], None],
+    ) -> Iterator[str]:
+        """
+        Fix code và stream câu trả lời. Bản fix được đẩy qua on_fixed NGAY khi có,
+        trước khi tóm tắt thay đổi (tóm tắt không chặn bản fix).
+        """
+        planned: Optional[Future] = None
+        if self.summary_mode == "speculative" and (base_code or "").strip():
+            planned = _EXECUTOR.submit(
+                self._summarize_planned_changes,
+                model=model, language=language, base_code=base_code, fix_instructions=fix_instructions,
+            )
+
+        fixed_code, error_reply = self._request_fix(
+            model=model, language=language, base_code=base_code, fix_instructions=fix_instructions
+        )
+        if not fixed_code:
+            if planned is not None:
+                planned.cancel()
+            yield error_reply or ""
+            return
+        if fixed_code.strip() == base_code.strip():
+            # NO_CHANGES hoặc model trả lại nguyên code → không báo "đã chỉnh sửa", không cập nhật panel
+            if planned is not None:
+                planned.cancel()
+            logger.info("[chat] Bản fix trùng code hiện tại → trả lời không có thay đổi")
+            yield _FIX_REPLY_NO_CHANGES
+            return
+
+        on_fixed(fixed_code)
+        yield _FIX_REPLY_HEADER
+        has_summary = False
+        for line in self._summary_lines_stream(
+            model=model, language=language, base_code=base_code, fixed_code=fixed_code, planned=planned
+        ):
+            has_summary = True
+            yield line
+        if not has_summary:
+            yield _FIX_REPLY_FALLBACK
+
+    def _answer_with_rules_stream(
+        self,
+        *,
+        model: str,
+        question: str,
+        rule_snippets: list[dict],
+        on_complete: Optional[Callable[[str], None]] = None,
+    ) -> Iterator[str]:
+        """Gọi LLM (stream) để trả lời câu hỏi dựa trên RULES + QUESTION."""
         logger.info("[chat] 🧠 Gọi LLM để trả lời dựa trên RULES (context-grounded)")
 
-        prompt = build_rule_answer_prompt(question=question, rule_snippets=rule_snippets)
-        messages = [
-            ChatMessage("system", prompt["system"]),
-            ChatMessage("user", prompt["user"]),
-        ]
-        logger.info(f"[chat] Messages LLM (answer-with-rules):\n{_format_chat_messages(messages)}")
+        return self._stream_completion(
+            model=model,
+            messages=_rule_answer_messages(question=question, rule_snippets=rule_snippets),
+            temperature=0.1,
+            error_reply=_RULE_ANSWER_ERROR,
+            error_log="[chat] ❌ Lỗi LLM khi trả lời dựa trên RULES",
+            on_complete=on_complete,
+        )
 
-        try:
-            reply = self.client.chat_completion(
-                model=model,
-                messages=messages,
-                temperature=0.1,
-            ) or ""
-            return reply.strip()
-        except Exception as e:
-            logger.exception(f"[chat] ❌ Lỗi LLM khi trả lời dựa trên RULES: {e}")
-            return "Hiện mình không thể trả lời dựa trên tài liệu. Bạn có muốn mình sửa code luôn không?"
+    def _search_rules(self, *, queries: List[str], language: str) -> RuleSearchResult:
+        """ 1 query → search; nhiều query → search_many (embed 1 batch, query song song) rồi gộp kết quả. """
+        if len(queries) == 1:
+            return self.rule_retriever.search(query=queries[0], language=language, k=6, score_threshold=0.25)
+        results = self.rule_retriever.search_many(queries, language, k=6, score_threshold=0.25)
+        return merge_search_results(results, k=6)
 
-    def _handle_search_rule(self, *, args: dict, language: str, question: str, model: str) -> str:
-        query = (args.get("query") or question or "").strip()
+    def _handle_search_rule_stream(self, *, args: dict, language: str, question: str, model: str) -> Iterator[str]:
+        queries = _search_queries_from_args(args, question)
         lang = (args.get("language") or language or "").strip()
-        if not query or not lang:
-            return "Thiếu từ khóa hoặc ngôn ngữ để tìm rule."
+        if not lang:
+            yield _ASK_RULE_LANGUAGE
+            return
+        if not queries:
+            yield _MISSING_QUERY_REPLY
+            return
 
         # 1) Gọi retriever
-        res = self.rule_retriever.search(query=query, language=lang, k=6, score_threshold=0.25)
+        res = self._search_rules(queries=queries, language=lang)
 
         if res.hits == 0:
-            return "Không tìm thấy rule phù hợp với yêu cầu của bạn !"
+            yield _NO_RULE_REPLY
+            return
+
+        # 2) Câu hỏi + snippet giống lần trước → dùng lại câu trả lời đã cache
+        cached = self.answer_cache.get(language=lang, question=question, snippets=res.snippets)
+        if cached is not None:
+            yield cached
+            return
 
-        # 2) Tóm tắt bằng LLM
-        return self._answer_with_rules(
+        # 3) Tóm tắt bằng LLM (chỉ cache khi LLM trả lời thành công)
+        yield from self._answer_with_rules_stream(
             model=model,
             question=question,
             rule_snippets=[s.__dict__ for s in res.snippets],
-        )
-        
-    def _call_llm_with_tools(
-        self,
-        *, model: str, base_messages: ChatMessage, chat_history: List[Dict[str, str]], question: str
-    ) -> Dict[str, Any]:
-        """ Gọi LLM với tool hỗ trợ, trả về raw response từ LLM. """
-        logger.info("[chat] Gọi LLM với tool hỗ trợ")
-
-        messages = _build_messages_with_budget(
-            base_messages=base_messages,        # list[ChatMessage] (system + context)
-            chat_history=chat_history,      # list[dict] [{role, content}]
-            new_user_text=question,
-            model=model,                    # tên model đang dùng
-            max_turns=10,                   # tối đa 10 lượt gần nhất
-            max_tokens=8000,                # giới hạn model (8k, 16k, 128k...)
+            on_complete=lambda answer: self.answer_cache.put(
+                language=lang, question=question, snippets=res.snippets, answer=answer.strip()
+            ),
         )
 
-        logger.info(f"[chat] Messages llm có tool: \n{_format_chat_messages(messages)}")
+    def _search_rule_result(self, *, args: dict, language: str, question: str) -> str:
+        """ search_rule trong tool loop: chỉ tìm rule, trả text gửi lại model (không gọi LLM tóm tắt riêng). """
+        queries = _search_queries_from_args(args, question)
+        lang = (args.get("language") or language or "").strip()
+        if not lang:
+            return f"Chưa biết ngôn ngữ lập trình để lọc rule. Hãy hỏi người dùng: {_ASK_RULE_LANGUAGE}"
+        if not queries:
+            return _MISSING_QUERY_REPLY
+        res = self._search_rules(queries=queries, language=lang)
+        logger.info(f"[chat] search_rule ({lang}): {res.hits} hit cho {len(queries)} query → gửi lại model")
+        return build_rule_tool_result(language=lang, rule_snippets=[s.__dict__ for s in res.snippets])
 
+    def _tools_stream(self, *, model: str, messages: List[ChatMessage], allow_tools: bool = True) -> ChatStream:
+        """
+        1 lời gọi LLM (stream) có tool; model được trả nhiều tool_calls cùng lúc (PARALLEL_TOOL_CALLS).
+        allow_tools=False (lời gọi cuối của tool loop) → tool_choice="none": model phải trả lời từ kết quả đã có.
+        """
         try:
-            raw = self.client.chat_completion(
+            return self.client.chat_completion_stream(
                 model=model,
                 messages=messages,
                 tools=TOOLS,
-                tool_choice="auto",
-                return_raw=True,
+                tool_choice="auto" if allow_tools else "none",
+                parallel_tool_calls=settings.PARALLEL_TOOL_CALLS,
             )
         except Exception as e:
             logger.exception(f"[chat] Lỗi gọi LLM chatbot: {e}")
             raise
-        return raw or {}
+
+    # --- Tool loop ---
+    def _tool_group_stream(self, run: _ToolRun, *, question: str) -> Iterator[str]:
+        """ Chạy 1 nhóm tool, stream phần trả lời cho người dùng. Chỉ dùng dữ liệu trong run (không đọc/ghi state). """
+        group = run.group
+        if group.name == "search_rule":
+            if run.answer_rules:
+                yield from self._handle_search_rule_stream(
+                    args=group.args, language=run.rule_language, question=question, model=run.model
+                )
+            else:
+                run.model_result = self._search_rule_result(args=group.args, language=run.rule_language, question=question)
+            return
+
+        if group.name == "run_fix":
+            if not run.base_code:
+                yield _NO_CODE_REPLY
+                return
+
+            def _store_fixed(code: str) -> None:
+                run.fixed_code = code
+
+            yield from self._handle_fix_code_stream(
+                model=run.model,
+                language=run.language,
+                base_code=run.base_code,
+                fix_instructions=_fix_instructions_from_args(group.args, question) or question,
+                on_fixed=_store_fixed,
+            )
+            return
+
+        logger.info(f"[chat] Model gọi tool không hỗ trợ: {group.name}")
+        run.model_result = f"Tool {group.name} không được hỗ trợ."
+
+    @staticmethod
+    def _merge_tool_run(
+        run: _ToolRun, text: str, *, state: SessionState, out: ReplyStream | AsyncReplyStream, results: Dict[str, str]
+    ) -> None:
+        """ Gộp kết quả 1 nhóm vào state/out/results — luôn chạy trên thread gọi. """
+        if run.fixed_code is not None:
+            state.fixed_code = run.fixed_code
+            out.used_tool = True
+        results[_tool_key(run.group)] = run.model_result if run.model_result is not None else text
+
+    def _tool_round_stream(
+        self,
+        groups: List[_ToolGroup],
+        *,
+        state: SessionState,
+        question: str,
+        out: ReplyStream,
+        results: Dict[str, str],
+        answer_rules: bool = False,
+    ) -> Iterator[str]:
+        """
+        Chạy mọi nhóm tool của 1 lượt model: nhóm đầu stream thẳng ra UI, các nhóm sau chạy song song
+        trên _TOOL_EXECUTOR (gom text) rồi phát theo thứ tự. results[_tool_key(nhóm)] = text gửi lại model.
+        Mỗi nhóm làm việc trên _ToolRun chụp từ state; state/out/results chỉ được ghi trên thread gọi.
+        """
+        if any(g.name == "search_rule" for g in groups):
+            # Khởi tạo lazy trên thread gọi → các worker không cùng lúc tạo retriever/cache
+            self.rule_retriever
+            if answer_rules:
+                self.answer_cache
+        runs = [_ToolRun(g, state, answer_rules=answer_rules) for g in groups]
+
+        def collect(run: _ToolRun) -> str:
+            return "".join(self._tool_group_stream(run, question=question))
+
+        pending = [(run, _TOOL_EXECUTOR.submit(collect, run)) for run in runs[1:]]
+        parts: List[str] = []
+        for delta in self._tool_group_stream(runs[0], question=question):
+            parts.append(delta)
+            yield delta
+        first = "".join(parts)
+        self._merge_tool_run(runs[0], first.strip(), state=state, out=out, results=results)
+        shown = bool(first.strip())
+        separator = "\n" if first.endswith("\n") else "\n\n"
+
+        for run, fut in pending:
+            try:
+                text = fut.result().strip()
+            except Exception as e:
+                logger.exception(f"[chat] Lỗi khi chạy tool {run.group.name}: {e}")
+                text = f"Lỗi khi chạy tool {run.group.name}."
+                run.model_result = None
+            self._merge_tool_run(run, text, state=state, out=out, results=results)
+            if text:
+                yield (separator if shown else "") + text
+                shown, separator = True, "\n\n"
+
+    # --- Tóm tắt lịch sử cuốn chiếu ---
+    def _summarize_fold(self, fold: HistoryFold, *, model: str) -> Optional[HistorySummary]:
+        try:
+            text = self.client.chat_completion(
+                model=_history_summary_model(model),
+                messages=_history_summary_messages(fold),
+                temperature=0,
+            )
+        except Exception as e:
+            logger.exception(f"[chat] Lỗi LLM khi tóm tắt lịch sử: {e}")
+            return None
+        return _history_summary_result(fold, text)
+
+    def _plan_history_fold(self, state: SessionState, dropped: Optional[int]) -> Optional[HistoryFold]:
+        """
+        Store phân trang / cắt RAM có thể để các message chưa tóm tắt [summary_upto, messages_before) nằm ngoài RAM
+        → nạp lại từ store trước khi gộp, để tóm tắt bắt đầu đúng từ summary_upto (apply_history_summary mới nhận).
+        Các message đó cũng chưa từng vào prompt nên tính luôn là phần đã bị bỏ.
+        """
+        if not settings.HISTORY_SUMMARY_ENABLED:
+            return None
+        gap = state.messages_before - state.summary_upto
+        if gap > 0:
+            loaded = self.state_store.load_older_messages(state, limit=gap)
+            if loaded < gap:
+                logger.info(f"[chat] Chỉ nạp được {loaded}/{gap} message chưa tóm tắt từ store → bỏ qua tóm tắt")
+                return None
+            dropped = (dropped or 0) + gap
+        if not dropped:
+            return None
+        return plan_history_fold(state, dropped=dropped, keep_recent=settings.HISTORY_KEEP_RECENT_MESSAGES)
+
+    def summarize_history(self, state: SessionState, *, dropped: Optional[int]) -> Optional[HistorySummary]:
+        """
+        Lượt vừa rồi TokenBudgeter phải bỏ message cũ (dropped = ReplyStream.history_dropped > 0) → gộp các lượt cũ
+        vào tóm tắt hiện có (chỉ gửi phần mới). Không cần tóm tắt / lỗi → None. Áp kết quả bằng apply_history_summary().
+        """
+        fold = self._plan_history_fold(state, dropped)
+        if fold is None:
+            return None
+        return self._summarize_fold(fold, model=state.model)
+
+    def summarize_history_background(self, state: SessionState, *, dropped: Optional[int]) -> Optional[Future]:
+        """
+        Như summarize_history() nhưng chạy nền, gọi sau khi đã trả lời → không làm chậm lượt chat.
+        Dữ liệu cần tóm tắt được chụp ngay tại đây (thread không đọc state). Future → Optional[HistorySummary].
+        """
+        fold = self._plan_history_fold(state, dropped)
+        if fold is None:
+            return None
+        return _EXECUTOR.submit(self._summarize_fold, fold, model=state.model)
 
     # --- API chính ---
-    def reply(self, *, question: str) -> Tuple[str, SessionState, bool]:
+    @staticmethod
+    def _tool_loop_messages(
+        *, question: str, state: SessionState, out: ReplyStream | AsyncReplyStream
+    ) -> List[ChatMessage]:
+        """ Messages cho lời gọi đầu của tool loop (theo ngân sách token); ghi số message lịch sử bị bỏ vào out. """
+        messages, out.history_dropped = _build_messages_with_budget(
+            base_messages=_system_context_message(state=state, question=question),  # system context + system chat
+            chat_history=unsummarized_messages(state),      # list[dict] [{role, content}] chưa tóm tắt
+            new_user_text=question,
+            model=state.model,
+            max_turns=settings.HISTORY_MAX_MESSAGES,
+            token_cache=state.token_counts,                 # cache token theo hash message (trong SessionState)
+            history_summary=state.history_summary,          # tóm tắt các lượt cũ hơn
+        )
+        logger.info(f"[chat] Messages llm có tool: \n{_format_chat_messages(messages)}")
+        return messages
+
+    def reply_stream(self, *, question: str) -> ReplyStream:
+        """ Trả lời dạng stream: duyệt kết quả để nhận từng đoạn text (dùng với st.write_stream). """
         state = self.state_store.get()
+        out = ReplyStream(state)
+        out._events = self._reply_events(question=question, state=state, out=out)
+        return out
+
+    def reply(self, *, question: str) -> Tuple[str, SessionState, bool]:
+        out = self.reply_stream(question=question)
+        for _ in out:
+            pass
+        return (out.text, out.state, out.used_tool)
+
+    def _reply_events(self, *, question: str, state: SessionState, out: ReplyStream) -> Iterator[str]:
+        """
+        Tool loop: gọi model → chạy MỌI tool_call (nhóm độc lập chạy song song) → gửi kết quả lại dạng message
+        "tool" để model làm tiếp, tối đa TOOL_MAX_ITERATIONS lời gọi; lời gọi cuối không cho gọi tool (model phải
+        trả lời từ kết quả đã có). search_rule chỉ trả rule về model → model viết câu trả lời ở lời gọi kế tiếp.
+        run_fix đã có output cho người dùng → nếu cả vòng chỉ có run_fix thì kết thúc lượt, không gọi model thêm.
+        Phần trả lời trực tiếp và output của tool được stream ra UI ngay khi có.
+        """
+        # Yêu cầu rõ ràng (sửa code / hỏi rule) → chạy tool luôn, không tốn 1 lượt LLM để định tuyến
+        local = _local_tool_group(question, state)
+        if local is not None:
+            shown = False
+            for delta in self._tool_round_stream(
+                [local], state=state, question=question, out=out, results={}, answer_rules=True
+            ):
+                shown = shown or bool(delta.strip())
+                yield delta
+            if not shown:
+                yield _DEFAULT_REPLY
+            return
 
         model = state.model
-        chat_history = state.chat_messages or []
-        origin_code = state.origin_code or ""
-        language = state.language or "text"
-        latest_fixed = (state.fixed_code or "").strip()
+        messages = self._tool_loop_messages(question=question, state=state, out=out)
+
+        shown = False                 # đã có nội dung hiển thị cho người dùng trong lượt này
+        executed: Dict[str, str] = {} # kết quả tool đã chạy trong lượt (theo _tool_key) → không chạy lại
+        max_iterations = max(2, settings.TOOL_MAX_ITERATIONS)   # ít nhất 1 vòng tool + 1 lời gọi trả lời
+        for iteration in range(1, max_iterations + 1):
+            # Gọi LLM với tool hỗ trợ — content trả lời trực tiếp được stream ngay ra UI
+            has_content = False
+            try:
+                stream = self._tools_stream(model=model, messages=messages, allow_tools=iteration < max_iterations)
+                for delta in stream:
+                    if shown and not has_content and delta.strip():
+                        yield "\n\n"
+                    has_content = has_content or bool(delta.strip())
+                    yield delta
+                raw = stream.raw()
+            except Exception:
+                logger.info("[chat] Không kết nối được model")
+                if not (shown or has_content):
+                    yield _CONNECT_ERROR_REPLY
+                return
+            shown = shown or has_content
+
+            choices = raw.get("choices") or []
+            if not choices:
+                logger.info("[chat] LLM không trả về lựa chọn")
+                if not shown:
+                    yield _NO_CHOICES_REPLY
+                return
+
+            message: Dict[str, Any] = (choices[0].get("message") or {})
+            tool_calls = message.get("tool_calls") or []
+            if not tool_calls:
+                break
+            if iteration == max_iterations:
+                logger.info("[chat] Model vẫn gọi tool ở lời gọi cuối (tool_choice=none) → bỏ qua")
+                break
+
+            groups = _group_tool_calls(tool_calls, _rule_language(state))
+            _log_tool_round(iteration, max_iterations, tool_calls, groups)
+            fresh = [g for g in groups if _tool_key(g) not in executed]
+            if fresh:
+                results: Dict[str, str] = {}
+                has_output = False
+                for delta in self._tool_round_stream(fresh, state=state, question=question, out=out, results=results):
+                    if shown and not has_output and delta.strip():
+                        yield "\n\n"
+                    has_output = has_output or bool(delta.strip())
+                    yield delta
+                shown = shown or has_output
+                executed.update(results)
+                if has_output and all(g.name in _TERMINAL_TOOLS for g in fresh):
+                    break
+            messages = messages + _tool_messages(message.get("content") or "", tool_calls, groups, executed)
+
+        # Không có tool-call và model không trả lời gì
+        if not shown:
+            yield _DEFAULT_REPLY
+
+    # --- Lượt chat async (asyncio): cùng luồng xử lý với bản sync, các lời gọi LLM độc lập chạy đồng thời ---
+    async def _astream_completion(
+        self,
+        client: AsyncChatClient,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float,
+        error_reply: str,
+        error_log: str,
+        on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+    ) -> AsyncIterator[str]:
+        """ Bản async của _stream_completion; on_complete là coroutine (vd. ghi cache trong thread). """
+        parts: List[str] = []
+        try:
+            stream = await client.chat_completion_stream(model=model, messages=messages, temperature=temperature)
+            async for delta in stream:
+                parts.append(delta)
+                yield delta
+        except Exception as e:
+            logger.exception(f"{error_log}: {e}")
+            yield error_reply
+            return
+        if on_complete is not None:
+            await on_complete("".join(parts))
+
+    async def _acomplete_text(
+        self, client: AsyncChatClient, *, model: str, messages: List[ChatMessage], error_log: str
+    ) -> str:
+        """ 1 lời gọi LLM không stream (temperature 0.1); lỗi → log và trả chuỗi rỗng. """
+        try:
+            return (await client.chat_completion(model=model, messages=messages, temperature=0.1) or "").strip()
+        except Exception as e:
+            logger.exception(f"{error_log}: {e}")
+            return ""
+
+    async def _afix_chunk(
+        self,
+        client: AsyncChatClient,
+        limit: asyncio.Semaphore,
+        *,
+        model: str,
+        language: str,
+        chunk: CodeChunk,
+        outline: str,
+        fix_instructions: str,
+    ) -> Optional[str]:
+        async with limit:
+            try:
+                fixed_md = await client.chat_completion(
+                    model=model,
+                    messages=_chunk_fix_messages(language=language, chunk=chunk, outline=outline, fix_instructions=fix_instructions),
+                    temperature=0.1,
+                )
+            except Exception as e:
+                logger.exception(f"[chat] Lỗi LLM khi fix chunk {chunk.name}: {e}")
+                return None
+        return extract_code_block(fixed_md or "") or None
+
+    async def _arequest_fix_chunked(
+        self, client: AsyncChatClient, *, model: str, language: str, base_code: str, fix_instructions: str
+    ) -> Optional[str]:
+        plan = _plan_chunked_fix(language=language, base_code=base_code, fix_instructions=fix_instructions)
+        if plan is None:
+            return None
+        _log_chunk_plan(plan, len(base_code.splitlines()))
+        outline = file_outline(plan.chunks)
+        limit = asyncio.Semaphore(max(1, settings.FIX_CHUNK_WORKERS))   # cùng giới hạn với _CHUNK_EXECUTOR
+        results = await asyncio.gather(*(
+            self._afix_chunk(
+                client, limit, model=model, language=language, chunk=chunk, outline=outline, fix_instructions=fix_instructions
+            )
+            for chunk in plan.selected
+        ))
+        fixed_code = stitch_chunks(base_code, language, dict(zip(plan.selected, results)))
+        if fixed_code is None:
+            logger.info("[chat] Fix theo chunk không ghép được → fix cả file")
+        return fixed_code
+
+    async def _arequest_fix(
+        self, client: AsyncChatClient, *, model: str, language: str, base_code: str, fix_instructions: str
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """ Bản async của _request_fix: chunk → patch → cả file. """
+        logger.info("[chat] Gọi LLM (async) để fix code")
+
+        if not (base_code or "").strip():
+            return None, _NO_CODE_REPLY
 
-        # System context + system chat
-        system_context = build_system_context(origin_code=origin_code, latest_fixed=latest_fixed, language=language)
-        base_msgs = ChatMessage("system", system_context)
+        fixed_code = await self._arequest_fix_chunked(
+            client, model=model, language=language, base_code=base_code, fix_instructions=fix_instructions
+        )
+        if fixed_code is not None:
+            return fixed_code, None
+
+        if self.fix_output_mode == "patch":
+            try:
+                patch_text = await client.chat_completion(
+                    model=model,
+                    messages=_patch_fix_messages(language=language, base_code=base_code, fix_instructions=fix_instructions),
+                    temperature=0.1,
+                )
+            except Exception as e:
+                logger.exception(f"[chat] Lỗi LLM khi xin patch: {e}")
+                patch_text = None
+            fixed_code = _apply_patch_output(base_code, patch_text) if patch_text is not None else None
+            if fixed_code is not None:
+                return fixed_code, None
+
+        messages = _fix_messages(language=language, base_code=base_code, fix_instructions=fix_instructions)
+        try:
+            fixed_md = await client.chat_completion(model=model, messages=messages, temperature=0.1)
+        except Exception as e:
+            logger.exception(f"[chat] Lỗi LLM khi thực hiện fix code: {e}")
+            return None, _FIX_CONNECT_ERROR
+        return _parse_fix_output(fixed_md)
 
-        # Gọi LLM với tool hỗ trợ
+    async def _asummary_lines_stream(
+        self,
+        client: AsyncChatClient,
+        *,
+        model: str,
+        language: str,
+        base_code: str,
+        fixed_code: str,
+        planned: Optional[asyncio.Task] = None,
+    ) -> AsyncIterator[str]:
+        if planned is not None:
+            for line in _bulletize([await planned]):
+                yield line
+        elif self.summary_mode == "llm":
+            logger.info("[chat] Gọi LLM để tóm tắt thay đổi code")
+            async for line in _abulletize(self._astream_completion(
+                client,
+                model=model,
+                messages=_summary_messages(language=language, base_code=base_code, fixed_code=fixed_code),
+                temperature=0.1,
+                error_reply="",
+                error_log="[chat] Lỗi LLM khi tóm tắt thay đổi code",
+            )):
+                yield line
+        else:
+            for line in summarize_diff(base_code, fixed_code):
+                yield f"- {line}\n"
+
+    async def _ahandle_fix_code_stream(
+        self,
+        client: AsyncChatClient,
+        *,
+        model: str,
+        language: str,
+        base_code: str,
+        fix_instructions: str,
+        on_fixed: Callable[[str], None],
+    ) -> AsyncIterator[str]:
+        """
+        Bản async của _handle_fix_code_stream: speculative → tóm tắt dự kiến là 1 task chạy đồng thời với lời gọi fix;
+        bản fix đi qua on_fixed trước khi tóm tắt (local/llm) được phát.
+        """
+        planned: Optional[asyncio.Task] = None
+        if self.summary_mode == "speculative" and (base_code or "").strip():
+            logger.info("[chat] Gọi LLM tóm tắt dự kiến (speculative) song song với fix")
+            planned = asyncio.create_task(self._acomplete_text(
+                client,
+                model=model,
+                messages=_planned_changes_messages(language=language, base_code=base_code, fix_instructions=fix_instructions),
+                error_log="[chat] Lỗi LLM khi tóm tắt dự kiến",
+            ))
         try:
-            raw = self._call_llm_with_tools(
-                model=model, base_messages=base_msgs, chat_history=chat_history, question=question
+            fixed_code, error_reply = await self._arequest_fix(
+                client, model=model, language=language, base_code=base_code, fix_instructions=fix_instructions
             )
-        except Exception:
-            logger.info("[chat] Không kết nối được model")
-            return ("Không thể kết nối model. Kiểm tra cấu hình Provider/API key.", state, False)
-
-        choices = raw.get("choices") or []
-        if not choices:
-            logger.info("[chat] LLM không trả về lựa chọn")
-            return ("Mình chưa nhận được phản hồi từ model. Bạn thử hỏi lại nhé.", state, False)
-
-        message: Dict[str, Any] = (choices[0].get("message") or {})
-        content: str = (message.get("content") or "").strip()
-        tool_calls = message.get("tool_calls") or []
-
-        if tool_calls:
-            tc = tool_calls[0] or {}
-            fn = (tc.get("function") or {})
-            name = (fn.get("name") or "").strip()
-            args_raw = fn.get("arguments")
-            args = _safe_json_parse(args_raw) if not isinstance(args_raw, dict) else (args_raw or {})
-
-            if name == "search_rule":
-                reply = self._handle_search_rule(args=args, language=language, question=question, model=model)
-                return (reply, state, False)
-
-            if name == "run_fix":
-                base_code = (latest_fixed or origin_code or "").strip()
-                if not base_code:
-                    return None, "⚠️ Chưa có code để sửa. Hãy dán code hoặc yêu cầu review trước."
-                raw_ins = args.get("fix_instructions", question)
-                if isinstance(raw_ins, (list, tuple)):
-                    raw_ins = "\n".join(map(str, raw_ins))
-                elif not isinstance(raw_ins, str):
-                    raw_ins = str(raw_ins or "")
-                fix_instructions = raw_ins.strip()
-
-                fixed_code, reply_msg = self._handle_fix_code(
-                    model=model, language=language, base_code=base_code, fix_instructions=fix_instructions
+            if not fixed_code:
+                yield error_reply or ""
+                return
+            if fixed_code.strip() == base_code.strip():
+                logger.info("[chat] Bản fix trùng code hiện tại → trả lời không có thay đổi")
+                yield _FIX_REPLY_NO_CHANGES
+                return
+
+            on_fixed(fixed_code)
+            yield _FIX_REPLY_HEADER
+            has_summary = False
+            async for line in self._asummary_lines_stream(
+                client, model=model, language=language, base_code=base_code, fixed_code=fixed_code, planned=planned
+            ):
+                has_summary = True
+                yield line
+            if not has_summary:
+                yield _FIX_REPLY_FALLBACK
+        finally:
+            if planned is not None and not planned.done():
+                planned.cancel()
+
+    async def _ahandle_search_rule_stream(
+        self, client: AsyncChatClient, *, args: dict, language: str, question: str, model: str
+    ) -> AsyncIterator[str]:
+        queries = _search_queries_from_args(args, question)
+        lang = (args.get("language") or language or "").strip()
+        if not lang:
+            yield _ASK_RULE_LANGUAGE
+            return
+        if not queries:
+            yield _MISSING_QUERY_REPLY
+            return
+
+        # Retriever và answer cache là sync (network / embed câu hỏi) → chạy trong thread, không chặn event loop
+        res = await asyncio.to_thread(self._search_rules, queries=queries, language=lang)
+        if res.hits == 0:
+            yield _NO_RULE_REPLY
+            return
+
+        cached = await asyncio.to_thread(self.answer_cache.get, language=lang, question=question, snippets=res.snippets)
+        if cached is not None:
+            yield cached
+            return
+
+        logger.info("[chat] 🧠 Gọi LLM để trả lời dựa trên RULES (context-grounded)")
+        async for delta in self._astream_completion(
+            client,
+            model=model,
+            messages=_rule_answer_messages(question=question, rule_snippets=[s.__dict__ for s in res.snippets]),
+            temperature=0.1,
+            error_reply=_RULE_ANSWER_ERROR,
+            error_log="[chat] ❌ Lỗi LLM khi trả lời dựa trên RULES",
+            on_complete=lambda answer: asyncio.to_thread(
+                self.answer_cache.put, language=lang, question=question, snippets=res.snippets, answer=answer.strip()
+            ),
+        ):
+            yield delta
+
+    async def _atool_group_stream(self, client: AsyncChatClient, run: _ToolRun, *, question: str) -> AsyncIterator[str]:
+        """ Bản async của _tool_group_stream (chỉ dùng dữ liệu trong run). """
+        group = run.group
+        if group.name == "search_rule":
+            if run.answer_rules:
+                async for delta in self._ahandle_search_rule_stream(
+                    client, args=group.args, language=run.rule_language, question=question, model=run.model
+                ):
+                    yield delta
+            else:
+                run.model_result = await asyncio.to_thread(
+                    self._search_rule_result, args=group.args, language=run.rule_language, question=question
                 )
-                # Cập nhật code đã fix vào state
-                if fixed_code:
-                    state.fixed_code = fixed_code
+            return
+
+        if group.name == "run_fix":
+            if not run.base_code:
+                yield _NO_CODE_REPLY
+                return
+
+            def _store_fixed(code: str) -> None:
+                run.fixed_code = code
+
+            async for delta in self._ahandle_fix_code_stream(
+                client,
+                model=run.model,
+                language=run.language,
+                base_code=run.base_code,
+                fix_instructions=_fix_instructions_from_args(group.args, question) or question,
+                on_fixed=_store_fixed,
+            ):
+                yield delta
+            return
+
+        logger.info(f"[chat] Model gọi tool không hỗ trợ: {group.name}")
+        run.model_result = f"Tool {group.name} không được hỗ trợ."
 
-                return (reply_msg, state, True)
+    async def _atool_round_stream(
+        self,
+        client: AsyncChatClient,
+        groups: List[_ToolGroup],
+        *,
+        state: SessionState,
+        question: str,
+        out: AsyncReplyStream,
+        results: Dict[str, str],
+        answer_rules: bool = False,
+    ) -> AsyncIterator[str]:
+        """
+        Bản async của _tool_round_stream: nhóm đầu stream thẳng ra UI, các nhóm sau là task chạy đồng thời
+        rồi phát theo thứ tự. State/out/results chỉ được ghi trên event loop.
+        """
+        if any(g.name == "search_rule" for g in groups):
+            # Khởi tạo lazy retriever/cache 1 lần (trong thread) trước khi các nhóm chạy đồng thời
+            await asyncio.to_thread(lambda: self.answer_cache if answer_rules else self.rule_retriever)
+        runs = [_ToolRun(g, state, answer_rules=answer_rules) for g in groups]
+
+        async def collect(run: _ToolRun) -> str:
+            return "".join([delta async for delta in self._atool_group_stream(client, run, question=question)])
+
+        pending = [(run, asyncio.create_task(collect(run))) for run in runs[1:]]
+        try:
+            parts: List[str] = []
+            async for delta in self._atool_group_stream(client, runs[0], question=question):
+                parts.append(delta)
+                yield delta
+            first = "".join(parts)
+            self._merge_tool_run(runs[0], first.strip(), state=state, out=out, results=results)
+            shown = bool(first.strip())
+            separator = "\n" if first.endswith("\n") else "\n\n"
+
+            for run, task in pending:
+                try:
+                    text = (await task).strip()
+                except Exception as e:
+                    logger.exception(f"[chat] Lỗi khi chạy tool {run.group.name}: {e}")
+                    text = f"Lỗi khi chạy tool {run.group.name}."
+                    run.model_result = None
+                self._merge_tool_run(run, text, state=state, out=out, results=results)
+                if text:
+                    yield (separator if shown else "") + text
+                    shown, separator = True, "\n\n"
+        finally:
+            for _, task in pending:
+                if not task.done():
+                    task.cancel()
+
+    async def _atools_stream(
+        self, client: AsyncChatClient, *, model: str, messages: List[ChatMessage], allow_tools: bool = True
+    ) -> AsyncChatStream:
+        try:
+            return await client.chat_completion_stream(
+                model=model,
+                messages=messages,
+                tools=TOOLS,
+                tool_choice="auto" if allow_tools else "none",
+                parallel_tool_calls=settings.PARALLEL_TOOL_CALLS,
+            )
+        except Exception as e:
+            logger.exception(f"[chat] Lỗi gọi LLM chatbot: {e}")
+            raise
+
+    async def _areply_events(
+        self, client: AsyncChatClient, *, question: str, state: SessionState, out: AsyncReplyStream
+    ) -> AsyncIterator[str]:
+        """ Bản async của _reply_events (cùng tool loop, xem docstring bản sync). """
+        local = _local_tool_group(question, state)
+        if local is not None:
+            shown = False
+            async for delta in self._atool_round_stream(
+                client, [local], state=state, question=question, out=out, results={}, answer_rules=True
+            ):
+                shown = shown or bool(delta.strip())
+                yield delta
+            if not shown:
+                yield _DEFAULT_REPLY
+            return
+
+        model = state.model
+        messages = self._tool_loop_messages(question=question, state=state, out=out)
+
+        shown = False
+        executed: Dict[str, str] = {}
+        max_iterations = max(2, settings.TOOL_MAX_ITERATIONS)
+        for iteration in range(1, max_iterations + 1):
+            has_content = False
+            try:
+                stream = await self._atools_stream(
+                    client, model=model, messages=messages, allow_tools=iteration < max_iterations
+                )
+                async for delta in stream:
+                    if shown and not has_content and delta.strip():
+                        yield "\n\n"
+                    has_content = has_content or bool(delta.strip())
+                    yield delta
+                raw = await stream.araw()
+            except Exception:
+                logger.info("[chat] Không kết nối được model")
+                if not (shown or has_content):
+                    yield _CONNECT_ERROR_REPLY
+                return
+            shown = shown or has_content
+
+            choices = raw.get("choices") or []
+            if not choices:
+                logger.info("[chat] LLM không trả về lựa chọn")
+                if not shown:
+                    yield _NO_CHOICES_REPLY
+                return
+
+            message: Dict[str, Any] = (choices[0].get("message") or {})
+            tool_calls = message.get("tool_calls") or []
+            if not tool_calls:
+                break
+            if iteration == max_iterations:
+                logger.info("[chat] Model vẫn gọi tool ở lời gọi cuối (tool_choice=none) → bỏ qua")
+                break
+
+            groups = _group_tool_calls(tool_calls, _rule_language(state))
+            _log_tool_round(iteration, max_iterations, tool_calls, groups)
+            fresh = [g for g in groups if _tool_key(g) not in executed]
+            if fresh:
+                results: Dict[str, str] = {}
+                has_output = False
+                async for delta in self._atool_round_stream(
+                    client, fresh, state=state, question=question, out=out, results=results
+                ):
+                    if shown and not has_output and delta.strip():
+                        yield "\n\n"
+                    has_output = has_output or bool(delta.strip())
+                    yield delta
+                shown = shown or has_output
+                executed.update(results)
+                if has_output and all(g.name in _TERMINAL_TOOLS for g in fresh):
+                    break
+            messages = messages + _tool_messages(message.get("content") or "", tool_calls, groups, executed)
+
+        if not shown:
+            yield _DEFAULT_REPLY
+
+    async def _areply_turn(self, *, question: str, state: SessionState, out: AsyncReplyStream) -> AsyncIterator[str]:
+        # Client async tạo trong event loop đang duyệt stream và đóng khi lượt kết thúc
+        client = self.async_client_factory()
+        try:
+            async for delta in self._areply_events(client, question=question, state=state, out=out):
+                yield delta
+        finally:
+            await client.aclose()
+
+    def areply_stream(self, *, question: str) -> AsyncReplyStream:
+        """
+        Bản async của reply_stream() (cần async_client_factory): duyệt bằng async for, hoặc st.write_stream(aiter(turn)).
+        Fix + tóm tắt speculative, các nhóm tool và các chunk fix chạy đồng thời trên 1 event loop.
+        """
+        if self.async_client_factory is None:
+            raise RuntimeError("ChatConversation chưa có async_client_factory → dùng reply_stream()")
+        state = self.state_store.get()
+        out = AsyncReplyStream(state)
+        out._events = self._areply_turn(question=question, state=state, out=out)
+        return out
 
-        # Không có tool-call -> trả lời trực tiếp
-        if not content:
-            content = "Bạn muốn mình giải thích/đánh giá phần nào của code?"
-        return (content, state, False)
+    async def areply(self, *, question: str) -> Tuple[str, SessionState, bool]:
+        out = self.areply_stream(question=question)
+        async for _ in out:
+            pass
+        return (out.text, out.state, out.used_tool)
@@ -1,4 +1,16 @@
+from typing import Any, Dict, List, Optional
+
+
 class ChatMessage:
-    def __init__(self, role: str, content: str):
+    def __init__(
+        self,
+        role: str,
+        content: Optional[str],
+        *,
+        tool_calls: Optional[List[Dict[str, Any]]] = None,  # assistant yêu cầu gọi tool
+        tool_call_id: Optional[str] = None,                 # role "tool": kết quả cho tool_call nào
+    ):
         self.role = role
-        self.content = content
\ No newline at end of file
+        self.content = content
+        self.tool_calls = tool_calls
+        self.tool_call_id = tool_call_id
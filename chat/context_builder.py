@@ -0,0 +1,100 @@
+from typing import Callable, List, NamedTuple
+
+from chat.prompts import build_system_instructions
+from utils.code_chunks import outline_code, select_relevant_chunks, split_code_chunks
+from utils.code_diff import unified_diff_rows
+
+_DIFF_PREFIX = {"meta": "", "ctx": " ", "add": "+", "del": "-"}
+# Code hiếm khi quá ~8 ký tự/token → text dài hơn max_tokens * 8 ký tự chắc chắn vượt budget, khỏi encode
+_MAX_CHARS_PER_TOKEN = 8
+
+
+class ContextSection(NamedTuple):
+    name: str   # "instructions" | "code" | "diff" | "language" — dùng để log token theo từng phần
+    text: str
+
+
+def _approx_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def _code_section(
+    code: str, *, label: str, language: str, question: str, max_tokens: int, count_tokens: Callable[[str], int]
+) -> str:
+    """Code vừa budget → gửi nguyên văn; quá lớn → dàn ý + các đoạn câu hỏi nhắc tới (trong phần budget còn lại)."""
+    full = f"{label}:\n```\n{code}\n```\n"
+    if max_tokens <= 0 or (len(full) <= max_tokens * _MAX_CHARS_PER_TOKEN and count_tokens(full) <= max_tokens):
+        return full
+
+    outline = outline_code(code, language)
+    text = (
+        f"{label} ({len(code.splitlines())} dòng, quá lớn nên chỉ gửi dàn ý và các đoạn liên quan tới câu hỏi).\n"
+        f"Dàn ý (L<số dòng>):\n```\n{outline}\n```\n"
+    )
+    used = count_tokens(text)
+    chunks = split_code_chunks(code, language)
+    for chunk in select_relevant_chunks(chunks, question):
+        part = f"Đoạn dòng {chunk.start + 1}–{chunk.end} ({chunk.name}):\n```\n{chunk.text}\n```\n"
+        tokens = count_tokens(part)
+        if used + tokens > max_tokens:
+            break
+        text += part
+        used += tokens
+    return text
+
+
+def _diff_section(origin_code: str, latest_fixed: str, *, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Unified diff bản gốc → bản mới nhất; vượt budget → cắt theo dòng và ghi chú phần bị bỏ."""
+    rows = unified_diff_rows(origin_code, latest_fixed, n=2)
+    if not rows:
+        return "Bản fix gần nhất không khác source gốc.\n"
+    lines = [_DIFF_PREFIX[r.kind] + r.text for r in rows]
+    head = "Thay đổi của bản mới nhất so với source gốc (unified diff, gốc → mới):\n```diff\n"
+    used = count_tokens(head)
+    kept: List[str] = []
+    for line in lines:
+        tokens = count_tokens(line + "\n")
+        if max_tokens > 0 and used + tokens > max_tokens:
+            break
+        kept.append(line)
+        used += tokens
+    text = head + "\n".join(kept) + "\n```\n"
+    if len(kept) < len(lines):
+        text += f"(Đã lược {len(lines) - len(kept)} dòng diff cuối do giới hạn độ dài.)\n"
+    return text
+
+
+def build_system_context_sections(
+    *,
+    origin_code: str,
+    latest_fixed: str,
+    language: str,
+    question: str = "",
+    max_code_tokens: int = 6000,
+    max_diff_tokens: int = 2000,
+    count_tokens: Callable[[str], int] = _approx_tokens,
+) -> List[ContextSection]:
+    """
+    System context gọn: code chỉ gửi 1 lần (bản mới nhất), bản còn lại gửi dạng unified diff.
+    File quá max_code_tokens → dàn ý + các đoạn liên quan tới câu hỏi thay vì cả file.
+    """
+    sections = [ContextSection("instructions", build_system_instructions())]
+    if latest_fixed.strip() and latest_fixed.strip() != origin_code.strip():
+        sections.append(ContextSection("code", _code_section(
+            latest_fixed, label="Phiên bản code đã fix gần nhất (bản hiện hành)", language=language,
+            question=question, max_tokens=max_code_tokens, count_tokens=count_tokens,
+        )))
+        sections.append(ContextSection("diff", _diff_section(
+            origin_code, latest_fixed, max_tokens=max_diff_tokens, count_tokens=count_tokens,
+        )))
+    else:
+        sections.append(ContextSection("code", _code_section(
+            origin_code, label="Source gốc người dùng nhập vào", language=language,
+            question=question, max_tokens=max_code_tokens, count_tokens=count_tokens,
+        )))
+    sections.append(ContextSection("language", f"Ngôn ngữ: {language}\n"))
+    return sections
+
+
+def join_sections(sections: List[ContextSection]) -> str:
+    return "".join(s.text for s in sections)
@@ -0,0 +1,71 @@
+from typing import Dict, List, NamedTuple, Optional
+
+from chat.chat_message import ChatMessage
+from stores.session_state_store import SessionState
+
+# Mỗi message đưa vào prompt tóm tắt bị cắt còn tối đa ngần này ký tự (reply dài / code block)
+_TRANSCRIPT_MESSAGE_CHARS = 1500
+
+
+class HistoryFold(NamedTuple):
+    """Phần lịch sử cần gộp vào tóm tắt: message có chỉ số tuyệt đối trong [start, upto)."""
+    previous_summary: str
+    start: int
+    upto: int
+    messages: List[Dict[str, str]]
+
+
+class HistorySummary(NamedTuple):
+    text: str
+    start: int     # summary_upto của state lúc bắt đầu tóm tắt
+    upto: int      # tóm tắt mới phủ các message có chỉ số tuyệt đối < upto
+    anchor: str    # content message cuối được tóm tắt → phát hiện lịch sử đã bị thay (Clear, đổi code…)
+
+
+def unsummarized_messages(state: SessionState) -> List[Dict[str, str]]:
+    """Các message trong RAM chưa nằm trong history_summary (chỉ số tuyệt đối = messages_before + vị trí)."""
+    offset = max(0, state.summary_upto - state.messages_before)
+    return state.chat_messages[offset:]
+
+
+def plan_history_fold(state: SessionState, *, dropped: int, keep_recent: int) -> Optional[HistoryFold]:
+    """
+    TokenBudgeter vừa bỏ `dropped` message cũ khỏi prompt (vượt ngân sách token hoặc số lượt) → gộp phần cũ vào
+    tóm tắt, giữ nguyên văn keep_recent message cuối (ít nhất gộp hết phần đã bị bỏ). None → chưa cần tóm tắt.
+    """
+    if dropped <= 0:
+        return None
+    pending = unsummarized_messages(state)
+    fold = pending[:min(len(pending), max(dropped, len(pending) - max(0, keep_recent)))]
+    if not fold:
+        return None
+    start = state.messages_before + len(state.chat_messages) - len(pending)
+    return HistoryFold(state.history_summary, start, start + len(fold), fold)
+
+
+def format_transcript(messages: List[Dict[str, str]]) -> str:
+    rows = []
+    for m in messages:
+        content = (m.get("content") or "").strip()
+        if len(content) > _TRANSCRIPT_MESSAGE_CHARS:
+            content = content[:_TRANSCRIPT_MESSAGE_CHARS] + " …(lược)"
+        rows.append(f"{m.get('role', 'user')}: {content}")
+    return "\n".join(rows)
+
+
+def apply_history_summary(state: SessionState, summary: HistorySummary) -> bool:
+    """Áp kết quả tóm tắt (có thể đến trễ từ lượt trước) nếu lịch sử vẫn khớp; trả về True nếu đã áp."""
+    if state.summary_upto != summary.start:
+        return False
+    idx = summary.upto - 1 - state.messages_before
+    if not 0 <= idx < len(state.chat_messages) or state.chat_messages[idx].get("content") != summary.anchor:
+        return False
+    state.history_summary = summary.text
+    state.summary_upto = summary.upto
+    return True
+
+
+def summary_message(text: str) -> Optional[ChatMessage]:
+    if not (text or "").strip():
+        return None
+    return ChatMessage("system", f"Tóm tắt các lượt trò chuyện trước đó:\n{text.strip()}")
@@ -0,0 +1,92 @@
+import re
+import unicodedata
+from typing import List, NamedTuple, Tuple
+
+# Intent trả về: "run_fix" | "search_rule" | "chat" (không đoán được → để LLM định tuyến)
+INTENTS = ("run_fix", "search_rule", "chat")
+
+# (pattern, trọng số) — so khớp trên câu hỏi đã lowercase + bỏ dấu tiếng Việt ("sửa lỗi" → "sua loi")
+_FIX_PATTERNS: List[Tuple[re.Pattern, int]] = [
+    (re.compile(r"\b(fix|sua|refactor|rewrite|viet lai|toi uu|optimi[sz]e|clean ?up|don dep)\b"), 2),
+    (re.compile(
+        r"\b(them|add|bo sung)\b.{0,30}\b(type hints?|docstrings?|comments?|chu thich|logging|log|validation"
+        r"|kiem tra|try|except|xu ly (loi|ngoai le)|error handling|unit tests?)\b"
+    ), 2),
+    (re.compile(r"\b(doi ten|rename|chuyen (sang|thanh)|convert|thay (the|bang)|replace|remove|xoa)\b"), 1),
+    (re.compile(r"\b(chinh sua|dieu chinh|cap nhat|update|change|doi sang)\b"), 1),
+]
+_RULE_PATTERNS: List[Tuple[re.Pattern, int]] = [
+    (re.compile(
+        r"\b(rules?|quy tac|quy uoc|conventions?|best practices?|guidelines?|coding standards?|style guide"
+        r"|chuan (code|dat ten|viet)|nguyen tac|pep ?8)\b"
+    ), 2),
+    (re.compile(r"\b(dat ten|naming)\b"), 1),
+    (re.compile(r"\b(co nen|nen (dung|viet|dat)|should i|is it (ok|good|bad) to|dung hay sai)\b"), 1),
+]
+# Câu hỏi/giải thích/liệt kê → người dùng hỏi chứ chưa chắc muốn sửa: khớp bất kỳ → không tự chạy run_fix
+_QUESTION_PATTERNS: List[Tuple[re.Pattern, int]] = [
+    (re.compile(
+        r"\b(tai sao|vi sao|why|giai thich|explain|la gi|what (is|does)|nhu the nao|how (does|do|to|can|should)"
+        r"|y nghia|liet ke|list (the|all|every|out)|chi ra|cho (toi|minh|em) biet|what changed|update me|thay doi (gi|nhung gi)"
+        r"|o dau|cho nao|where)\b"
+    ), 1),
+    (re.compile(r"\?"), 1),
+]
+# Tham chiếu ngữ cảnh trước / yêu cầu đánh giá → cần LLM đọc lịch sử, không tự định tuyến
+_CONTEXT_PATTERNS: List[Tuple[re.Pattern, int]] = [
+    (re.compile(
+        r"\b(nhu tren|o tren|phia tren|vua roi|goi y (do|tren|cua ban)|above|previous|that suggestion"
+        r"|lam lai|lam tiep|tiep tuc|again|continue|review|danh gia)\b"
+    ), 2),
+]
+# Phủ định ("đừng sửa", "không cần fix", "don't change") → không bao giờ tự định tuyến.
+# "đừng" và "dùng" trùng nhau khi bỏ dấu nên bản có dấu khớp trên text giữ dấu, bản không dấu chỉ khớp liền kề.
+_NEGATION_ACCENTED = re.compile(r"(đừng|không cần|không được|không nên|chưa cần|khỏi)\s.{0,20}?(sửa|fix|đổi|thay|chỉnh)")
+_NEGATION_PLAIN = re.compile(
+    r"\b(don'?t|do not|dont|no need to|without|never)\b.{0,20}?\b(fix|change|modify|touch|edit|rewrite|update|refactor)"
+    r"|\b(khong can|khong duoc|khong nen|chua can)\b.{0,20}?\b(sua|fix|doi|thay|chinh)"
+    r"|\bdung (co )?(sua|fix|doi|thay|chinh)\b"
+)
+
+
+class IntentPrediction(NamedTuple):
+    intent: str         # "run_fix" | "search_rule" | "chat"
+    confidence: float   # 0..1; dưới ngưỡng → hỏi LLM
+    scores: Tuple[int, int, int, int]   # (fix, rule, question, context) — để log/benchmark
+
+
+def _normalize(text: str) -> str:
+    """lowercase + bỏ dấu tiếng Việt (đ → d) để khớp cả câu gõ không dấu."""
+    text = (text or "").lower().replace("đ", "d")
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def _score(text: str, patterns: List[Tuple[re.Pattern, int]]) -> int:
+    return sum(weight for pattern, weight in patterns if pattern.search(text))
+
+
+def is_negated(question: str) -> bool:
+    lowered = unicodedata.normalize("NFC", (question or "").lower())
+    return bool(_NEGATION_ACCENTED.search(lowered) or _NEGATION_PLAIN.search(_normalize(question)))
+
+
+def classify_intent(question: str, *, min_score: int = 2) -> IntentPrediction:
+    """
+    Router local bằng keyword/regex (vài chục µs, không gọi mạng).
+    - Phủ định, hoặc điểm intent thắng < min_score (chỉ khớp 1 từ khoá yếu) → "chat".
+    - run_fix bị phủ quyết khi câu có dấu hiệu hỏi/giải thích/liệt kê (người dùng chưa chắc muốn sửa).
+    - confidence = (điểm intent thắng − điểm intent còn lại) / (tổng điểm + điểm nghi ngờ).
+    """
+    text = _normalize(question)
+    fix = _score(text, _FIX_PATTERNS)
+    rule = _score(text, _RULE_PATTERNS)
+    question_score = _score(text, _QUESTION_PATTERNS)
+    context = _score(text, _CONTEXT_PATTERNS)
+    scores = (fix, rule, question_score, context)
+    if fix == rule or max(fix, rule) < min_score or is_negated(question):
+        return IntentPrediction("chat", 0.0, scores)
+    if fix > rule:
+        if question_score:
+            return IntentPrediction("chat", 0.0, scores)
+        return IntentPrediction("run_fix", (fix - rule) / (fix + rule + context), scores)
+    return IntentPrediction("search_rule", (rule - fix) / (fix + rule + context), scores)
@@ -1,8 +1,21 @@
+import time
 from typing import List, Optional, Dict, Any
 
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI, AzureOpenAI
 from chat.chat_message import ChatMessage
-from chat.llm.chat_client import ChatClient
+from chat.llm.chat_client import AsyncChatClient, ChatClient
+from chat.llm.response import normalize_response, to_sdk_messages
+from chat.llm.streaming import AsyncChatStream, ChatStream
+from chat.llm.transport import (
+    astream_with_deadline,
+    create_async_http_client,
+    get_http_client,
+    llm_endpoint_key,
+    llm_retry_policy,
+    request_timeout,
+    sdk_client_options,
+    stream_with_deadline,
+)
 
 class AzureOpenAIChatClient(ChatClient):
     """
@@ -11,12 +24,23 @@ class AzureOpenAIChatClient(ChatClient):
     - api_version: ví dụ "2024-08-01-preview"
     - model: tên deployment (vd: "gpt-4o-mini-deploy")
     """
-    def __init__(self, *, api_key: str, api_base: str, api_version: str):
-         self._client = AzureOpenAI(
+    def __init__(self, *, api_key: str, api_base: str, api_version: str, max_retries: Optional[int] = None):
+        # HTTP pool dùng chung process-wide; retry/timeout/circuit breaker do RetryPolicy riêng của client đảm nhận
+        self._client = AzureOpenAI(
             api_key=api_key,
             azure_endpoint=api_base,
             api_version=api_version,
+            http_client=get_http_client(),
+            **sdk_client_options(),
         )
+        self.retry = llm_retry_policy(
+            llm_endpoint_key(provider="Azure OpenAI", api_key=api_key, api_base=api_base, api_version=api_version),
+            label=f"azure:{api_base}",
+            max_retries=max_retries,
+        )
+
+    def close(self) -> None:
+        """HTTP pool dùng chung (transport.get_http_client) → không đóng khi client bị gỡ khỏi cache."""
 
     def chat_completion(
         self,
@@ -26,38 +50,128 @@ class AzureOpenAIChatClient(ChatClient):
         temperature: float = 0.3,
         tools: Optional[List[Dict[str, Any]]] = None,
         tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+        return_raw: bool = False,
+    ) -> Any:
+        msgs = to_sdk_messages(messages)
+        kwargs: Dict[str, Any] = {"model": model, "messages": msgs, "temperature": temperature}
+        if tools is not None:
+            kwargs["tools"] = tools
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        if tools is not None and parallel_tool_calls is not None:
+            kwargs["parallel_tool_calls"] = parallel_tool_calls
+
+        resp = self.retry.call(
+            lambda timeout: self._client.chat.completions.create(**kwargs, timeout=request_timeout(timeout))
+        )
+
+        if return_raw:
+            return normalize_response(resp)
+
+        return resp.choices[0].message.content or ""
+
+    def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> ChatStream:
+        msgs = to_sdk_messages(messages)
+        kwargs: Dict[str, Any] = {"model": model, "messages": msgs, "temperature": temperature, "stream": True}
+        if tools is not None:
+            kwargs["tools"] = tools
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        if tools is not None and parallel_tool_calls is not None:
+            kwargs["parallel_tool_calls"] = parallel_tool_calls
+
+        started_at, started = time.perf_counter(), time.monotonic()
+        chunks = self.retry.call(
+            lambda timeout: self._client.chat.completions.create(**kwargs, timeout=request_timeout(timeout))
+        )
+        # Deadline tổng (LLM_CALL_DEADLINE_S) áp cả lúc đọc stream, không chỉ tới lúc nhận header
+        chunks = stream_with_deadline(chunks, started=started, label="azure")
+        return ChatStream(chunks, started_at=started_at, label="azure")
+
+
+class AsyncAzureOpenAIChatClient(AsyncChatClient):
+    """
+    Bản async của AzureOpenAIChatClient (AsyncAzureOpenAI): nhiều lời gọi chạy đồng thời trong cùng event loop.
+    HTTP pool gắn với event loop → tạo mới mỗi lượt chat, aclose() khi xong; breaker dùng chung với client sync.
+    """
+    def __init__(self, *, api_key: str, api_base: str, api_version: str, max_retries: Optional[int] = None):
+        self._client = AsyncAzureOpenAI(
+            api_key=api_key,
+            azure_endpoint=api_base,
+            api_version=api_version,
+            http_client=create_async_http_client(),
+            **sdk_client_options(),
+        )
+        self.retry = llm_retry_policy(
+            llm_endpoint_key(provider="Azure OpenAI", api_key=api_key, api_base=api_base, api_version=api_version),
+            label=f"azure:{api_base}",
+            max_retries=max_retries,
+        )
+
+    async def aclose(self) -> None:
+        await self._client.close()
+
+    async def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
         return_raw: bool = False,
     ) -> Any:
-        msgs = [{"role": m.role, "content": m.content} for m in messages]
+        msgs = to_sdk_messages(messages)
         kwargs: Dict[str, Any] = {"model": model, "messages": msgs, "temperature": temperature}
         if tools is not None:
             kwargs["tools"] = tools
         if tool_choice is not None:
             kwargs["tool_choice"] = tool_choice
+        if tools is not None and parallel_tool_calls is not None:
+            kwargs["parallel_tool_calls"] = parallel_tool_calls
 
-        resp = self._client.chat.completions.create(**kwargs)
+        resp = await self.retry.acall(
+            lambda timeout: self._client.chat.completions.create(**kwargs, timeout=request_timeout(timeout))
+        )
 
         if return_raw:
-            return {
-                "choices": [
-                    {
-                        "message": {
-                            "role": getattr(resp.choices[0].message, "role", "assistant"),
-                            "content": resp.choices[0].message.content,
-                            "tool_calls": [
-                                {
-                                    "id": tc.id,
-                                    "type": tc.type,
-                                    "function": {
-                                        "name": tc.function.name,
-                                        "arguments": tc.function.arguments,
-                                    },
-                                }
-                                for tc in (resp.choices[0].message.tool_calls or [])
-                            ] if getattr(resp.choices[0].message, "tool_calls", None) else None,
-                        }
-                    }
-                ]
-            }
+            return normalize_response(resp)
 
         return resp.choices[0].message.content or ""
+
+    async def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> AsyncChatStream:
+        msgs = to_sdk_messages(messages)
+        kwargs: Dict[str, Any] = {"model": model, "messages": msgs, "temperature": temperature, "stream": True}
+        if tools is not None:
+            kwargs["tools"] = tools
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        if tools is not None and parallel_tool_calls is not None:
+            kwargs["parallel_tool_calls"] = parallel_tool_calls
+
+        started_at, started = time.perf_counter(), time.monotonic()
+        chunks = await self.retry.acall(
+            lambda timeout: self._client.chat.completions.create(**kwargs, timeout=request_timeout(timeout))
+        )
+        chunks = astream_with_deadline(chunks, started=started, label="azure")
+        return AsyncChatStream(chunks, started_at=started_at, label="azure")
@@ -1,6 +1,7 @@
 from typing import Protocol, List, Tuple, Dict, Optional, Any
 
 from chat.chat_message import ChatMessage
+from chat.llm.streaming import AsyncChatStream, ChatStream
 
 class ChatClient(Protocol):
     def chat_completion(
@@ -11,7 +12,49 @@ class ChatClient(Protocol):
         temperature: float = 0.3,
         tools: Optional[List[Dict[str, Any]]] = None,
         tool_choice: Optional[str] = None,  # "auto" | {"type":"function","function":{"name":...}}
+        parallel_tool_calls: Optional[bool] = None,  # True → model được trả nhiều tool_calls trong 1 lượt
         return_raw: bool = False,           # True -> trả về dict gốc của SDK
     ) -> Any: ...                          # str (không tools) | dict (khi return_raw=True)
 
+    def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> ChatStream: ...                   # duyệt → content delta (str); .raw() sau khi hết stream
+
+
+class AsyncChatClient(Protocol):
+    """
+    Giống ChatClient nhưng await được (AsyncOpenAI / AsyncAzureOpenAI) → nhiều lời gọi chạy đồng thời trong 1 event loop.
+    HTTP pool gắn với event loop → tạo mới mỗi lượt và aclose() khi xong, không cache process-wide.
+    """
+
+    async def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+        return_raw: bool = False,
+    ) -> Any: ...
+
+    async def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> AsyncChatStream: ...              # async for → content delta; await .araw() sau khi hết stream
 
+    async def aclose(self) -> None: ...
@@ -0,0 +1,150 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from chat.llm.chat_client import AsyncChatClient, ChatClient
+from chat.llm.completion_cache import CachedAsyncChatClient, CachedChatClient, get_completion_store
+from chat.llm.transport import llm_endpoint_key
+from config.env import settings
+from config.logging import logger
+from utils.resource_cache import fingerprint, resource_cache
+
+CHAT_CLIENT_KIND = "chat_client"
+
+
+def chat_client_key(*, provider: str, api_key: str, api_base: str = "", api_version: str = "") -> Tuple[str, ...]:
+    """Key cache cho LLM client: llm_endpoint_key (cũng là key circuit breaker) + cấu hình router."""
+    key = llm_endpoint_key(provider=provider, api_key=api_key, api_base=api_base, api_version=api_version)
+    if settings.LLM_ROUTER_BACKENDS.strip():
+        key += ("router", fingerprint(settings.LLM_ROUTER_BACKENDS))
+    return key
+
+
+def _create_sdk_client(
+    *, provider: str, api_key: str, api_base: str = "", api_version: str = "", max_retries: Optional[int] = None
+) -> ChatClient:
+    if provider == "Azure OpenAI":
+        from chat.llm.azure_client import AzureOpenAIChatClient
+        return AzureOpenAIChatClient(
+            api_key=api_key, api_base=api_base, api_version=api_version, max_retries=max_retries
+        )
+    from chat.llm.openai_client import OpenAIChatClient
+    return OpenAIChatClient(api_key=api_key, max_retries=max_retries)
+
+
+def _router_backend_configs() -> List[Dict[str, Any]]:
+    """
+    Backend phụ của router từ settings.LLM_ROUTER_BACKENDS (JSON list), vd:
+    [{"name": "azure-eu", "provider": "Azure OpenAI", "api_base": "...", "model": "gpt-4o-mini-deploy"},
+     {"provider": "OpenAI", "model": "gpt-4o-mini"}]
+    api_key/api_base/api_version để trống → lấy theo settings của provider đó.
+    """
+    raw = settings.LLM_ROUTER_BACKENDS.strip()
+    if not raw:
+        return []
+    try:
+        configs = json.loads(raw)
+    except ValueError as e:
+        logger.warning(f"[llm-router] LLM_ROUTER_BACKENDS không phải JSON hợp lệ, bỏ qua router: {e}")
+        return []
+    if not isinstance(configs, list):
+        logger.warning("[llm-router] LLM_ROUTER_BACKENDS phải là JSON list, bỏ qua router")
+        return []
+    valid = [c for c in configs if isinstance(c, dict) and c.get("model")]
+    if len(valid) < len(configs):
+        logger.warning(f"[llm-router] Bỏ qua {len(configs) - len(valid)} backend thiếu 'model' trong LLM_ROUTER_BACKENDS")
+    return valid
+
+
+def _create_router(
+    configs: List[Dict[str, Any]], *, provider: str, api_key: str, api_base: str, api_version: str
+) -> ChatClient:
+    """Backend chính (chọn trên UI, model theo lời gọi) + các backend phụ cấu hình sẵn model/deployment."""
+    from chat.llm.router import RouteBackend, RoutingChatClient
+
+    # Mỗi backend có RetryPolicy riêng với ít retry → lỗi tạm thời thì router failover/hedge ngay
+    # thay vì chờ backoff trên backend đang chậm
+    retries = settings.LLM_ROUTER_BACKEND_RETRIES
+    primary = _create_sdk_client(
+        provider=provider, api_key=api_key, api_base=api_base, api_version=api_version, max_retries=retries
+    )
+    backends = [RouteBackend("azure:" + api_base if provider == "Azure OpenAI" else "openai", primary)]
+    for cfg in configs:
+        cfg_provider = cfg.get("provider", "OpenAI")
+        if cfg_provider == "Azure OpenAI":
+            cfg_base = cfg.get("api_base") or settings.AZURE_OPENAI_API_BASE
+            client = _create_sdk_client(
+                provider=cfg_provider,
+                api_key=cfg.get("api_key") or settings.AZURE_OPENAI_API_KEY,
+                api_base=cfg_base,
+                api_version=cfg.get("api_version") or settings.AZURE_OPENAI_API_VERSION,
+                max_retries=retries,
+            )
+            name = cfg.get("name") or f"azure:{cfg_base}/{cfg['model']}"
+        else:
+            client = _create_sdk_client(
+                provider=cfg_provider, api_key=cfg.get("api_key") or settings.OPENAI_API_KEY, max_retries=retries
+            )
+            name = cfg.get("name") or f"openai/{cfg['model']}"
+        backends.append(RouteBackend(name, client, cfg["model"]))
+
+    logger.info(f"[llm-router] Route qua {len(backends)} backend: {', '.join(b.name for b in backends)}")
+    return RoutingChatClient(
+        backends,
+        window=settings.LLM_ROUTER_WINDOW,
+        max_error_rate=settings.LLM_ROUTER_MAX_ERROR_RATE,
+        cooldown_s=settings.LLM_ROUTER_COOLDOWN_S,
+        hedge=settings.LLM_ROUTER_HEDGE,
+        hedge_min_delay_s=settings.LLM_ROUTER_HEDGE_MIN_DELAY_S,
+        hedge_min_samples=settings.LLM_ROUTER_HEDGE_MIN_SAMPLES,
+    )
+
+
+def get_chat_client(*, provider: str, api_key: str, api_base: str = "", api_version: str = "") -> ChatClient:
+    """Lấy LLM client từ cache process-wide, chỉ khởi tạo SDK client khi key thay đổi."""
+    key = chat_client_key(provider=provider, api_key=api_key, api_base=api_base, api_version=api_version)
+
+    def _create() -> ChatClient:
+        # Nhiều backend (LLM_ROUTER_BACKENDS) → router theo latency/lỗi, có thể hedge
+        configs = _router_backend_configs()
+        if configs:
+            client = _create_router(
+                configs, provider=provider, api_key=api_key, api_base=api_base, api_version=api_version
+            )
+        else:
+            client = _create_sdk_client(provider=provider, api_key=api_key, api_base=api_base, api_version=api_version)
+        # Cache completion tất định (temperature thấp: fix, tóm tắt) trước SDK client / router
+        store = get_completion_store()
+        if store is None:
+            return client
+        return CachedChatClient(client, store, max_temperature=settings.COMPLETION_CACHE_MAX_TEMPERATURE)
+
+    return resource_cache.get_or_create(CHAT_CLIENT_KIND, key, _create)
+
+
+def invalidate_chat_client(key: Tuple[str, ...]) -> None:
+    """Gỡ LLM client của cấu hình cũ (key theo chat_client_key) khi Settings đổi provider/endpoint/API key."""
+    resource_cache.invalidate(CHAT_CLIENT_KIND, key)
+
+
+def async_chat_enabled() -> bool:
+    """LLM_ASYNC_REPLY bật và không dùng router (router nhiều backend chỉ có bản sync)."""
+    return settings.LLM_ASYNC_REPLY and not _router_backend_configs()
+
+
+def create_async_chat_client(
+    *, provider: str, api_key: str, api_base: str = "", api_version: str = ""
+) -> AsyncChatClient:
+    """
+    Tạo async LLM client cho 1 lượt chat. Không cache process-wide vì HTTP pool của client async
+    gắn với event loop (st.write_stream chạy mỗi lượt trên 1 loop mới); caller aclose() khi xong.
+    """
+    if provider == "Azure OpenAI":
+        from chat.llm.azure_client import AsyncAzureOpenAIChatClient
+        client = AsyncAzureOpenAIChatClient(api_key=api_key, api_base=api_base, api_version=api_version)
+    else:
+        from chat.llm.openai_client import AsyncOpenAIChatClient
+        client = AsyncOpenAIChatClient(api_key=api_key)
+    store = get_completion_store()
+    if store is None:
+        return client
+    return CachedAsyncChatClient(client, store, max_temperature=settings.COMPLETION_CACHE_MAX_TEMPERATURE)
@@ -0,0 +1,391 @@
+# chat/llm/completion_cache.py
+import hashlib
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, func, update
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+
+from chat.chat_message import ChatMessage
+from chat.llm.chat_client import AsyncChatClient, ChatClient
+from chat.llm.response import to_sdk_messages
+from chat.llm.streaming import AsyncChatStream, ChatStream
+from config.env import settings
+from config.logging import logger
+from utils.resource_cache import resource_cache
+
+# Khi vượt max_bytes, xoá entry ít dùng nhất tới còn tỉ lệ này (tránh evict lại ngay ở lần ghi sau)
+_EVICT_TO_RATIO = 0.9
+# Tham số lời gọi không đổi nội dung trả về → không đưa vào key (return_raw đã thể hiện qua kind)
+_NON_SEMANTIC_KWARGS = frozenset({"return_raw"})
+
+
+def _normalize_content(text: Optional[str]) -> str:
+    """CRLF → LF, bỏ khoảng trắng cuối dòng và đầu/cuối nội dung (giữ indent vì code nhạy indent)."""
+    lines = (text or "").replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def completion_key(*, messages: List[ChatMessage], kind: str = "text", **kwargs: Any) -> str:
+    """
+    Key cache: hash messages đã chuẩn hoá + MỌI tham số còn lại của lời gọi (model, temperature, tools,
+    tool_choice, parallel_tool_calls…) trừ _NON_SEMANTIC_KWARGS và tham số None (không gửi lên API), + kiểu kết quả.
+    Thêm tham số mới cho ChatClient → tự vào key, không cần sửa hàm này.
+    """
+    msgs = to_sdk_messages(messages)
+    for m in msgs:
+        m["content"] = _normalize_content(m.get("content"))
+    params = {k: v for k, v in kwargs.items() if v is not None and k not in _NON_SEMANTIC_KWARGS}
+    if "temperature" in params:
+        params["temperature"] = round(float(params["temperature"]), 3)
+    payload = json.dumps(
+        {"messages": msgs, "params": params, "kind": kind},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionRecord(SQLModel, table=True):
+    __tablename__ = "completion_cache"
+
+    key: str = Field(primary_key=True)
+    model: str
+    value: str                                   # text, hoặc JSON của raw response (kind="raw")
+    size: int                                    # số byte của value (để giới hạn dung lượng)
+    created_at: float = Field(default_factory=time.time)
+    last_used_at: float = Field(default_factory=time.time, index=True)
+
+
+class CompletionStore:
+    """Lưu completion xuống SQLite, giới hạn tổng dung lượng, evict theo LRU (last_used_at)."""
+
+    def __init__(self, db_url: str, *, max_bytes: int):
+        self.engine = create_engine(db_url, connect_args={"check_same_thread": False})
+        SQLModel.metadata.create_all(self.engine, tables=[CompletionRecord.__table__])
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        with Session(self.engine) as session:
+            self._total = int(session.exec(select(func.coalesce(func.sum(CompletionRecord.size), 0))).one())
+
+    def get(self, key: str) -> Optional[str]:
+        with Session(self.engine) as session:
+            row = session.get(CompletionRecord, key)
+            if row is None:
+                return None
+            value = row.value
+            session.execute(
+                update(CompletionRecord).where(CompletionRecord.key == key).values(last_used_at=time.time())
+            )
+            session.commit()
+        return value
+
+    def put(self, key: str, model: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock, Session(self.engine) as session:
+            old = session.get(CompletionRecord, key)
+            self._total += size - (old.size if old is not None else 0)
+            session.merge(CompletionRecord(key=key, model=model, value=value, size=size))
+            session.commit()
+            if self._total > self.max_bytes:
+                self._evict(session)
+
+    def _evict(self, session: Session) -> None:
+        target = int(self.max_bytes * _EVICT_TO_RATIO)
+        victims: List[str] = []
+        for key, size in session.exec(
+            select(CompletionRecord.key, CompletionRecord.size).order_by(CompletionRecord.last_used_at)
+        ):
+            if self._total <= target:
+                break
+            victims.append(key)
+            self._total -= size
+        if victims:
+            session.execute(delete(CompletionRecord).where(CompletionRecord.key.in_(victims)))
+            session.commit()
+            logger.info(f"[llm-cache] Evict {len(victims)} entry (còn {self._total / 1e6:.1f} MB)")
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+
+def _replay_stream(text: str, *, label: str) -> ChatStream:
+    """ChatStream phát lại content đã cache (1 chunk) — caller dùng như stream thật."""
+    chunk = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(role="assistant", content=text, tool_calls=None))])
+    return ChatStream([chunk], started_at=time.perf_counter(), label=label)
+
+
+class _RecordingStream:
+    """Bọc ChatStream thật: stream kết thúc trọn vẹn, không có tool_calls → ghi content vào cache."""
+
+    def __init__(self, inner: ChatStream, on_complete):
+        self._inner = inner
+        self._on_complete = on_complete
+        self._consumed = False
+
+    def __iter__(self) -> Iterator[str]:
+        if self._consumed:
+            return
+        self._consumed = True
+        yield from self._inner
+        if not self._inner.tool_calls and self._inner.content:
+            self._on_complete(self._inner.content)
+
+    def finish(self) -> "_RecordingStream":
+        for _ in self:
+            pass
+        return self
+
+    def raw(self) -> Dict[str, Any]:
+        self.finish()
+        return self._inner.raw()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)   # content, tool_calls, ttft_ms, total_ms…
+
+
+async def _aiter_chunks(chunks: List[Any]) -> AsyncIterator[Any]:
+    for chunk in chunks:
+        yield chunk
+
+
+def _replay_astream(text: str, *, label: str) -> AsyncChatStream:
+    """Bản async của _replay_stream."""
+    chunk = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(role="assistant", content=text, tool_calls=None))])
+    return AsyncChatStream(_aiter_chunks([chunk]), started_at=time.perf_counter(), label=label)
+
+
+class _AsyncRecordingStream:
+    """Bản async của _RecordingStream."""
+
+    def __init__(self, inner: AsyncChatStream, on_complete):
+        self._inner = inner
+        self._on_complete = on_complete
+        self._consumed = False
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        if self._consumed:
+            return
+        self._consumed = True
+        async for delta in self._inner:
+            yield delta
+        if not self._inner.tool_calls and self._inner.content:
+            self._on_complete(self._inner.content)
+
+    async def afinish(self) -> "_AsyncRecordingStream":
+        async for _ in self:
+            pass
+        return self
+
+    async def araw(self) -> Dict[str, Any]:
+        await self.afinish()
+        return await self._inner.araw()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)   # content, tool_calls, aclose, ttft_ms…
+
+
+class _CacheStats:
+    """Đếm hit/miss; client dùng chung giữa các phiên/thread (_EXECUTOR, _TOOL_EXECUTOR) → cập nhật dưới lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+
+    def record(self, hit: bool, seconds: float) -> None:
+        with self._lock:
+            self.lookup_seconds += seconds
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self) -> Dict[str, float]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "lookup_seconds": round(self.lookup_seconds, 4)}
+
+
+class CachedChatClient(ChatClient):
+    """
+    Cache completion tất định trước ChatClient:
+    - Chỉ áp dụng khi temperature ≤ max_temperature (lời gọi fix/tóm tắt 0.1); chat thường (0.3) đi thẳng.
+    - Key = hash messages chuẩn hoá + mọi tham số lời gọi (xem completion_key).
+    - Stream: hit → phát lại content đã lưu; miss → ghi khi stream kết thúc trọn vẹn, không có tool_calls.
+    Lỗi đọc/ghi cache chỉ log, không ảnh hưởng lời gọi thật.
+    """
+
+    def __init__(self, inner: ChatClient, store: CompletionStore, *, max_temperature: float = 0.2, label: str = "llm"):
+        self.inner = inner
+        self.store = store
+        self.max_temperature = max_temperature
+        self.label = label
+        self.stats = _CacheStats()
+
+    def close(self) -> None:
+        close = getattr(self.inner, "close", None)
+        if callable(close):
+            close()
+
+    def _cacheable(self, temperature: float) -> bool:
+        return temperature is not None and temperature <= self.max_temperature
+
+    def _lookup(self, key: str, model: str) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            value = self.store.get(key)
+        except Exception as e:
+            logger.warning(f"[llm-cache] Lỗi đọc cache: {e}")
+            value = None
+        elapsed = time.perf_counter() - started
+        self.stats.record(value is not None, elapsed)
+        if value is None:
+            return None
+        logger.info(f"[llm-cache] Hit {model} ({elapsed * 1000:.1f}ms, {len(value)} ký tự) — bỏ qua lời gọi LLM")
+        return value
+
+    def _store(self, key: str, model: str, value: str) -> None:
+        try:
+            self.store.put(key, model, value)
+        except Exception as e:
+            logger.warning(f"[llm-cache] Lỗi ghi cache: {e}")
+
+    def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+        return_raw: bool = False,
+    ) -> Any:
+        call = dict(
+            model=model, messages=messages, temperature=temperature, tools=tools,
+            tool_choice=tool_choice, parallel_tool_calls=parallel_tool_calls, return_raw=return_raw,
+        )
+        if not self._cacheable(temperature):
+            return self.inner.chat_completion(**call)
+
+        key = completion_key(kind="raw" if return_raw else "text", **call)
+        cached = self._lookup(key, model)
+        if cached is not None:
+            return json.loads(cached) if return_raw else cached
+
+        result = self.inner.chat_completion(**call)
+        if result:
+            self._store(key, model, json.dumps(result, ensure_ascii=False) if return_raw else result)
+        return result
+
+    def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> ChatStream:
+        call = dict(
+            model=model, messages=messages, temperature=temperature, tools=tools,
+            tool_choice=tool_choice, parallel_tool_calls=parallel_tool_calls,
+        )
+        if not self._cacheable(temperature):
+            return self.inner.chat_completion_stream(**call)
+
+        # Cùng key với chat_completion dạng text → bản stream và bản thường dùng chung kết quả
+        key = completion_key(**call)
+        cached = self._lookup(key, model)
+        if cached is not None:
+            return _replay_stream(cached, label=f"{self.label}-cache")
+        return _RecordingStream(
+            self.inner.chat_completion_stream(**call), lambda text: self._store(key, model, text)
+        )
+
+
+class CachedAsyncChatClient(AsyncChatClient):
+    """
+    Bản async của CachedChatClient: cùng CompletionStore, key và stats (lookup/ghi SQLite local đủ nhanh
+    để chạy thẳng trong event loop).
+    """
+
+    def __init__(self, inner: AsyncChatClient, store: CompletionStore, *, max_temperature: float = 0.2, label: str = "llm"):
+        self.inner = inner
+        self._sync = CachedChatClient(inner, store, max_temperature=max_temperature, label=label)  # lookup/store/stats
+        self.stats = self._sync.stats
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+    async def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+        return_raw: bool = False,
+    ) -> Any:
+        call = dict(
+            model=model, messages=messages, temperature=temperature, tools=tools,
+            tool_choice=tool_choice, parallel_tool_calls=parallel_tool_calls, return_raw=return_raw,
+        )
+        if not self._sync._cacheable(temperature):
+            return await self.inner.chat_completion(**call)
+
+        key = completion_key(kind="raw" if return_raw else "text", **call)
+        cached = self._sync._lookup(key, model)
+        if cached is not None:
+            return json.loads(cached) if return_raw else cached
+
+        result = await self.inner.chat_completion(**call)
+        if result:
+            self._sync._store(key, model, json.dumps(result, ensure_ascii=False) if return_raw else result)
+        return result
+
+    async def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> AsyncChatStream:
+        call = dict(
+            model=model, messages=messages, temperature=temperature, tools=tools,
+            tool_choice=tool_choice, parallel_tool_calls=parallel_tool_calls,
+        )
+        if not self._sync._cacheable(temperature):
+            return await self.inner.chat_completion_stream(**call)
+
+        key = completion_key(**call)
+        cached = self._sync._lookup(key, model)
+        if cached is not None:
+            return _replay_astream(cached, label=f"{self._sync.label}-cache")
+        return _AsyncRecordingStream(
+            await self.inner.chat_completion_stream(**call), lambda text: self._sync._store(key, model, text)
+        )
+
+
+def get_completion_store() -> Optional[CompletionStore]:
+    """Store dùng chung process-wide theo settings.COMPLETION_CACHE_DB_URL; để trống → tắt cache."""
+    db_url = (settings.COMPLETION_CACHE_DB_URL or "").strip()
+    if not db_url:
+        return None
+    max_bytes = int(settings.COMPLETION_CACHE_MAX_MB * 1024 * 1024)
+    return resource_cache.get_or_create(
+        "completion_store", db_url, lambda: CompletionStore(db_url, max_bytes=max_bytes)
+    )
@@ -0,0 +1,256 @@
+# chat/llm/fake_client.py
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from chat.chat_message import ChatMessage
+from chat.intent_router import classify_intent
+from chat.llm.chat_client import AsyncChatClient, ChatClient
+from chat.llm.streaming import AsyncChatStream, ChatStream
+from utils.tokens import count_tokens_tiktoken, get_encoding
+
+_CODE_BLOCK = re.compile(r"```[^\n]*\n(.*?)\n```", re.DOTALL)
+_LANGUAGE_LINE = re.compile(r"^Ngôn ngữ: *(\S+)", re.MULTILINE)
+_ANSWER_WORDS = (
+    "Theo đoạn code hiện tại, hàm xử lý dữ liệu đầu vào rồi trả kết quả; nên tách phần kiểm tra tham số, "
+    "đặt tên biến rõ nghĩa, xử lý ngoại lệ cụ thể và thêm test cho các nhánh biên."
+).split()
+_CHUNK_TOKENS = 4   # số token ước lượng mỗi chunk stream
+
+
+class LatencyProfile(NamedTuple):
+    """Mô phỏng provider: chờ ttft_s + prompt/prefill_tokens_per_s rồi sinh token với tokens_per_s (0 = tức thì)."""
+    ttft_s: float = 0.0
+    prefill_tokens_per_s: float = 0.0
+    tokens_per_s: float = 0.0
+    jitter: float = 0.0          # ± tỉ lệ ngẫu nhiên áp lên mọi khoảng chờ (seed cố định → tất định)
+    answer_tokens: int = 120     # độ dài câu trả lời dạng text
+
+
+LATENCY_PROFILES: Dict[str, LatencyProfile] = {
+    "instant": LatencyProfile(),
+    "fast": LatencyProfile(ttft_s=0.15, prefill_tokens_per_s=20000, tokens_per_s=150, jitter=0.1),
+    "azure": LatencyProfile(ttft_s=0.5, prefill_tokens_per_s=8000, tokens_per_s=60, jitter=0.25),
+    "slow": LatencyProfile(ttft_s=1.5, prefill_tokens_per_s=3000, tokens_per_s=25, jitter=0.4),
+}
+
+
+class FakeCall(NamedTuple):
+    kind: str                # "tools" | "fix" | "patch" | "text"
+    stream: bool
+    prompt_tokens: int
+    completion_tokens: int
+    seconds: float
+
+
+class FakeChatClient(ChatClient):
+    """
+    ChatClient giả, chạy offline và tất định (không network) để benchmark ChatConversation:
+    - Có tools: message cuối là kết quả tool hoặc tool_choice="none" → trả lời text; còn lại gọi run_fix / search_rule theo
+      classify_intent của câu hỏi (cùng luật với router local), không rõ → trả lời text.
+    - Prompt fix dạng patch → 1 khối SEARCH/REPLACE hợp lệ; prompt fix cả file/chunk → trả lại nguyên code block.
+    - Thời gian chờ theo LatencyProfile; mọi lời gọi được ghi vào .calls (token gửi/nhận, thời gian).
+    """
+
+    def __init__(self, profile: LatencyProfile = LatencyProfile(), *, seed: int = 0, sleep=time.sleep):
+        self.profile = profile
+        self.calls: List[FakeCall] = []
+        self._sleep = sleep
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = []
+
+    # ---------- Nội dung trả về ----------
+    def _respond(
+        self, messages: List[ChatMessage], tools: Optional[List[Dict[str, Any]]], tool_choice: Optional[str] = None
+    ) -> Dict[str, Any]:
+        system = (messages[0].content or "") if messages else ""
+        user = next((m.content or "" for m in reversed(messages) if m.role == "user"), "")
+        if tools:
+            if tool_choice == "none" or (messages and messages[-1].role == "tool"):
+                return {"kind": "tools", "content": self._answer()}
+            intent = classify_intent(user).intent
+            if intent == "run_fix":
+                return {"kind": "tools", "content": "", "tool": ("run_fix", {"fix_instructions": [user]})}
+            if intent == "search_rule":
+                match = _LANGUAGE_LINE.search(system)
+                language = match.group(1) if match else "python"
+                return {"kind": "tools", "content": "", "tool": ("search_rule", {"query": user, "language": language})}
+            return {"kind": "tools", "content": self._answer()}
+
+        code = _CODE_BLOCK.findall(user)
+        if "SEARCH" in system and code:
+            line = next((l for l in code[-1].splitlines() if l.strip()), "")
+            return {"kind": "patch", "content": f"<<<<<<< SEARCH\n{line}\n=======\n{line}\n>>>>>>> REPLACE"}
+        if "CHỈ MỘT code block" in system and code:
+            return {"kind": "fix", "content": f"```\n{code[-1]}\n```"}
+        return {"kind": "text", "content": self._answer()}
+
+    def _answer(self) -> str:
+        words = [_ANSWER_WORDS[i % len(_ANSWER_WORDS)] for i in range(self.profile.answer_tokens * 3 // 4)]
+        return " ".join(words)
+
+    # ---------- Độ trễ ----------
+    def _jittered(self, seconds: float) -> float:
+        if seconds <= 0 or self.profile.jitter <= 0:
+            return max(0.0, seconds)
+        with self._lock:
+            factor = 1 + self._rng.uniform(-self.profile.jitter, self.profile.jitter)
+        return seconds * factor
+
+    def _prefill_seconds(self, prompt_tokens: int) -> float:
+        p = self.profile
+        prefill = prompt_tokens / p.prefill_tokens_per_s if p.prefill_tokens_per_s > 0 else 0.0
+        return self._jittered(p.ttft_s + prefill)
+
+    def _decode_seconds(self, tokens: int) -> float:
+        return self._jittered(tokens / self.profile.tokens_per_s) if self.profile.tokens_per_s > 0 else 0.0
+
+    def _record(self, kind: str, stream: bool, prompt_tokens: int, completion: str, seconds: float, model: str) -> None:
+        call = FakeCall(kind, stream, prompt_tokens, len(get_encoding(model).encode(completion)), seconds)
+        with self._lock:
+            self.calls.append(call)
+
+    # ---------- ChatClient ----------
+    def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+        return_raw: bool = False,
+    ) -> Any:
+        started = time.perf_counter()
+        prompt_tokens = count_tokens_tiktoken(messages, model)
+        reply = self._respond(messages, tools, tool_choice)
+        content = reply["content"]
+        self._sleep(self._prefill_seconds(prompt_tokens) + self._decode_seconds(_approx_tokens(content)))
+        self._record(reply["kind"], False, prompt_tokens, content, time.perf_counter() - started, model)
+        return _result(reply, return_raw)
+
+    def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> ChatStream:
+        started = time.perf_counter()
+        prompt_tokens = count_tokens_tiktoken(messages, model)
+        reply = self._respond(messages, tools, tool_choice)
+        return ChatStream(self._chunks(reply, prompt_tokens, started, model), started_at=started, label="fake")
+
+    def _timed_chunks(self, reply: Dict[str, Any], prompt_tokens: int) -> Iterator[Tuple[float, Any]]:
+        """(thời gian chờ trước chunk, chunk) — dùng chung cho stream sync và async."""
+        content = reply["content"]
+        prefill = self._prefill_seconds(prompt_tokens)
+        tool = reply.get("tool")
+        if tool:
+            call = _tool_call(0, *tool)
+            yield prefill, _chunk(tool_calls=[SimpleNamespace(
+                index=0, id=call["id"], type="function",
+                function=SimpleNamespace(name=call["function"]["name"], arguments=call["function"]["arguments"]),
+            )])
+            prefill = 0.0
+        step = _CHUNK_TOKENS * 4   # ~4 ký tự/token
+        for start in range(0, len(content), step):
+            yield prefill + self._decode_seconds(_CHUNK_TOKENS), _chunk(content=content[start:start + step])
+            prefill = 0.0
+
+    def _chunks(self, reply: Dict[str, Any], prompt_tokens: int, started: float, model: str) -> Iterator[Any]:
+        for delay, chunk in self._timed_chunks(reply, prompt_tokens):
+            self._sleep(delay)
+            yield chunk
+        self._record(reply["kind"], True, prompt_tokens, reply["content"], time.perf_counter() - started, model)
+
+
+class FakeAsyncChatClient(FakeChatClient, AsyncChatClient):
+    """
+    Bản async của FakeChatClient (cùng nội dung trả về và LatencyProfile), chờ bằng asyncio.sleep
+    → các lời gọi đồng thời trong 1 event loop chồng thời gian chờ lên nhau như provider thật.
+    """
+
+    def __init__(self, profile: LatencyProfile = LatencyProfile(), *, seed: int = 0):
+        super().__init__(profile, seed=seed)
+
+    async def aclose(self) -> None:
+        """Không giữ tài nguyên."""
+
+    async def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+        return_raw: bool = False,
+    ) -> Any:
+        started = time.perf_counter()
+        prompt_tokens = count_tokens_tiktoken(messages, model)
+        reply = self._respond(messages, tools, tool_choice)
+        content = reply["content"]
+        await asyncio.sleep(self._prefill_seconds(prompt_tokens) + self._decode_seconds(_approx_tokens(content)))
+        self._record(reply["kind"], False, prompt_tokens, content, time.perf_counter() - started, model)
+        return _result(reply, return_raw)
+
+    async def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> AsyncChatStream:
+        started = time.perf_counter()
+        prompt_tokens = count_tokens_tiktoken(messages, model)
+        reply = self._respond(messages, tools, tool_choice)
+        return AsyncChatStream(self._achunks(reply, prompt_tokens, started, model), started_at=started, label="fake")
+
+    async def _achunks(self, reply: Dict[str, Any], prompt_tokens: int, started: float, model: str) -> AsyncIterator[Any]:
+        for delay, chunk in self._timed_chunks(reply, prompt_tokens):
+            await asyncio.sleep(delay)
+            yield chunk
+        self._record(reply["kind"], True, prompt_tokens, reply["content"], time.perf_counter() - started, model)
+
+
+def _result(reply: Dict[str, Any], return_raw: bool) -> Any:
+    if not return_raw:
+        return reply["content"]
+    tool = reply.get("tool")
+    tool_calls = [_tool_call(0, *tool)] if tool else None
+    return {"choices": [{"message": {"role": "assistant", "content": reply["content"], "tool_calls": tool_calls}}]}
+
+
+def _approx_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def _tool_call(index: int, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": f"call_fake_{index}",
+        "type": "function",
+        "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)},
+    }
+
+
+def _chunk(*, content: Optional[str] = None, tool_calls: Optional[List[Any]] = None) -> Any:
+    delta = SimpleNamespace(role="assistant", content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
@@ -1,16 +1,36 @@
 # infra/llm/openai_client.py
+import time
 from typing import List, Optional, Dict, Any
 from chat.chat_message import ChatMessage
-from chat.llm.chat_client import ChatClient
+from chat.llm.chat_client import AsyncChatClient, ChatClient
+from chat.llm.response import normalize_response, to_sdk_messages
+from chat.llm.streaming import AsyncChatStream, ChatStream
+from chat.llm.transport import (
+    astream_with_deadline,
+    create_async_http_client,
+    get_http_client,
+    llm_endpoint_key,
+    llm_retry_policy,
+    request_timeout,
+    sdk_client_options,
+    stream_with_deadline,
+)
 
 class OpenAIChatClient(ChatClient):
     """
     Dành cho OpenAI chuẩn (api.openai.com).
     Yêu cầu: pip install openai>=1.40
     """
-    def __init__(self, *, api_key: str):
+    def __init__(self, *, api_key: str, max_retries: Optional[int] = None):
         from openai import OpenAI
-        self.client = OpenAI(api_key=api_key)
+        # HTTP pool dùng chung process-wide; retry/timeout/circuit breaker do RetryPolicy riêng của client đảm nhận
+        self.client = OpenAI(api_key=api_key, http_client=get_http_client(), **sdk_client_options())
+        self.retry = llm_retry_policy(
+            llm_endpoint_key(provider="OpenAI", api_key=api_key), label="openai", max_retries=max_retries
+        )
+
+    def close(self) -> None:
+        """HTTP pool dùng chung (transport.get_http_client) → không đóng khi client bị gỡ khỏi cache."""
 
     def chat_completion(
         self,
@@ -20,39 +40,121 @@ class OpenAIChatClient(ChatClient):
         temperature: float = 0.3,
         tools: Optional[List[Dict[str, Any]]] = None,
         tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
         return_raw: bool = False,
     ) -> Any:
-        msgs = [{"role": m.role, "content": m.content} for m in messages]
+        msgs = to_sdk_messages(messages)
         kwargs: Dict[str, Any] = {"model": model, "messages": msgs, "temperature": temperature}
         if tools is not None:
             kwargs["tools"] = tools
         if tool_choice is not None:
             kwargs["tool_choice"] = tool_choice  # "auto" | {"type":"function","function":{"name":...}}
+        if tools is not None and parallel_tool_calls is not None:
+            kwargs["parallel_tool_calls"] = parallel_tool_calls
 
-        resp = self.client.chat.completions.create(**kwargs)
+        resp = self.retry.call(
+            lambda timeout: self.client.chat.completions.create(**kwargs, timeout=request_timeout(timeout))
+        )
 
         if return_raw:
-            # Chuẩn hoá về dict đơn giản để service xử lý tool_calls
-            return {
-                "choices": [
-                    {
-                        "message": {
-                            "role": getattr(resp.choices[0].message, "role", "assistant"),
-                            "content": resp.choices[0].message.content,
-                            "tool_calls": [
-                                {
-                                    "id": tc.id,
-                                    "type": tc.type,
-                                    "function": {
-                                        "name": tc.function.name,
-                                        "arguments": tc.function.arguments,
-                                    },
-                                }
-                                for tc in (resp.choices[0].message.tool_calls or [])
-                            ] if getattr(resp.choices[0].message, "tool_calls", None) else None,
-                        }
-                    }
-                ]
-            }
+            return normalize_response(resp)
 
         return resp.choices[0].message.content or ""
+
+    def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> ChatStream:
+        msgs = to_sdk_messages(messages)
+        kwargs: Dict[str, Any] = {"model": model, "messages": msgs, "temperature": temperature, "stream": True}
+        if tools is not None:
+            kwargs["tools"] = tools
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        if tools is not None and parallel_tool_calls is not None:
+            kwargs["parallel_tool_calls"] = parallel_tool_calls
+
+        started_at, started = time.perf_counter(), time.monotonic()
+        chunks = self.retry.call(
+            lambda timeout: self.client.chat.completions.create(**kwargs, timeout=request_timeout(timeout))
+        )
+        # Deadline tổng (LLM_CALL_DEADLINE_S) áp cả lúc đọc stream, không chỉ tới lúc nhận header
+        chunks = stream_with_deadline(chunks, started=started, label="openai")
+        return ChatStream(chunks, started_at=started_at, label="openai")
+
+
+class AsyncOpenAIChatClient(AsyncChatClient):
+    """
+    Bản async của OpenAIChatClient (AsyncOpenAI): nhiều lời gọi chạy đồng thời trong cùng event loop.
+    HTTP pool gắn với event loop → tạo mới mỗi lượt chat, aclose() khi xong; breaker dùng chung với client sync.
+    """
+    def __init__(self, *, api_key: str, max_retries: Optional[int] = None):
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=api_key, http_client=create_async_http_client(), **sdk_client_options())
+        self.retry = llm_retry_policy(
+            llm_endpoint_key(provider="OpenAI", api_key=api_key), label="openai", max_retries=max_retries
+        )
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+    async def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+        return_raw: bool = False,
+    ) -> Any:
+        msgs = to_sdk_messages(messages)
+        kwargs: Dict[str, Any] = {"model": model, "messages": msgs, "temperature": temperature}
+        if tools is not None:
+            kwargs["tools"] = tools
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        if tools is not None and parallel_tool_calls is not None:
+            kwargs["parallel_tool_calls"] = parallel_tool_calls
+
+        resp = await self.retry.acall(
+            lambda timeout: self.client.chat.completions.create(**kwargs, timeout=request_timeout(timeout))
+        )
+
+        if return_raw:
+            return normalize_response(resp)
+
+        return resp.choices[0].message.content or ""
+
+    async def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> AsyncChatStream:
+        msgs = to_sdk_messages(messages)
+        kwargs: Dict[str, Any] = {"model": model, "messages": msgs, "temperature": temperature, "stream": True}
+        if tools is not None:
+            kwargs["tools"] = tools
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        if tools is not None and parallel_tool_calls is not None:
+            kwargs["parallel_tool_calls"] = parallel_tool_calls
+
+        started_at, started = time.perf_counter(), time.monotonic()
+        chunks = await self.retry.acall(
+            lambda timeout: self.client.chat.completions.create(**kwargs, timeout=request_timeout(timeout))
+        )
+        chunks = astream_with_deadline(chunks, started=started, label="openai")
+        return AsyncChatStream(chunks, started_at=started_at, label="openai")
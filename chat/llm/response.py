@@ -0,0 +1,40 @@
+from typing import Any, Dict, List
+
+
+def to_sdk_messages(messages: List[Any]) -> List[Dict[str, Any]]:
+    """ChatMessage → dict message theo format Chat Completions (kèm tool_calls / tool_call_id nếu có)."""
+    out: List[Dict[str, Any]] = []
+    for m in messages:
+        msg: Dict[str, Any] = {"role": m.role, "content": m.content}
+        if getattr(m, "tool_calls", None):
+            msg["tool_calls"] = m.tool_calls
+        if getattr(m, "tool_call_id", None):
+            msg["tool_call_id"] = m.tool_call_id
+        out.append(msg)
+    return out
+
+
+def normalize_response(resp: Any) -> Dict[str, Any]:
+    """Chuẩn hoá response của SDK về dict đơn giản để service xử lý tool_calls (format return_raw=True)."""
+    message = resp.choices[0].message
+    return {
+        "choices": [
+            {
+                "message": {
+                    "role": getattr(message, "role", "assistant"),
+                    "content": message.content,
+                    "tool_calls": [
+                        {
+                            "id": tc.id,
+                            "type": tc.type,
+                            "function": {
+                                "name": tc.function.name,
+                                "arguments": tc.function.arguments,
+                            },
+                        }
+                        for tc in (message.tool_calls or [])
+                    ] if getattr(message, "tool_calls", None) else None,
+                }
+            }
+        ]
+    }
@@ -0,0 +1,234 @@
+# chat/llm/router.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, TypeVar
+
+from chat.chat_message import ChatMessage
+from chat.llm.chat_client import ChatClient
+from chat.llm.streaming import ChatStream
+from config.logging import logger
+
+T = TypeVar("T")
+
+# Pool riêng cho request hedge: chỉ chạy lời gọi tới backend (không submit lồng) → không deadlock
+_HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+
+class RouteBackend(NamedTuple):
+    name: str
+    client: ChatClient
+    model: Optional[str] = None   # None → dùng model caller truyền vào (backend chính chọn trên UI)
+
+
+class BackendStats:
+    """
+    Thống kê cuốn chiếu của 1 backend trong window lời gọi gần nhất:
+    latency theo loại lời gọi ("complete": cả response, "stream": tới khi mở được stream) và tỉ lệ lỗi.
+    """
+
+    def __init__(self, window: int):
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._window = max(1, window)
+        self._outcomes: Deque[bool] = deque(maxlen=self._window)
+        self.last_failure_at: Optional[float] = None
+
+    def record(self, kind: str, latency: Optional[float]) -> None:
+        """latency None → lời gọi lỗi."""
+        with self._lock:
+            self._outcomes.append(latency is not None)
+            if latency is None:
+                self.last_failure_at = time.monotonic()
+            else:
+                self._latencies.setdefault(kind, deque(maxlen=self._window)).append(latency)
+
+    def samples(self, kind: str) -> int:
+        with self._lock:
+            return len(self._latencies.get(kind, ()))
+
+    def percentile(self, kind: str, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._latencies.get(kind, ()))
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+
+class RoutingChatClient(ChatClient):
+    """
+    ChatClient gộp nhiều backend (vd: nhiều deployment Azure + OpenAI), cùng protocol nên ChatConversation không đổi.
+    - Mỗi lời gọi đi tới backend khoẻ có latency p50 thấp nhất (backend chưa có số liệu được thử trước để đo).
+    - Backend có tỉ lệ lỗi > max_error_rate bị xếp cuối trong cooldown_s giây kể từ lỗi gần nhất.
+    - Lỗi → failover sang backend kế tiếp theo thứ hạng.
+    - hedge=True: sau độ trễ = p95 của backend đầu (≥ hedge_min_delay_s) mà chưa xong → gửi thêm 1 request
+      tới backend thứ 2, lấy kết quả về trước (stream thua bị đóng). Đổi lại tốn thêm token ở các lượt bị hedge.
+    """
+
+    def __init__(
+        self,
+        backends: List[RouteBackend],
+        *,
+        window: int = 50,
+        max_error_rate: float = 0.5,
+        cooldown_s: float = 30,
+        hedge: bool = False,
+        hedge_min_delay_s: float = 1.0,
+        hedge_min_samples: int = 10,
+    ):
+        if not backends:
+            raise ValueError("RoutingChatClient cần ít nhất 1 backend")
+        self.backends = list(backends)
+        self.stats = {b.name: BackendStats(window) for b in self.backends}
+        self.max_error_rate = max_error_rate
+        self.cooldown_s = cooldown_s
+        self.hedge = hedge
+        self.hedge_min_delay_s = hedge_min_delay_s
+        self.hedge_min_samples = hedge_min_samples
+
+    def close(self) -> None:
+        for b in self.backends:
+            close = getattr(b.client, "close", None)
+            if callable(close):
+                close()
+
+    # ---------- Xếp hạng ----------
+    def _healthy(self, b: RouteBackend) -> bool:
+        stats = self.stats[b.name]
+        if stats.error_rate <= self.max_error_rate or stats.last_failure_at is None:
+            return True
+        return time.monotonic() - stats.last_failure_at >= self.cooldown_s   # hết cooldown → cho thử lại
+
+    def ranked(self, kind: str) -> List[RouteBackend]:
+        """Backend khoẻ theo p50 tăng dần (chưa có số liệu = 0), rồi tới backend đang lỗi; hoà → giữ thứ tự cấu hình."""
+        def score(b: RouteBackend) -> float:
+            p50 = self.stats[b.name].percentile(kind, 0.5) or 0.0
+            return p50 * (1 + self.stats[b.name].error_rate)
+        healthy = [b for b in self.backends if self._healthy(b)]
+        unhealthy = [b for b in self.backends if not self._healthy(b)]
+        return sorted(healthy, key=score) + unhealthy
+
+    def _hedge_delay(self, b: RouteBackend, kind: str) -> Optional[float]:
+        stats = self.stats[b.name]
+        if stats.samples(kind) < self.hedge_min_samples:
+            return None   # chưa đủ mẫu để p95 có nghĩa
+        return max(self.hedge_min_delay_s, stats.percentile(kind, 0.95) or 0.0)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Số liệu từng backend (log/benchmark)."""
+        return {
+            name: {
+                "p50_complete": s.percentile("complete", 0.5),
+                "p95_complete": s.percentile("complete", 0.95),
+                "p50_stream": s.percentile("stream", 0.5),
+                "p95_stream": s.percentile("stream", 0.95),
+                "error_rate": round(s.error_rate, 3),
+            }
+            for name, s in self.stats.items()
+        }
+
+    # ---------- Gọi ----------
+    def _timed(self, b: RouteBackend, kind: str, call: Callable[[RouteBackend], T]) -> T:
+        started = time.perf_counter()
+        try:
+            result = call(b)
+        except Exception:
+            self.stats[b.name].record(kind, None)
+            raise
+        self.stats[b.name].record(kind, time.perf_counter() - started)
+        return result
+
+    def _failover(
+        self, backends: List[RouteBackend], kind: str, call: Callable[[RouteBackend], T],
+        last_exc: Optional[BaseException] = None,
+    ) -> T:
+        for b in backends:
+            try:
+                return self._timed(b, kind, call)
+            except Exception as e:
+                logger.warning(f"[llm-router] {b.name} lỗi ({type(e).__name__}: {e}) → thử backend kế tiếp")
+                last_exc = e
+        raise last_exc
+
+    def _hedged(self, order: List[RouteBackend], kind: str, call: Callable[[RouteBackend], T], delay: float) -> T:
+        primary = _HEDGE_EXECUTOR.submit(self._timed, order[0], kind, call)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            if primary.exception() is None:
+                return primary.result()
+            logger.warning(f"[llm-router] {order[0].name} lỗi ({primary.exception()}) → thử backend kế tiếp")
+            return self._failover(order[1:], kind, call, primary.exception())
+
+        logger.info(f"[llm-router] {order[0].name} chưa xong sau {delay:.2f}s → hedge sang {order[1].name}")
+        pending = {primary, _HEDGE_EXECUTOR.submit(self._timed, order[1], kind, call)}
+        last_exc: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = order[0] if future is primary else order[1]
+                    logger.info(f"[llm-router] Hedge: {winner.name} trả về trước")
+                    for loser in pending:
+                        loser.add_done_callback(_discard_result)
+                    return future.result()
+                last_exc = future.exception()
+        return self._failover(order[2:], kind, call, last_exc)
+
+    def _route(self, kind: str, call: Callable[[RouteBackend], T]) -> T:
+        order = self.ranked(kind)
+        delay = self._hedge_delay(order[0], kind) if self.hedge and len(order) > 1 else None
+        if delay is None:
+            return self._failover(order, kind, call)
+        return self._hedged(order, kind, call, delay)
+
+    def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+        return_raw: bool = False,
+    ) -> Any:
+        return self._route("complete", lambda b: b.client.chat_completion(
+            model=b.model or model, messages=messages, temperature=temperature, tools=tools,
+            tool_choice=tool_choice, parallel_tool_calls=parallel_tool_calls, return_raw=return_raw,
+        ))
+
+    def chat_completion_stream(
+        self,
+        *,
+        model: str,
+        messages: List[ChatMessage],
+        temperature: float = 0.3,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> ChatStream:
+        # Route/hedge phần mở stream (chờ response header); lỗi giữa chừng stream không failover
+        return self._route("stream", lambda b: b.client.chat_completion_stream(
+            model=b.model or model, messages=messages, temperature=temperature, tools=tools,
+            tool_choice=tool_choice, parallel_tool_calls=parallel_tool_calls,
+        ))
+
+
+def _discard_result(future: Future) -> None:
+    """Request hedge thua: đóng stream (nếu có) để trả kết nối về pool."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"[llm-router] Lỗi khi đóng stream thua: {e}")
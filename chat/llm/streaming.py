@@ -0,0 +1,171 @@
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from config.logging import logger
+
+
+class _StreamAccumulator:
+    """
+    Phần chung của ChatStream / AsyncChatStream: ghép content + tool_calls từ chunk stream của OpenAI SDK,
+    đo time-to-first-token (ttft_ms) và tổng thời gian (total_ms).
+    """
+
+    def __init__(self, *, started_at: float, label: str = "llm"):
+        self._started_at = started_at
+        self._label = label
+        self._role = "assistant"
+        self._content_parts: List[str] = []
+        self._tool_calls: Dict[int, Dict[str, Any]] = {}
+        self._consumed = False
+        self.ttft_ms: Optional[float] = None
+        self.total_ms: Optional[float] = None
+
+    def _consume_chunk(self, chunk: Any) -> Optional[str]:
+        """Ghép 1 chunk; trả về đoạn content mới (None nếu chunk không có content)."""
+        choices = getattr(chunk, "choices", None) or []
+        if not choices:
+            # Azure gửi chunk prompt_filter_results không có choices
+            return None
+        delta = getattr(choices[0], "delta", None)
+        if delta is None:
+            return None
+        if getattr(delta, "role", None):
+            self._role = delta.role
+        for tc in getattr(delta, "tool_calls", None) or []:
+            self._mark_first_token()
+            self._merge_tool_call(tc)
+        text = getattr(delta, "content", None)
+        if not text:
+            return None
+        self._mark_first_token()
+        self._content_parts.append(text)
+        return text
+
+    def _log_done(self) -> None:
+        self.total_ms = (time.perf_counter() - self._started_at) * 1000
+        ttft = f"{self.ttft_ms:.0f}ms" if self.ttft_ms is not None else "n/a"
+        logger.info(f"[{self._label}] Stream xong: ttft={ttft}, total={self.total_ms:.0f}ms")
+
+    @property
+    def content(self) -> str:
+        return "".join(self._content_parts)
+
+    @property
+    def tool_calls(self) -> List[Dict[str, Any]]:
+        return [self._tool_calls[i] for i in sorted(self._tool_calls)]
+
+    def _raw(self) -> Dict[str, Any]:
+        tool_calls = self.tool_calls
+        return {
+            "choices": [
+                {
+                    "message": {
+                        "role": self._role,
+                        "content": self.content,
+                        "tool_calls": tool_calls or None,
+                    }
+                }
+            ]
+        }
+
+    def _mark_first_token(self) -> None:
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self._started_at) * 1000
+
+    def _merge_tool_call(self, tc: Any) -> None:
+        # Delta đầu mang id/name, các delta sau chỉ nối thêm arguments
+        idx = getattr(tc, "index", None)
+        if idx is None:
+            idx = len(self._tool_calls)
+        entry = self._tool_calls.setdefault(
+            idx, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}}
+        )
+        if getattr(tc, "id", None):
+            entry["id"] = tc.id
+        if getattr(tc, "type", None):
+            entry["type"] = tc.type
+        fn = getattr(tc, "function", None)
+        if fn is not None:
+            if getattr(fn, "name", None):
+                entry["function"]["name"] += fn.name
+            if getattr(fn, "arguments", None):
+                entry["function"]["arguments"] += fn.arguments
+
+
+class ChatStream(_StreamAccumulator):
+    """
+    Bọc stream chunk của OpenAI SDK (stream=True).
+    - Duyệt (for delta in stream) → nhận từng đoạn content (str) ngay khi model sinh ra.
+    - tool_calls được ghép dần từ các delta theo index.
+    - Sau khi duyệt hết: .content, .tool_calls, .raw() (cùng format return_raw=True).
+    - Đo time-to-first-token (ttft_ms) và tổng thời gian (total_ms), log khi stream kết thúc.
+    """
+
+    def __init__(self, chunks: Iterable[Any], *, started_at: float, label: str = "llm"):
+        super().__init__(started_at=started_at, label=label)
+        self._chunks = chunks
+
+    def __iter__(self) -> Iterator[str]:
+        if self._consumed:
+            return
+        self._consumed = True
+        try:
+            for chunk in self._chunks:
+                text = self._consume_chunk(chunk)
+                if text:
+                    yield text
+        finally:
+            self._log_done()
+
+    def finish(self) -> "ChatStream":
+        """Đọc nốt phần còn lại của stream (khi caller không cần từng delta)."""
+        for _ in self:
+            pass
+        return self
+
+    def close(self) -> None:
+        """Đóng stream chưa đọc (vd: request hedge bị bỏ) để trả kết nối HTTP về pool."""
+        close = getattr(self._chunks, "close", None)
+        if callable(close):
+            close()
+
+    def raw(self) -> Dict[str, Any]:
+        self.finish()
+        return self._raw()
+
+
+class AsyncChatStream(_StreamAccumulator):
+    """
+    Bản async của ChatStream (AsyncOpenAI / AsyncAzureOpenAI): async for delta in stream,
+    sau khi hết stream: await .araw(). Bỏ dở → await .aclose() để trả kết nối HTTP về pool.
+    """
+
+    def __init__(self, chunks: AsyncIterable[Any], *, started_at: float, label: str = "llm"):
+        super().__init__(started_at=started_at, label=label)
+        self._chunks = chunks
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        if self._consumed:
+            return
+        self._consumed = True
+        try:
+            async for chunk in self._chunks:
+                text = self._consume_chunk(chunk)
+                if text:
+                    yield text
+        finally:
+            self._log_done()
+
+    async def afinish(self) -> "AsyncChatStream":
+        async for _ in self:
+            pass
+        return self
+
+    async def aclose(self) -> None:
+        aclose = getattr(self._chunks, "aclose", None)
+        if callable(aclose):
+            await aclose()
+
+    async def araw(self) -> Dict[str, Any]:
+        await self.afinish()
+        return self._raw()
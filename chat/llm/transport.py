@@ -0,0 +1,137 @@
+# chat/llm/transport.py
+import inspect
+import threading
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Hashable, Iterable, Iterator, Optional, Tuple
+
+import httpx
+
+from config.env import settings
+from utils.resource_cache import fingerprint, resource_cache
+from utils.retry import CircuitBreaker, RetryPolicy
+
+HTTP_CLIENT_KIND = "llm_http_client"
+
+
+# ---------- HTTP pool dùng chung ----------
+def _timeout() -> "httpx.Timeout":
+    return httpx.Timeout(settings.LLM_TIMEOUT_S, connect=settings.LLM_CONNECT_TIMEOUT_S)
+
+
+def _limits() -> "httpx.Limits":
+    return httpx.Limits(
+        max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.LLM_POOL_KEEPALIVE_S,
+    )
+
+
+def get_http_client() -> "httpx.Client":
+    """
+    httpx.Client dùng chung process-wide cho mọi SDK client (OpenAI/Azure, mọi API key)
+    → keep-alive được tái sử dụng qua các lần rerun và giữa các phiên.
+    """
+    key = (
+        settings.LLM_TIMEOUT_S, settings.LLM_CONNECT_TIMEOUT_S,
+        settings.LLM_POOL_MAX_CONNECTIONS, settings.LLM_POOL_MAX_KEEPALIVE, settings.LLM_POOL_KEEPALIVE_S,
+    )
+    return resource_cache.get_or_create(
+        HTTP_CLIENT_KIND, key, lambda: httpx.Client(timeout=_timeout(), limits=_limits())
+    )
+
+
+def create_async_http_client() -> "httpx.AsyncClient":
+    """
+    httpx.AsyncClient cho client async: pool gắn với event loop tạo ra nó (st.write_stream tạo loop mới mỗi lượt)
+    → không cache process-wide, mỗi client async tự tạo và tự đóng (aclose) trong loop của lượt đó.
+    """
+    return httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+
+
+def request_timeout(seconds: float) -> "httpx.Timeout":
+    """
+    Timeout truyền vào từng lời gọi SDK (timeout=...): float sẽ thay cả httpx.Timeout của client → connect cũng
+    thành `seconds`. Giữ connect theo LLM_CONNECT_TIMEOUT_S (không vượt phần deadline còn lại).
+    """
+    return httpx.Timeout(seconds, connect=min(settings.LLM_CONNECT_TIMEOUT_S, seconds))
+
+
+def stream_with_deadline(chunks: Iterable[Any], *, started: float, label: str) -> Iterator[Any]:
+    """
+    Đọc stream trong LLM_CALL_DEADLINE_S tính từ `started` (time.monotonic() trước lần thử đầu).
+    RetryPolicy chỉ chặn tới lúc nhận header; phần đọc body được kiểm tra giữa các chunk ở đây. Mỗi lần chờ chunk
+    vẫn bị read timeout của lần thử chặn (≤ deadline còn lại lúc gửi) → stream treo dừng muộn nhất sau khoảng đó.
+    Hết deadline → đóng stream (trả kết nối về pool) và raise TimeoutError.
+    """
+    deadline = started + settings.LLM_CALL_DEADLINE_S
+    try:
+        for chunk in chunks:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"[llm] {label}: stream vượt deadline {settings.LLM_CALL_DEADLINE_S:.0f}s")
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if callable(close):
+            close()
+
+
+async def astream_with_deadline(chunks: AsyncIterable[Any], *, started: float, label: str) -> AsyncIterator[Any]:
+    """Bản async của stream_with_deadline (AsyncStream của SDK: close() là coroutine)."""
+    deadline = started + settings.LLM_CALL_DEADLINE_S
+    try:
+        async for chunk in chunks:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"[llm] {label}: stream vượt deadline {settings.LLM_CALL_DEADLINE_S:.0f}s")
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if callable(close):
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+
+def sdk_client_options() -> Dict[str, Any]:
+    """Tham số chung cho OpenAI/AzureOpenAI: tắt retry của SDK (RetryPolicy lo), timeout theo settings."""
+    return {"max_retries": 0, "timeout": _timeout()}
+
+
+# ---------- Circuit breaker / retry theo endpoint ----------
+_breakers: Dict[Hashable, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def llm_endpoint_key(*, provider: str, api_key: str, api_base: str = "", api_version: str = "") -> Tuple[str, ...]:
+    """provider + endpoint + version + fingerprint API key: key của circuit breaker và của cache LLM client."""
+    if provider == "Azure OpenAI":
+        return ("azure", api_base, api_version, fingerprint(api_key))
+    return ("openai", fingerprint(api_key))
+
+
+def get_circuit_breaker(key: Hashable, label: str) -> CircuitBreaker:
+    """
+    1 breaker cho mỗi endpoint theo llm_endpoint_key (dùng chung giữa các lần tạo lại client):
+    2 API key / deployment khác nhau không làm mở mạch của nhau. label chỉ để log.
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker(
+                label,
+                failure_threshold=settings.LLM_CIRCUIT_FAILURES,
+                reset_timeout=settings.LLM_CIRCUIT_RESET_S,
+            )
+        return breaker
+
+
+def llm_retry_policy(key: Hashable, *, label: str, max_retries: Optional[int] = None) -> RetryPolicy:
+    """RetryPolicy mới theo settings LLM_* (max_retries None → LLM_MAX_RETRIES) với breaker dùng chung của key."""
+    return RetryPolicy(
+        label=f"[llm] {label}",
+        breaker=get_circuit_breaker(key, label),
+        max_retries=settings.LLM_MAX_RETRIES if max_retries is None else max_retries,
+        deadline_s=settings.LLM_CALL_DEADLINE_S,
+        attempt_timeout_s=settings.LLM_TIMEOUT_S,
+        backoff_base_s=settings.LLM_BACKOFF_BASE_S,
+        backoff_max_s=settings.LLM_BACKOFF_MAX_S,
+    )
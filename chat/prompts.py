@@ -19,6 +19,54 @@ def build_fix_prompt(*, language: str, base_code: str, fix_instructions: str) ->
 
 
 
+def build_patch_fix_prompt(*, language: str, base_code: str, fix_instructions: str) -> Dict[str, str]:
+    """
+    Prompt fix dạng patch: model chỉ trả về các khối SEARCH/REPLACE cho phần cần đổi
+    thay vì viết lại cả file (ít token output hơn nhiều với sửa nhỏ).
+    """
+    system = (
+        "Bạn là trợ lý chỉnh sửa code. KHÔNG viết lại cả file. "
+        "Chỉ trả về các khối thay đổi theo đúng định dạng sau (có thể nhiều khối, theo thứ tự từ trên xuống):\n"
+        "<<<<<<< SEARCH\n"
+        "(các dòng nguyên văn trong code hiện tại, đủ ngữ cảnh để là duy nhất)\n"
+        "=======\n"
+        "(các dòng thay thế)\n"
+        ">>>>>>> REPLACE\n"
+        "Phần SEARCH phải chép CHÍNH XÁC từ code hiện tại (kể cả indentation), ngắn gọn nhất có thể. "
+        "KHÔNG viết thêm văn bản, giải thích hay code block nào khác. "
+        "Nếu không cần sửa gì, chỉ trả về đúng chuỗi NO_CHANGES."
+    )
+    user = (
+        f"Ngôn ngữ: {language}\n"
+        f"Yêu cầu fix :\n{fix_instructions}\n"
+        f"Code hiện tại:\n```\n{base_code}\n```"
+    )
+    return {"system": system, "user": user}
+
+
+def build_chunk_fix_prompt(
+    *, language: str, chunk_code: str, chunk_label: str, outline: str, fix_instructions: str
+) -> Dict[str, str]:
+    """
+    Prompt fix 1 đoạn (chunk) của file lớn: model chỉ thấy dàn ý file + đoạn cần sửa,
+    trả về đúng đoạn đó đã sửa để ghép lại vào vị trí cũ.
+    """
+    system = (
+        "Bạn là trợ lý chỉnh sửa code. Bạn chỉ nhận MỘT ĐOẠN của một file lớn. "
+        "Hãy áp dụng yêu cầu fix cho riêng đoạn này và trả về CHỈ MỘT code block duy nhất nằm giữa cặp ``` ... ``` "
+        "chứa toàn bộ đoạn đã sửa (giữ nguyên indentation, không thêm code của phần khác trong file). "
+        "KHÔNG viết thêm văn bản trước hoặc sau code block. "
+        "Nếu đoạn này không cần sửa, hãy trả về nguyên văn đoạn code trong một code block."
+    )
+    user = (
+        f"Ngôn ngữ: {language}\n"
+        f"Yêu cầu fix :\n{fix_instructions}\n"
+        f"Dàn ý file (chỉ để tham khảo):\n{outline}\n"
+        f"Đoạn cần sửa ({chunk_label}):\n```\n{chunk_code}\n```"
+    )
+    return {"system": system, "user": user}
+
+
 def build_summary_prompt(*, language: str, base_code: str, fixed_code: str) -> Dict[str, str]:
     system = (
         "Bạn là reviewer giàu kinh nghiệm. Hãy so sánh hai phiên bản code và "
@@ -32,19 +80,45 @@ def build_summary_prompt(*, language: str, base_code: str, fixed_code: str) -> D
     )
     return {"system": system, "user": user}
 
-
-def build_system_context(*, origin_code: str, latest_fixed: str, language: str) -> str:
+def build_planned_changes_prompt(*, language: str, base_code: str, fix_instructions: str) -> Dict[str, str]:
     """
-    Trả về system context an toàn, bao gồm source gốc và (nếu có) bản fix gần nhất.
+    Prompt tóm tắt "dự kiến" (speculative) chạy song song với lời gọi fix:
+    chỉ dựa trên code hiện tại + yêu cầu fix, không cần chờ bản đã sửa.
     """
     system = (
+        "Bạn là reviewer giàu kinh nghiệm. Dựa trên code hiện tại và yêu cầu sửa, hãy "
+        "liệt kê ngắn gọn các thay đổi sẽ được áp dụng, bằng tiếng Việt, dùng gạch đầu dòng '- '. "
+        "KHÔNG chèn code block, KHÔNG dài dòng."
+    )
+    user = (
+        f"Ngôn ngữ: {language}\n"
+        f"Yêu cầu fix :\n{fix_instructions}\n"
+        f"Code hiện tại:\n```\n{base_code}\n```"
+    )
+    return {"system": system, "user": user}
+
+
+def build_system_instructions() -> str:
+    """ Phần hướng dẫn cố định của system context (không gồm code). """
+    return (
         "Bạn là trợ lý hỗ trợ về code (review, giải thích, sửa lỗi, cải tiến). Trả lời ngắn gọn, rõ ràng, bằng tiếng Việt.\n"
         "- Khi người dùng hỏi hoặc yêu cầu review/giải thích code (ví dụ: 'giải thích đoạn code', 'đánh giá code này'): trả lời trực tiếp, KHÔNG dùng tool.\n"
         "- Khi người dùng yêu cầu sửa/refactor/điều chỉnh code (ví dụ: 'hãy sửa lỗi', 'refactor giúp tôi'): hãy gọi function `run_fix` với tham số `fix_instructions`.\n"
         "- Khi người dùng hỏi về quy tắc, chuẩn code, best practice, đặt tên biến/hàm, coding convention: hãy gọi function `search_rule` với tham số `query` và `language`.\n"
+        "- Yêu cầu gồm nhiều ý (vd. vừa sửa code vừa hỏi quy tắc đặt tên): gọi đủ các tool cần thiết trong CÙNG một lượt.\n"
+        "- Kết quả tool (message role tool) đã được hiển thị nguyên văn cho người dùng: KHÔNG lặp lại, chỉ bổ sung ngắn gọn phần còn thiếu (hoặc không nói gì thêm).\n"
         "- Tuyệt đối KHÔNG tự ý sửa code nếu không có yêu cầu rõ ràng từ người dùng.\n"
         "- Nếu người dùng đề cập vấn đề ngoài phạm vi lập trình/code: trả về câu fallback ngắn rằng bạn chỉ hỗ trợ về code, sau đó mời họ đặt câu hỏi liên quan đến code.\n"
+    )
 
+
+def build_system_context(*, origin_code: str, latest_fixed: str, language: str) -> str:
+    """
+    Trả về system context an toàn, bao gồm source gốc và (nếu có) bản fix gần nhất.
+    Bản đầy đủ cả 2 phiên bản; chat dùng bản gọn hơn ở chat.context_builder.
+    """
+    system = (
+        build_system_instructions() +
         f"Source gốc người dùng nhập vào:\n```\n{origin_code}\n```\n"
         f"Ngôn ngữ: {language}\n"
     )
@@ -52,15 +126,40 @@ def build_system_context(*, origin_code: str, latest_fixed: str, language: str)
         system += f"Phiên bản code đã fix gần nhất:\n```\n{latest_fixed}\n```\n"
     return system
 
-def build_rule_answer_prompt(*, question: str, rule_snippets: list[dict]) -> dict:
+def build_history_summary_prompt(
+    *, previous_summary: str, transcript: str, max_chars: int
+) -> Dict[str, str]:
     """
-    Tạo prompt để LLM trả lời câu hỏi dựa trên RULES + QUESTION (ngữ cảnh).
+    Prompt cập nhật tóm tắt hội thoại cuốn chiếu: chỉ gửi tóm tắt cũ + các lượt mới bị đẩy ra khỏi cửa sổ chat,
+    model trả về bản tóm tắt mới (không tóm tắt lại từ đầu).
     """
-    bullets = "\n".join(
+    system = (
+        "Bạn duy trì bản tóm tắt ngắn của một cuộc trò chuyện về code. "
+        "Hãy gộp các lượt mới vào bản tóm tắt hiện có, bằng tiếng Việt, dùng gạch đầu dòng '- '. "
+        "Giữ lại: yêu cầu/quyết định của người dùng, các thay đổi code đã thực hiện, tên hàm/biến quan trọng, "
+        "vấn đề còn bỏ ngỏ. Bỏ lời chào, giải thích dài và code block. "
+        f"Bản tóm tắt mới KHÔNG dài quá {max_chars} ký tự; chỉ trả về bản tóm tắt."
+    )
+    user = (
+        f"Tóm tắt hiện có:\n{previous_summary.strip() or '(chưa có)'}\n\n"
+        f"Các lượt mới cần gộp vào:\n{transcript}"
+    )
+    return {"system": system, "user": user}
+
+def format_rule_snippets(rule_snippets: list[dict], limit: int = 4) -> str:
+    """ Các snippet rule dạng '- tóm tắt (source: ...)'; dùng chung cho prompt trả lời và kết quả tool search_rule. """
+    return "\n".join(
         f"- {s.get('summary','').strip()} (source: {s.get('source_path','unknown')})"
-        for s in (rule_snippets or [])[:4]
+        for s in (rule_snippets or [])[:limit]
     )
 
+
+def build_rule_answer_prompt(*, question: str, rule_snippets: list[dict]) -> dict:
+    """
+    Tạo prompt để LLM trả lời câu hỏi dựa trên RULES + QUESTION (ngữ cảnh).
+    """
+    bullets = format_rule_snippets(rule_snippets)
+
     system_prompt = (
         "Bạn là code reviewer/assistant. Trả lời NGẮN GỌN, CHÍNH XÁC dựa trên RULES cung cấp. "
         "Nếu có mâu thuẫn giữa các RULES, hãy nêu rõ và chọn phương án hợp lý. "
@@ -75,3 +174,17 @@ def build_rule_answer_prompt(*, question: str, rule_snippets: list[dict]) -> dic
         "- Nếu RULES không đủ, nói rõ giới hạn thay vì suy đoán."
     )
     return {"system": system_prompt, "user": user_prompt}
+
+
+def build_rule_tool_result(*, language: str, rule_snippets: list[dict]) -> str:
+    """
+    Kết quả tool search_rule gửi lại model (message role "tool"): model dùng các rule này để viết câu trả lời
+    ở lời gọi kế tiếp, thay vì tốn thêm 1 lời gọi LLM riêng chỉ để tóm tắt rule.
+    """
+    bullets = format_rule_snippets(rule_snippets)
+    if not bullets:
+        return f"Không tìm thấy rule phù hợp ({language}). Hãy nói rõ cho người dùng, không tự bịa rule."
+    return (
+        f"RULES ({language}):\n{bullets}\n"
+        "Trả lời người dùng CHỈ dựa trên các rule trên, kèm citation (source); rule không đủ thì nói rõ giới hạn."
+    )
@@ -32,6 +32,11 @@ TOOLS = [
                         "type": "string",
                         "description": "Câu hỏi hoặc từ khóa về rule/best-practice."
                     },
+                    "queries": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Tuỳ chọn: nhiều chủ đề cần tìm cùng lúc (vd: đặt tên biến, xử lý exception)."
+                    },
                     "language": {
                         "type": "string",
                         "description": "Ngôn ngữ lập trình dùng để lọc rule (ví dụ: python, javascript)."
@@ -16,4 +16,31 @@ LANGUAGE_OPTIONS = [
     "yaml", "text"
 ]
 OPENAI_MODELS = ["gpt-4o-mini", "gpt-4.1-mini", "o4-mini"]
-PROVIDER_OPTIONS = ["OpenAI", "Azure OpenAI"]
\ No newline at end of file
+PROVIDER_OPTIONS = ["OpenAI", "Azure OpenAI"]
+
+# Context window (token) theo model — dùng để tính budget prompt thay vì hard-code 8000.
+# Key so khớp theo prefix (lowercase) để nhận cả tên deployment Azure như "GPT-4o-mini";
+# prefix chỉ khớp khi hết tên hoặc ngay sau là "-"/":" → "gpt-4.5-preview" không bị nhận thành "gpt-4".
+# Biến thể có context khác model gốc (o1-mini, gpt-4-1106...) phải có key riêng.
+MODEL_CONTEXT_TOKENS: Dict[str, int] = {
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+    "gpt-4.1": 1047576,
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4-1106": 128000,
+    "gpt-4-0125": 128000,
+    "gpt-4.5": 128000,
+    "gpt-4-32k": 32768,
+    "gpt-4": 8192,
+    "gpt-35-turbo": 16385,
+    "gpt-3.5-turbo": 16385,
+    "o4-mini": 200000,
+    "o3-mini": 200000,
+    "o3": 200000,
+    "o1-mini": 128000,
+    "o1-preview": 128000,
+    "o1": 200000,
+}
+DEFAULT_PROMPT_TOKEN_BUDGET = 8000
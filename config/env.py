@@ -22,12 +22,106 @@ class Settings(BaseSettings):
     AZURE_OPENAI_EMBEDDING_VERSION: str = "2024-07-01-preview"
 
     PINECONE_API_KEY: str = ""
-    
+
+    # --- Rule retriever ---
+    RULE_RETRIEVER_BACKEND: str = "pinecone"  # hoặc "chroma" (local, không cần Pinecone/OpenAI)
+    CHROMA_PERSIST_DIR: str = "tmp/chroma"
+    # Thư mục chứa model ONNX all-MiniLM-L6-v2 đã giải nén (<dir>/onnx/model.onnx...).
+    # Để trống → Chroma tự tải model (~80MB) về ~/.cache/chroma lần đầu (cần network)
+    CHROMA_EMBEDDING_MODEL_DIR: str = ""
+    # Manifest các chunk đã ingest (re-ingest chỉ embed/upsert chunk mới hoặc đã đổi)
+    INGEST_MANIFEST_DB_URL: str = "sqlite:///tmp/ingest_manifest.db"
+
+    # --- Embedding cache (LRU RAM + SQLite); để trống DB URL → chỉ cache trong RAM ---
+    EMBEDDING_CACHE_DB_URL: str = "sqlite:///tmp/embedding_cache.db"
+    EMBEDDING_CACHE_LRU_SIZE: int = 4096
+
+    # --- Cache completion LLM tất định (fix, tóm tắt) trên SQLite, LRU theo dung lượng; để trống DB URL → tắt ---
+    COMPLETION_CACHE_DB_URL: str = "sqlite:///tmp/completion_cache.db"
+    COMPLETION_CACHE_MAX_MB: float = 64
+    COMPLETION_CACHE_MAX_TEMPERATURE: float = 0.2   # chỉ cache lời gọi có temperature ≤ ngưỡng này
+
+    # --- Cache câu trả lời search_rule; RULE_ANSWER_SIMILARITY = 0 → chỉ khớp chính xác ---
+    RULE_ANSWER_CACHE_TTL_S: float = 3600
+    RULE_ANSWER_CACHE_MAX_ENTRIES: int = 256
+    RULE_ANSWER_SIMILARITY: float = 0
+
+    # --- Session store: "memory" (st.session_state) | "sqlite" (lưu phiên + lịch sử chat, nạp theo trang) ---
+    SESSION_STORE_BACKEND: str = "memory"
+    SESSION_DB_URL: str = "sqlite:///tmp/sessions.db"
+    SESSION_HISTORY_PAGE_SIZE: int = 50
+    SESSION_MAX_IN_MEMORY_MESSAGES: int = 200
+
+    # --- HTTP tới LLM provider: pool dùng chung, timeout, retry/backoff (429/5xx, theo Retry-After), circuit breaker ---
+    LLM_TIMEOUT_S: float = 60              # timeout đọc mỗi lần thử
+    LLM_CONNECT_TIMEOUT_S: float = 5
+    LLM_CALL_DEADLINE_S: float = 120       # tổng thời gian 1 lời gọi, kể cả các lần retry
+    LLM_MAX_RETRIES: int = 3
+    LLM_BACKOFF_BASE_S: float = 0.5
+    LLM_BACKOFF_MAX_S: float = 20
+    LLM_POOL_MAX_CONNECTIONS: int = 20
+    LLM_POOL_MAX_KEEPALIVE: int = 10
+    LLM_POOL_KEEPALIVE_S: float = 60
+    LLM_CIRCUIT_FAILURES: int = 5          # số lỗi tạm thời liên tiếp để mở mạch
+    LLM_CIRCUIT_RESET_S: float = 30        # mạch mở bao lâu trước khi cho 1 lời gọi thử
+    # Lượt chat chạy trên asyncio (AsyncOpenAI/AsyncAzureOpenAI): fix, tóm tắt, các nhóm tool chạy đồng thời
+    # trong 1 event loop. Router nhiều backend (LLM_ROUTER_BACKENDS) chỉ có bản sync → tự dùng đường sync.
+    LLM_ASYNC_REPLY: bool = True
+
+    # --- Router nhiều backend: backend chọn trên UI + LLM_ROUTER_BACKENDS (JSON list, xem client_factory) ---
+    # Mỗi lời gọi đi tới backend khoẻ có latency p50 thấp nhất trong window, lỗi → failover sang backend kế.
+    LLM_ROUTER_BACKENDS: str = ""          # rỗng → chỉ dùng provider chọn trên UI (không route)
+    LLM_ROUTER_WINDOW: int = 50            # số lời gọi gần nhất dùng để tính latency/tỉ lệ lỗi
+    LLM_ROUTER_MAX_ERROR_RATE: float = 0.5
+    LLM_ROUTER_COOLDOWN_S: float = 30      # backend lỗi nhiều bị xếp cuối trong ngần này giây
+    LLM_ROUTER_BACKEND_RETRIES: int = 0    # retry trên từng backend khi route (0 → failover ngay)
+    # Hedge: chưa xong sau p95 của backend đầu → gửi thêm tới backend thứ 2, lấy kết quả về trước (tốn thêm token)
+    LLM_ROUTER_HEDGE: bool = False
+    LLM_ROUTER_HEDGE_MIN_DELAY_S: float = 1.0
+    LLM_ROUTER_HEDGE_MIN_SAMPLES: int = 10
 
     # --- Common model parameters ---
     MAX_TOKENS: int = 2048
     TEMPERATURE: float = 0
     TOP_P: float = 1.0
+
+    # --- Fix flow ---
+    # Cách tóm tắt thay đổi sau run_fix: "local" (từ diff, không gọi LLM) |
+    # "speculative" (LLM chạy song song với lời gọi fix) | "llm" (LLM sau khi fix, stream ra UI)
+    FIX_SUMMARY_MODE: str = "local"
+    # Output của lời gọi fix cả file: "patch" (khối SEARCH/REPLACE, áp local; lỗi → xin cả file) | "full"
+    FIX_OUTPUT_MODE: str = "patch"
+    # Fix theo chunk cho file lớn: chỉ gửi các hàm/class liên quan tới yêu cầu, fix song song rồi ghép lại.
+    # File ít hơn FIX_CHUNKED_MIN_LINES dòng (hoặc 0 = tắt) → fix cả file như cũ.
+    FIX_CHUNKED_MIN_LINES: int = 300
+    FIX_CHUNK_MAX_LINES: int = 120
+    FIX_CHUNK_MAX_FRACTION: float = 0.5   # vùng liên quan chiếm nhiều hơn tỉ lệ này → fix cả file
+    FIX_CHUNK_WORKERS: int = 4
+
+    # --- Tool loop ---
+    # Số lời gọi model tối đa mỗi lượt chat (tối thiểu 2); lời gọi cuối không được gọi tool.
+    # Kết quả search_rule được gửi lại model để viết câu trả lời; vòng chỉ có run_fix → hết lượt luôn.
+    TOOL_MAX_ITERATIONS: int = 2
+    PARALLEL_TOOL_CALLS: bool = True   # cho phép model trả nhiều tool_calls trong 1 lượt
+    # Router intent local (regex): yêu cầu rõ ràng (sửa code / hỏi rule) chạy thẳng run_fix/search_rule,
+    # bỏ qua lời gọi LLM định tuyến; độ tin cậy dưới ngưỡng → để model quyết định như cũ.
+    INTENT_ROUTER_ENABLED: bool = True
+    INTENT_ROUTER_MIN_CONFIDENCE: float = 0.6
+    INTENT_ROUTER_MIN_SCORE: int = 2       # điểm từ khoá tối thiểu của intent thắng (1 từ khoá yếu = 1)
+
+    # --- Chat context ---
+    # System context gửi bản code mới nhất đầy đủ + diff so với bản gốc (thay vì cả 2 bản).
+    # Code vượt CONTEXT_FULL_CODE_MAX_TOKENS → dàn ý (import/class/chữ ký hàm) + các đoạn câu hỏi nhắc tới.
+    CONTEXT_FULL_CODE_MAX_TOKENS: int = 6000
+    CONTEXT_DIFF_MAX_TOKENS: int = 2000
+    # Lịch sử chat: gửi nguyên văn tối đa HISTORY_MAX_MESSAGES message chưa tóm tắt (trong ngân sách token); lượt nào
+    # phải bỏ message cũ (vượt ngân sách token hoặc số message) → (chạy nền sau khi trả lời) gộp phần cũ vào bản tóm
+    # tắt cuốn chiếu, chỉ giữ nguyên văn HISTORY_KEEP_RECENT_MESSAGES message cuối.
+    HISTORY_MAX_MESSAGES: int = 10
+    HISTORY_KEEP_RECENT_MESSAGES: int = 6
+    HISTORY_SUMMARY_ENABLED: bool = True
+    HISTORY_SUMMARY_MODEL: str = ""        # rỗng → dùng model đang chat (nên đặt model rẻ, vd. gpt-4o-mini)
+    HISTORY_SUMMARY_MAX_CHARS: int = 2000
     
     class Config:
         env_file = ".env"
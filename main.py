@@ -3,14 +3,27 @@ from pathlib import Path
 from typing import Dict, List
 import streamlit as st
 
-from chat.llm.azure_client import AzureOpenAIChatClient
-from chat.llm.openai_client import OpenAIChatClient
+from chat.llm.client_factory import (
+    async_chat_enabled,
+    chat_client_key,
+    create_async_chat_client,
+    get_chat_client,
+    invalidate_chat_client,
+)
 from config.constant import APP_TITLE, EXT_MAP, LANGUAGE_OPTIONS, OPENAI_MODELS, PROVIDER_OPTIONS
 from config.env import settings
-from stores.session_state_store import SessionState, SessionStateStore
-from utils.code_diff import make_github_like_unified_html
+from stores.factory import create_session_store
+from stores.session_state_store import SessionState
+from utils.code_diff import (
+    DIFF_LAYOUTS,
+    INTRALINE_MODES,
+    diff_page_count,
+    make_github_like_unified_html,
+    make_side_by_side_html,
+)
 from utils.language import guess_lang_from_code
 from chat.chat_conversasion import ChatConversation
+from chat.history_summary import apply_history_summary
 from config.logging import logger
 
 # ============== Page & header ==============
@@ -44,26 +57,42 @@ with st.sidebar:
                 value=settings.AZURE_OPENAI_DEPLOYMENT,
             )
         with st.expander("ℹ️ Notes"):
-            st.markdown("- App **không lưu** API key hay source code; mọi thứ ở trong **phiên làm việc hiện tại**.")
+            if (settings.SESSION_STORE_BACKEND or "memory").strip().lower() == "sqlite":
+                st.markdown("- App **không lưu** API key; source code và lịch sử chat được lưu local theo phiên (`?sid=` trên URL).")
+            else:
+                st.markdown("- App **không lưu** API key hay source code; mọi thứ ở trong **phiên làm việc hiện tại**.")
 
 # ============== Khởi tạo LLM client & Chat ==============
+# Client được cache process-wide theo (provider, endpoint, fingerprint key) → rerun không tạo lại SDK client;
+# Settings đổi cấu hình → gỡ client của key cũ (close() chỉ nhả tài nguyên riêng, HTTP pool dùng chung giữ nguyên)
 if provider == "Azure OpenAI":
-    client = AzureOpenAIChatClient(
+    client_kwargs = dict(
+        provider=provider,
         api_key=api_key or settings.AZURE_OPENAI_API_KEY,
         api_base=azure_api_base or settings.AZURE_OPENAI_API_BASE,
         api_version=azure_api_version or settings.AZURE_OPENAI_API_VERSION,
     )
 else:
-    client = OpenAIChatClient(api_key=api_key or settings.OPENAI_API_KEY)
+    client_kwargs = dict(provider=provider, api_key=api_key or settings.OPENAI_API_KEY)
+
+_CLIENT_KEY = "_llm_client_key"
+client_key = chat_client_key(**client_kwargs)
+previous_client_key = st.session_state.get(_CLIENT_KEY)
+if previous_client_key is not None and previous_client_key != client_key:
+    invalidate_chat_client(previous_client_key)
+st.session_state[_CLIENT_KEY] = client_key   # chỉ chứa fingerprint, không giữ API key gốc
+client = get_chat_client(**client_kwargs)
+
+# Lượt chat chạy async (LLM_ASYNC_REPLY): client async tạo mới mỗi lượt trong event loop của st.write_stream
+async_client_factory = (lambda: create_async_chat_client(**client_kwargs)) if async_chat_enabled() else None
 
 # ============== Khởi tạo Store & ChatBot ==============
-store = SessionStateStore()
-chatbot = ChatConversation(client=client, state_store=store)
+store = create_session_store()
+chatbot = ChatConversation(client=client, state_store=store, async_client_factory=async_client_factory)
 state: SessionState = store.get()
 
-# set model in state
-state.model = model  
-store.set(state)
+# set model in state (chỉ dirty khi model đổi; store ghi 1 lần trước phần chat)
+state.model = model
 
 # ============== Panel (code) ==============
 # ---------- Container khung input + diff ----------
@@ -80,9 +109,8 @@ with st.container(border=True):
     # Cập nhật state khi user nhập
     if code_text != (state.origin_code or ""):
         state.fixed_code = ""           # reset khi đổi code gốc
-        state.chat_messages = []        # reset chat theo logic bạn đang dùng
+        state.clear_chat()              # reset chat (kèm tóm tắt lịch sử) theo logic bạn đang dùng
         state.origin_code = code_text
-        store.set(state)
 
     # Auto detect ngôn ngữ (không có options UI)
     stripped = (state.origin_code or "").strip()
@@ -90,7 +118,6 @@ with st.container(border=True):
         detected_lang = guess_lang_from_code(stripped)
         if detected_lang and detected_lang != state.language:
             state.language = detected_lang
-            store.set(state)
         if detected_lang:
             st.success(f"🔍 Đã phát hiện ngôn ngữ: **{detected_lang}**")
         else:
@@ -111,7 +138,7 @@ with st.container(border=True):
         if st.button("🧹 Clear", use_container_width=True):
             state.origin_code = ""
             state.fixed_code = ""
-            state.chat_messages = []
+            state.clear_chat()
             store.set(state)
             st.rerun()
 
@@ -123,12 +150,27 @@ with st.container(border=True):
 
         with st.expander("ℹ️ Diff"):
             filename = "snippet" + EXT_MAP.get(state.language or "text", ".txt")
-            diff_html = make_github_like_unified_html(
+            # Diff lớn render theo trang; diff + HTML được memo nên rerun không tính lại
+            pages = diff_page_count(state.origin_code, state.fixed_code, n=3)
+            col_layout, col_hl = st.columns([1, 1])
+            with col_layout:
+                layout = st.radio("Kiểu hiển thị", DIFF_LAYOUTS, horizontal=True,
+                                  format_func={"unified": "Unified", "split": "Side-by-side"}.get)
+            with col_hl:
+                intraline = st.radio("Highlight trong dòng", INTRALINE_MODES, horizontal=True,
+                                     format_func={"word": "Từ", "char": "Ký tự", "none": "Tắt"}.get)
+            page = 1
+            if pages > 1:
+                page = st.number_input(f"Trang diff (1–{pages})", min_value=1, max_value=pages, value=1, step=1)
+            render_diff = make_side_by_side_html if layout == "split" else make_github_like_unified_html
+            diff_html = render_diff(
                 state.origin_code,
                 state.fixed_code,
                 filename_a=filename,
                 filename_b=f"{Path(filename).stem}.fixed{Path(filename).suffix}",
-                n=3
+                n=3,
+                page=int(page) - 1,
+                intraline=intraline,
             )
             st.components.v1.html(
                 diff_html,
@@ -139,6 +181,18 @@ with st.container(border=True):
     else:
         st.caption("Code đã fix sẽ hiển thị ở đây !")
 
+# Tóm tắt lịch sử chạy nền từ lượt trước đã xong → áp vào state (bỏ qua nếu lịch sử đã bị thay)
+_SUMMARY_JOB_KEY = "_history_summary_job"
+summary_job = st.session_state.get(_SUMMARY_JOB_KEY)
+if summary_job is not None and summary_job.done():
+    del st.session_state[_SUMMARY_JOB_KEY]
+    summary = summary_job.result()
+    if summary is not None and apply_history_summary(state, summary):
+        logger.info(f"[chat] Đã áp tóm tắt lịch sử tới message #{summary.upto - 1}")
+
+# Ghi các thay đổi của panel code (no-op nếu rerun không có thay đổi) trước khi chatbot đọc lại store
+store.set(state)
+
 
 # ============== Chat (Sidebar) ==============
 with chat_tab:
@@ -148,6 +202,12 @@ with chat_tab:
 
     chat_container = st.container(height=420, border=True)
     with chat_container:
+        # Lịch sử cũ hơn chỉ nạp khi người dùng yêu cầu (store phân trang)
+        if state.messages_before > 0:
+            if st.button(f"⬆️ Tải thêm lịch sử ({state.messages_before} tin cũ hơn)", use_container_width=True):
+                store.load_older_messages(state)
+                st.rerun()
+
         # render history
         for msg in state.chat_messages:
             with st.chat_message(msg["role"]):
@@ -159,17 +219,27 @@ with chat_tab:
                 st.markdown(prompt)
                 logger.info(f"User prompt: {prompt}")
 
-            # Gọi chatbot
+            # Gọi chatbot — render token ngay khi model trả về
             with st.chat_message("assistant"):
-                with st.spinner("Đang soạn câu trả lời…"):
-                    reply, new_state, used_tool = chatbot.reply(question=prompt)
-                st.markdown(reply)
+                if chatbot.async_client_factory is not None:
+                    turn = chatbot.areply_stream(question=prompt)
+                    st.write_stream(aiter(turn))    # async generator → Streamlit chạy trên 1 event loop mới
+                else:
+                    turn = chatbot.reply_stream(question=prompt)
+                    st.write_stream(turn)
+                reply, new_state, used_tool = turn.text, turn.state, turn.used_tool
                 logger.info(f"Chatbot reply:\n{reply}")
 
             # Cập nhật message & state
-            new_state.chat_messages.append({"role": "user", "content": prompt})
-            new_state.chat_messages.append({"role": "assistant", "content": reply})
+            new_state.append_message("user", prompt)
+            new_state.append_message("assistant", reply)
             store.set(new_state)
 
+            # Lịch sử không còn vừa ngân sách token → tóm tắt nền các lượt cũ, kết quả áp ở lần rerun sau (mỗi phiên 1 job)
+            if _SUMMARY_JOB_KEY not in st.session_state:
+                summary_job = chatbot.summarize_history_background(new_state, dropped=turn.history_dropped)
+                if summary_job is not None:
+                    st.session_state[_SUMMARY_JOB_KEY] = summary_job
+
             if used_tool:
                 st.rerun()
@@ -0,0 +1,140 @@
+# retriever/chroma/rule/rule_retriever.py
+import os
+import re
+from typing import Any, Dict, List
+
+import chromadb
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from config.env import settings
+from config.logging import logger
+from retriever.embedding_cache import cached_embeddings
+from retriever.pinecone.rule.base import BaseRuleRetriever, RuleSearchResult, RuleSnippet
+from utils.resource_cache import fingerprint
+
+_UPSERT_BATCH = 1000
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    Embedding chạy local (ONNX all-MiniLM-L6-v2 của ChromaDB), cùng interface
+    embed_query / embed_documents với LangChain Embeddings.
+    - model_dir rỗng: Chroma tự tải model (~80MB) vào ~/.cache/chroma/onnx_models ở lần embed đầu tiên
+      → lần đầu cần network, các lần sau chạy offline từ cache.
+    - model_dir có giá trị: dùng model đã giải nén sẵn trong <model_dir>/onnx (model.onnx, tokenizer.json...),
+      không bao giờ tải → chạy offline hoàn toàn (máy không có network).
+    """
+
+    def __init__(self, model_dir: str | None = None):
+        self._fn = ONNXMiniLM_L6_V2()
+        if model_dir:
+            path = os.path.abspath(model_dir)
+            if not os.path.isdir(os.path.join(path, ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME)):
+                raise FileNotFoundError(
+                    f"Không tìm thấy model ONNX all-MiniLM-L6-v2 trong {path}/"
+                    f"{ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME} (CHROMA_EMBEDDING_MODEL_DIR)"
+                )
+            # Chroma chỉ tải khi thiếu file trong DOWNLOAD_PATH → trỏ sang thư mục local
+            self._fn.DOWNLOAD_PATH = path
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return [list(map(float, v)) for v in self._fn(texts)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class ChromaRuleRetriever(BaseRuleRetriever):
+    """
+    Retriever local dùng ChromaDB persist xuống đĩa, không cần Pinecone/OpenAI.
+    Embedding ONNX chỉ offline hoàn toàn khi đặt CHROMA_EMBEDDING_MODEL_DIR (xem LocalEmbeddings).
+    Mỗi ngôn ngữ một collection riêng (partition theo language) → search chỉ quét index của ngôn ngữ đó.
+    """
+
+    def __init__(self, index_name: str, persist_dir: str | None = None):
+        self.index_name = index_name
+        self.persist_dir = os.path.abspath(persist_dir or settings.CHROMA_PERSIST_DIR)
+        self.client = chromadb.PersistentClient(path=self.persist_dir)
+        self.embedding = cached_embeddings(LocalEmbeddings(settings.CHROMA_EMBEDDING_MODEL_DIR), model="chroma-default-all-MiniLM-L6-v2")
+        self._collections: Dict[str, Any] = {}
+
+    @property
+    def backend_identity(self) -> str:
+        return fingerprint(self.persist_dir)
+
+    def _collection(self, language: str):
+        lang = (language or "").strip().lower()
+        coll = self._collections.get(lang)
+        if coll is None:
+            # Tên collection Chroma chỉ cho phép [a-zA-Z0-9._-]
+            name = re.sub(r"[^a-z0-9._-]+", "_", f"{self.index_name}-{lang}")
+            coll = self.client.get_or_create_collection(
+                name=name,
+                metadata={"hnsw:space": "cosine"},
+                embedding_function=None,
+            )
+            self._collections[lang] = coll
+        return coll
+
+    def search(self, query: str, language: str, k: int = 5, score_threshold: float = 0.25) -> RuleSearchResult:
+        return self.search_many([query], language, k=k, score_threshold=score_threshold)[0]
+
+    def search_many(
+        self, queries: List[str], language: str, k: int = 5, score_threshold: float = 0.25
+    ) -> List[RuleSearchResult]:
+        """Embed tất cả query 1 lần và query collection trong 1 lời gọi."""
+        if not queries:
+            return []
+        coll = self._collection(language)
+        total = coll.count()
+        if total == 0:
+            return [RuleSearchResult(hits=0, snippets=[]) for _ in queries]
+
+        results = coll.query(
+            query_embeddings=self.embedding.embed_documents(queries),
+            n_results=min(k, total),
+            include=["documents", "metadatas", "distances"],
+        )
+        out: List[RuleSearchResult] = []
+        for docs, metas, dists in zip(results["documents"], results["metadatas"], results["distances"]):
+            snippets: List[RuleSnippet] = []
+            for doc, meta, dist in zip(docs, metas, dists):
+                score = 1.0 - float(dist)  # cosine distance → similarity (cùng thang với Pinecone)
+                if score < score_threshold:
+                    continue
+                snippets.append(
+                    RuleSnippet(
+                        summary=(doc or "").strip(),
+                        source_path=(meta or {}).get("source_path", "unknown"),
+                        score=round(score, 4),
+                    )
+                )
+            out.append(RuleSearchResult(hits=len(snippets), snippets=snippets))
+        logger.info(f"[retriever] Embedding cache: {self.embedding.stats()}")
+        return out
+
+    def upsert_embedded(self, chunks: List[Document], vectors: List[List[float]]) -> None:
+        """Upsert chunk đã embed vào collection theo language của từng chunk, chia batch."""
+        by_lang: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(chunks):
+            by_lang.setdefault(chunk.metadata.get("language", ""), []).append(i)
+
+        for lang, idxs in by_lang.items():
+            coll = self._collection(lang)
+            for start in range(0, len(idxs), _UPSERT_BATCH):
+                batch = idxs[start:start + _UPSERT_BATCH]
+                coll.upsert(
+                    ids=[chunks[i].metadata["chunk_id"] for i in batch],
+                    embeddings=[vectors[i] for i in batch],
+                    documents=[chunks[i].page_content for i in batch],
+                    metadatas=[dict(chunks[i].metadata) for i in batch],
+                )
+
+    def delete_embedded(self, ids: List[str], language: str) -> None:
+        coll = self._collection(language)
+        for start in range(0, len(ids), _UPSERT_BATCH):
+            coll.delete(ids=ids[start:start + _UPSERT_BATCH])
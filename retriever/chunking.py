@@ -0,0 +1,73 @@
+# retriever/chunking.py
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+def split_rules_file(
+    file_path: str,
+    *,
+    language: str,
+    source_path: str | None = None,
+    chunk_size: int = 300,
+    chunk_overlap: int = 30,
+) -> List[Document]:
+    """
+    Load file rules (UTF-8) và split thành chunk:
+    - RecursiveCharacterTextSplitter → cân bằng độ chính xác/độ trễ
+    - Attach metadata: language (lowercase), source_path
+    - Làm sạch nhẹ nội dung, bỏ chunk rỗng
+    - Gán chunk_id tất định + content_hash (assign_chunk_ids)
+    """
+    lang = (language or "").strip().lower()
+    docs = TextLoader(file_path, encoding="utf-8").load()
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = splitter.split_documents(docs)
+
+    src = source_path or file_path
+    for d in chunks:
+        d.metadata["language"] = lang
+        d.metadata["source_path"] = src
+        if d.page_content:
+            d.page_content = d.page_content.strip()
+
+    return assign_chunk_ids([c for c in chunks if c.page_content])
+
+
+def source_path_for(path: Path, root: Optional[Path] = None) -> str:
+    """
+    source_path lưu trong metadata/manifest (và là một phần của chunk_id): đường dẫn POSIX tương đối với gốc
+    ingest (None → thư mục chứa file), không phụ thuộc thư mục đang chạy → cùng file ingest lại luôn ra cùng id.
+    File nằm ngoài gốc → đường dẫn tuyệt đối.
+    """
+    resolved = Path(path).resolve()
+    base = (Path(root) if root is not None else resolved.parent).resolve()
+    if base == resolved.parent or base in resolved.parents:
+        return resolved.relative_to(base).as_posix()
+    return resolved.as_posix()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def assign_chunk_ids(chunks: List[Document]) -> List[Document]:
+    """
+    chunk_id = hash(source_path, thứ tự xuất hiện của nội dung trùng, content_hash).
+    "Offset" ở đây là số lần nội dung này đã xuất hiện trước đó trong cùng source, không phải
+    vị trí ký tự: sửa 1 rule không làm đổi id của các chunk phía sau → chỉ chunk bị sửa phải embed lại.
+    """
+    seen: Dict[Tuple[str, str], int] = {}
+    for c in chunks:
+        src = c.metadata.get("source_path", "")
+        h = content_hash(c.page_content)
+        occurrence = seen.get((src, h), 0)
+        seen[(src, h)] = occurrence + 1
+        c.metadata["content_hash"] = h
+        c.metadata["chunk_id"] = hashlib.sha256(f"{src}\0{occurrence}\0{h}".encode("utf-8")).hexdigest()[:40]
+    return chunks
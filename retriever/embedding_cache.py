@@ -0,0 +1,180 @@
+# retriever/embedding_cache.py
+import hashlib
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import Column, LargeBinary
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+
+from config.env import settings
+from config.logging import logger
+from utils.resource_cache import resource_cache
+
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hoá nhẹ trước khi tạo key: gộp khoảng trắng, bỏ đầu/cuối."""
+    return " ".join((text or "").split())
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingRecord(SQLModel, table=True):
+    __tablename__ = "embedding_cache"
+
+    key: str = Field(primary_key=True)
+    model: str = Field(index=True)
+    dim: int
+    vector: bytes = Field(sa_column=Column(LargeBinary, nullable=False))  # float32 liên tiếp
+
+
+class EmbeddingStore:
+    """Lớp lưu embedding xuống SQLite (sqlmodel), vector lưu dạng float32 bytes."""
+
+    def __init__(self, db_url: str):
+        self.engine = create_engine(db_url, connect_args={"check_same_thread": False})
+        SQLModel.metadata.create_all(self.engine, tables=[EmbeddingRecord.__table__])
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        with Session(self.engine) as session:
+            rows = session.exec(select(EmbeddingRecord).where(EmbeddingRecord.key.in_(keys))).all()
+        out: Dict[str, List[float]] = {}
+        for row in rows:
+            vec = array("f")
+            vec.frombytes(row.vector)
+            out[row.key] = vec.tolist()
+        return out
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        with Session(self.engine) as session:
+            for key, vec in items.items():
+                session.merge(EmbeddingRecord(key=key, model=model, dim=len(vec), vector=array("f", vec).tobytes()))
+            session.commit()
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings có cache content-addressed theo (model, text đã chuẩn hoá):
+    - Lớp 1: LRU trong RAM (OrderedDict).
+    - Lớp 2: SQLite trên đĩa (tuỳ chọn), sống qua các lần restart.
+    - Chỉ gọi model embedding cho phần miss; embed_documents gom miss thành 1 lời gọi.
+    stats() trả về số hit/miss và thời gian gọi model đã tiết kiệm (ước lượng).
+    """
+
+    def __init__(self, inner: Embeddings, *, model: str, store: Optional[EmbeddingStore] = None, lru_size: int = 4096):
+        self.inner = inner
+        self.model = model
+        self.store = store
+        self.lru_size = lru_size
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.embed_calls = 0
+        self.embed_seconds = 0.0
+
+    # --- LangChain Embeddings interface ---
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], query=True)[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), query=False)
+
+    # --- cache ---
+    def _embed(self, texts: List[str], *, query: bool) -> List[List[float]]:
+        if not texts:
+            return []
+        keys = [embedding_key(self.model, t) for t in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            for key in keys:
+                vec = self._lru.get(key)
+                if vec is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vec
+            self.memory_hits += sum(1 for k in keys if k in found)
+
+        pending = [k for k in dict.fromkeys(keys) if k not in found]
+        if pending and self.store is not None:
+            try:
+                from_disk = self.store.get_many(pending)
+            except Exception as e:
+                logger.warning(f"[embed-cache] Lỗi đọc cache đĩa: {e}")
+                from_disk = {}
+            found.update(from_disk)
+            self._remember(from_disk)
+            with self._lock:
+                self.disk_hits += sum(1 for k in keys if k in from_disk)
+
+        # Miss: mỗi nội dung chỉ embed 1 lần (kể cả khi trùng trong cùng batch)
+        miss_texts: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in miss_texts:
+                miss_texts[key] = text
+        if miss_texts:
+            started = time.perf_counter()
+            if query and len(miss_texts) == 1:
+                vectors = [self.inner.embed_query(next(iter(miss_texts.values())))]
+            else:
+                vectors = self.inner.embed_documents(list(miss_texts.values()))
+            elapsed = time.perf_counter() - started
+            computed = dict(zip(miss_texts.keys(), vectors))
+            found.update(computed)
+            self._remember(computed)
+            with self._lock:
+                self.misses += len(miss_texts)
+                self.embed_calls += 1
+                self.embed_seconds += elapsed
+            if self.store is not None:
+                try:
+                    self.store.put_many(self.model, computed)
+                except Exception as e:
+                    logger.warning(f"[embed-cache] Lỗi ghi cache đĩa: {e}")
+
+        return [found[k] for k in keys]
+
+    def _remember(self, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            for key, vec in items.items():
+                self._lru[key] = vec
+                self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            avg_miss = (self.embed_seconds / self.misses) if self.misses else 0.0
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "embed_calls": self.embed_calls,
+                "embed_seconds": round(self.embed_seconds, 4),
+                "saved_calls": hits,
+                "saved_seconds_est": round(hits * avg_miss, 4),
+            }
+
+
+def cached_embeddings(inner: Embeddings, *, model: str) -> CachedEmbeddings:
+    """Bọc embeddings bằng cache; lớp SQLite dùng chung process-wide theo settings.EMBEDDING_CACHE_DB_URL."""
+    store: Optional[EmbeddingStore] = None
+    db_url = (settings.EMBEDDING_CACHE_DB_URL or "").strip()
+    if db_url:
+        store = resource_cache.get_or_create("embedding_store", db_url, lambda: EmbeddingStore(db_url))
+    return CachedEmbeddings(inner, model=model, store=store, lru_size=settings.EMBEDDING_CACHE_LRU_SIZE)
@@ -0,0 +1,39 @@
+from typing import Tuple
+
+from config.env import settings
+from retriever.pinecone.rule.base import BaseRuleRetriever
+from utils.resource_cache import fingerprint, resource_cache
+
+RULE_RETRIEVER_KIND = "rule_retriever"
+
+
+def rule_retriever_key(index_name: str) -> Tuple[str, ...]:
+    """Key cache cho retriever: backend + index + cấu hình kết nối/embedding."""
+    backend = (settings.RULE_RETRIEVER_BACKEND or "pinecone").strip().lower()
+    if backend == "chroma":
+        return ("chroma", index_name, settings.CHROMA_PERSIST_DIR)
+    return (
+        "pinecone",
+        index_name,
+        fingerprint(settings.PINECONE_API_KEY),
+        settings.AZURE_OPENAI_EMBEDDING_ENDPOINT,
+        settings.AZURE_OPENAI_EMBED_MODEL,
+        fingerprint(settings.AZURE_OPENAI_EMBEDDING_API_KEY),
+    )
+
+
+def create_rule_retriever(index_name: str = "code-rules") -> BaseRuleRetriever:
+    """Tạo retriever theo settings.RULE_RETRIEVER_BACKEND (pinecone | chroma)."""
+    backend = (settings.RULE_RETRIEVER_BACKEND or "pinecone").strip().lower()
+    if backend == "chroma":
+        from retriever.chroma.rule.rule_retriever import ChromaRuleRetriever
+        return ChromaRuleRetriever(index_name=index_name)
+    from retriever.pinecone.rule.rule_retriever import PineconeRuleRetriever
+    return PineconeRuleRetriever(index_name=index_name)
+
+
+def get_rule_retriever(index_name: str = "code-rules") -> BaseRuleRetriever:
+    """Lấy retriever từ cache process-wide (không kết nối/khởi tạo lại mỗi lần rerun)."""
+    return resource_cache.get_or_create(
+        RULE_RETRIEVER_KIND, rule_retriever_key(index_name), lambda: create_rule_retriever(index_name)
+    )
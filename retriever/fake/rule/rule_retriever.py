@@ -0,0 +1,97 @@
+# retriever/fake/rule/rule_retriever.py
+import random
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+from langchain_core.documents import Document
+
+from retriever.pinecone.rule.base import BaseRuleRetriever, RuleSearchResult, RuleSnippet
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class RetrieverLatency(NamedTuple):
+    """embed_s: embed 1 batch query; query_s: 1 lần query index (search_many query song song → tính 1 lần)."""
+    embed_s: float = 0.0
+    query_s: float = 0.0
+    jitter: float = 0.0
+
+
+RETRIEVER_LATENCY_PROFILES: Dict[str, RetrieverLatency] = {
+    "instant": RetrieverLatency(),
+    "local": RetrieverLatency(embed_s=0.01, query_s=0.005, jitter=0.2),
+    "pinecone": RetrieverLatency(embed_s=0.12, query_s=0.08, jitter=0.3),
+}
+
+
+def _words(text: str) -> set:
+    return set(_WORD.findall((text or "").lower()))
+
+
+class FakeRuleRetriever(BaseRuleRetriever):
+    """
+    Retriever giả trong RAM, chạy offline và tất định: score = tỉ lệ từ của query có trong chunk rule.
+    Rule nạp bằng load_rules_file (dùng chunking thật) hoặc upsert_embedded; độ trễ theo RetrieverLatency.
+    """
+
+    def __init__(
+        self, index_name: str = "fake-rules", *, latency: RetrieverLatency = RetrieverLatency(), seed: int = 0, sleep=time.sleep
+    ):
+        self.index_name = index_name
+        self.latency = latency
+        self.queries = 0
+        self._sleep = sleep
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._chunks: Dict[str, Dict[str, Tuple[Document, set]]] = {}   # language → chunk_id → (doc, words)
+
+    def load_rules_file(self, file_path: str, *, language: str, source_path: str | None = None) -> int:
+        """Nạp file rules qua split_rules_file (không embed, không ghi manifest)."""
+        from retriever.chunking import split_rules_file
+        chunks = split_rules_file(file_path, language=language, source_path=source_path)
+        self.upsert_embedded(chunks, [])
+        return len(chunks)
+
+    def _wait(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        with self._lock:
+            factor = 1 + self._rng.uniform(-self.latency.jitter, self.latency.jitter) if self.latency.jitter > 0 else 1
+        self._sleep(seconds * factor)
+
+    def _score(self, query: str, language: str, k: int, score_threshold: float) -> RuleSearchResult:
+        q = _words(query)
+        scored = []
+        for doc, words in self._chunks.get((language or "").strip().lower(), {}).values():
+            score = len(q & words) / len(q) if q else 0.0
+            if score >= score_threshold:
+                scored.append(RuleSnippet(
+                    summary=doc.page_content, source_path=doc.metadata.get("source_path", "unknown"), score=round(score, 4)
+                ))
+        snippets = sorted(scored, key=lambda s: s.score, reverse=True)[:k]
+        return RuleSearchResult(hits=len(snippets), snippets=snippets)
+
+    def search(self, query: str, language: str, k: int = 5, score_threshold: float = 0.25) -> RuleSearchResult:
+        return self.search_many([query], language, k=k, score_threshold=score_threshold)[0]
+
+    def search_many(
+        self, queries: List[str], language: str, k: int = 5, score_threshold: float = 0.25
+    ) -> List[RuleSearchResult]:
+        if not queries:
+            return []
+        self._wait(self.latency.embed_s + self.latency.query_s)
+        with self._lock:
+            self.queries += len(queries)
+        return [self._score(q, language, k, score_threshold) for q in queries]
+
+    def upsert_embedded(self, chunks: List[Document], vectors: List[List[float]]) -> None:
+        for chunk in chunks:
+            lang = chunk.metadata.get("language", "")
+            self._chunks.setdefault(lang, {})[chunk.metadata["chunk_id"]] = (chunk, _words(chunk.page_content))
+
+    def delete_embedded(self, ids: List[str], language: str) -> None:
+        bucket = self._chunks.get((language or "").strip().lower(), {})
+        for chunk_id in ids:
+            bucket.pop(chunk_id, None)
@@ -0,0 +1,338 @@
+# retriever/ingest.py
+import glob
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from langchain_core.documents import Document
+
+from config.constant import LANGUAGE_OPTIONS
+from config.logging import logger
+from retriever.chunking import source_path_for, split_rules_file
+from retriever.manifest import ManifestPlan, get_ingest_manifest
+from retriever.pinecone.rule.base import BaseRuleRetriever
+from utils.language import guess_lang_from_name
+from utils.retry import RetryPolicy
+
+T = TypeVar("T")
+
+RULE_FILE_EXTS = (".txt", ".md")
+
+
+@dataclass
+class IngestOptions:
+    batch_size: int = 64            # số chunk mỗi request embedding
+    embed_workers: int = 4          # số request embedding song song
+    upsert_workers: int = 4         # số request upsert song song
+    max_in_flight: int = 16         # số batch embed/upsert tối đa đang chờ → bộ nhớ không phình theo số file
+    max_retries: int = 6
+    backoff_base_s: float = 1.0
+    backoff_max_s: float = 60.0
+    chunk_size: int = 300
+    chunk_overlap: int = 30
+    checkpoint_path: str = "tmp/ingest_checkpoint.json"
+    language: Optional[str] = None  # ép ngôn ngữ cho mọi file (bỏ qua suy luận)
+
+
+@dataclass
+class IngestReport:
+    files: int = 0
+    skipped_files: int = 0
+    failed_files: List[str] = field(default_factory=list)
+    chunks: int = 0                 # chunk mới/đổi đã embed + upsert
+    unchanged_chunks: int = 0       # chunk đã có trong manifest, bỏ qua
+    deleted_chunks: int = 0         # chunk không còn trong file, đã xoá khỏi index
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+
+def discover_rule_files(patterns: Iterable[str], exts: Tuple[str, ...] = RULE_FILE_EXTS) -> List[Path]:
+    """Mở rộng danh sách thư mục / glob / file thành list file rules (không trùng, sắp xếp)."""
+    found: Dict[str, Path] = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = [p for p in path.rglob("*") if p.is_file() and p.suffix.lower() in exts]
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = [Path(p) for p in glob.glob(pattern, recursive=True) if Path(p).is_file()]
+        for p in candidates:
+            found.setdefault(str(p.resolve()), p)
+    return [found[k] for k in sorted(found)]
+
+
+def ingest_roots(patterns: Iterable[str]) -> List[Path]:
+    """Thư mục gốc ingest của từng pattern: thư mục → chính nó, file → thư mục chứa, glob → phần trước ký tự glob."""
+    roots: List[Path] = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            roots.append(path)
+        elif path.is_file():
+            roots.append(path.parent)
+        else:
+            stop = next((i for i, p in enumerate(path.parts) if glob.has_magic(p)), len(path.parts))
+            roots.append(Path(*path.parts[:stop]) if stop else Path("."))
+    return roots
+
+
+def _root_for(path: Path, roots: List[Path]) -> Optional[Path]:
+    """Gốc sâu nhất chứa path (None nếu path không nằm dưới gốc nào)."""
+    resolved = path.resolve()
+    best: Optional[Path] = None
+    for root in roots:
+        r = root.resolve()
+        if r in resolved.parents and (best is None or len(r.parts) > len(best.parts)):
+            best = r
+    return best
+
+
+def infer_language(path: Path, root: Optional[Path] = None) -> Optional[str]:
+    """
+    Suy luận ngôn ngữ của file rules:
+    - Theo phần mở rộng bên trong (vd: naming.py.txt) bằng guess_lang_from_name
+    - Theo token trong tên file (vd: python_rule.txt), rồi thư mục ngay dưới gốc ingest
+      (vd: rules/java/naming.md với gốc rules/). Thư mục phía trên gốc không được xét
+      (/opt/rules/sh/..., .../go/... là chỗ đặt repo, không phải ngôn ngữ).
+    """
+    # .txt/.md chỉ là định dạng file rules, không phải ngôn ngữ của rules
+    name = path.stem if path.suffix.lower() in RULE_FILE_EXTS else path.name
+    lang = guess_lang_from_name(name)
+    if lang != "text":
+        return lang
+    parts = [path.stem]
+    if root is not None and root.resolve() in path.resolve().parents:
+        rel = path.resolve().relative_to(root.resolve())
+        if len(rel.parts) > 1:
+            parts.append(rel.parts[0])
+    for part in parts:
+        for token in re.split(r"[^a-z0-9+#]+", part.lower()):
+            if token in LANGUAGE_OPTIONS and token != "text":
+                return token
+            lang = guess_lang_from_name(f".{token}") if token else "text"
+            if lang != "text":
+                return lang
+    return None
+
+
+class IngestCheckpoint:
+    """
+    Checkpoint JSON các file đã ingest xong (theo path + mtime + size), tách theo index_key
+    (= manifest_key của retriever: backend + định danh backend + index) → đổi index/project không bỏ qua nhầm file.
+    Ghi atomically (file tạm + os.replace) sau mỗi file → chạy lại sẽ bỏ qua file đã xong.
+    """
+
+    def __init__(self, path: str, index_key: str):
+        self.path = path
+        self.index_key = index_key
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, Dict[str, Dict[str, float]]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._indexes = json.load(f).get("indexes", {})
+            except Exception as e:
+                logger.warning(f"[ingest] Checkpoint hỏng, bỏ qua: {e}")
+        self._done = self._indexes.setdefault(index_key, {})
+
+    @staticmethod
+    def _signature(path: Path) -> Dict[str, float]:
+        st = path.stat()
+        return {"mtime": st.st_mtime, "size": st.st_size}
+
+    def is_done(self, path: Path) -> bool:
+        entry = self._done.get(str(path.resolve()))
+        return entry is not None and {k: entry.get(k) for k in ("mtime", "size")} == self._signature(path)
+
+    def mark_done(self, path: Path, chunks: int) -> None:
+        with self._lock:
+            self._done[str(path.resolve())] = {**self._signature(path), "chunks": chunks}
+            self._save()
+
+    def reset(self) -> None:
+        """Bỏ checkpoint của index này (các index khác giữ nguyên)."""
+        with self._lock:
+            self._done.clear()
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"indexes": {k: v for k, v in self._indexes.items() if v}}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+
+def call_with_retry(fn: Callable[[], T], *, options: IngestOptions, label: str) -> T:
+    """Gọi fn, retry với exponential backoff + jitter khi bị rate limit / lỗi tạm thời (tôn trọng Retry-After)."""
+    policy = RetryPolicy(
+        label=f"[ingest] {label}",
+        max_retries=options.max_retries,
+        backoff_base_s=options.backoff_base_s,
+        backoff_max_s=options.backoff_max_s,
+    )
+    return policy.call(lambda _timeout: fn())
+
+
+def ingest_rule_files(
+    retriever: BaseRuleRetriever,
+    files: List[Path],
+    options: IngestOptions,
+    *,
+    roots: Optional[List[Path]] = None,
+    on_progress: Optional[Callable[[IngestReport], None]] = None,
+) -> IngestReport:
+    """
+    Ingest nhiều file rules:
+    - Split từng file khi tới lượt, gom chunk thành batch → embed song song (thread pool) với retry
+    - Batch embed xong → upsert song song (thread pool riêng) với retry
+    - Tối đa max_in_flight batch đang chờ: đủ thì dừng split file mới, xử lý kết quả đã về trước
+    - Chỉ chunk mới/đổi (theo manifest + chunk_id tất định) mới được embed/upsert,
+      chunk bị xoá khỏi file được xoá khỏi index
+    - roots: thư mục gốc ingest (ingest_roots) → source_path tương đối với gốc và suy luận ngôn ngữ theo
+      thư mục con; None → theo thư mục chứa từng file
+    - Mỗi batch upsert xong → ghi manifest ngay (chạy lại không embed lại batch đó);
+      file xong hết batch → xoá chunk cũ + ghi checkpoint, chạy lại bỏ qua file đã xong và không đổi
+    """
+    report = IngestReport()
+    checkpoint = IngestCheckpoint(options.checkpoint_path, retriever.manifest_key)
+    manifest = get_ingest_manifest()
+    started = time.perf_counter()
+    changed_langs: Set[str] = set()
+    max_in_flight = max(1, options.max_in_flight)
+
+    # Chỉ giữ thông tin của file còn batch đang chạy; file xong → bỏ khỏi các dict này
+    remaining: Dict[Path, int] = {}                           # file → số batch chưa upsert xong
+    plans: Dict[Path, Tuple[str, str, ManifestPlan, int]] = {} # file → (source_path, language, plan, số chunk)
+    failed: Set[Path] = set()
+
+    def _embed(batch: List[Document]) -> List[List[float]]:
+        texts = [c.page_content for c in batch]
+        return call_with_retry(lambda: retriever.embedding.embed_documents(texts), options=options, label="embed")
+
+    def _upsert(batch: List[Document], vectors: List[List[float]]) -> int:
+        call_with_retry(lambda: retriever.upsert_embedded(batch, vectors), options=options, label="upsert")
+        return len(batch)
+
+    def _finish_file(path: Path) -> None:
+        # Mọi batch của file đã upsert (manifest đã ghi theo batch) → xoá chunk cũ, ghi checkpoint
+        src, lang, plan, chunks = plans.pop(path)
+        remaining.pop(path, None)
+        try:
+            if plan.removed_ids:
+                call_with_retry(
+                    lambda: retriever.delete_embedded(plan.removed_ids, lang), options=options, label="delete"
+                )
+                manifest.commit(retriever.manifest_key, src, ManifestPlan(removed_ids=plan.removed_ids))
+        except Exception as e:
+            logger.exception(f"[ingest] Lỗi xoá chunk cũ/ghi manifest ({path}): {e}")
+            failed.add(path)
+            return
+        report.deleted_chunks += len(plan.removed_ids)
+        checkpoint.mark_done(path, chunks)
+        report.files += 1
+
+    def _fail(path: Path) -> None:
+        failed.add(path)
+        plans.pop(path, None)
+        remaining.pop(path, None)
+
+    with ThreadPoolExecutor(options.embed_workers, thread_name_prefix="embed") as embed_pool, \
+            ThreadPoolExecutor(options.upsert_workers, thread_name_prefix="upsert") as upsert_pool:
+        # future → ("embed" | "upsert", file, batch)
+        in_flight: Dict[Future, Tuple[str, Path, List[Document]]] = {}
+
+        def _process(fut: Future) -> None:
+            kind, path, batch = in_flight.pop(fut)
+            if path in failed:
+                return
+            try:
+                result = fut.result()
+            except Exception as e:
+                logger.exception(f"[ingest] {'Embed' if kind == 'embed' else 'Upsert'} thất bại ({path}): {e}")
+                _fail(path)
+                return
+            if kind == "embed":
+                in_flight[upsert_pool.submit(_upsert, batch, result)] = ("upsert", path, batch)
+                return
+            src = plans[path][0]
+            try:
+                manifest.commit(retriever.manifest_key, src, ManifestPlan(new_chunks=batch))
+            except Exception as e:
+                logger.exception(f"[ingest] Lỗi ghi manifest ({path}): {e}")
+                _fail(path)
+                return
+            report.chunks += result
+            remaining[path] -= 1
+            if remaining[path] == 0:
+                _finish_file(path)
+            report.seconds = time.perf_counter() - started
+            if on_progress is not None:
+                on_progress(report)
+
+        def _drain(limit: int) -> None:
+            # Chờ tới khi số batch đang chạy < limit (limit=1 → chờ hết)
+            while len(in_flight) >= limit:
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    _process(fut)
+
+        for path in files:
+            if checkpoint.is_done(path):
+                report.skipped_files += 1
+                continue
+            root = _root_for(path, roots) if roots else None
+            lang = (options.language or infer_language(path, root) or "").strip().lower()
+            if not lang:
+                logger.warning(f"[ingest] Không suy luận được ngôn ngữ, bỏ qua: {path}")
+                report.failed_files.append(str(path))
+                continue
+            src = source_path_for(path, root)
+            try:
+                chunks = split_rules_file(
+                    str(path), language=lang, source_path=src,
+                    chunk_size=options.chunk_size, chunk_overlap=options.chunk_overlap,
+                )
+                plan = manifest.plan(retriever.manifest_key, src, chunks)
+            except Exception as e:
+                logger.exception(f"[ingest] Lỗi đọc/split file {path}: {e}")
+                report.failed_files.append(str(path))
+                continue
+
+            report.unchanged_chunks += plan.unchanged
+            if plan.has_changes:
+                changed_langs.add(lang)
+            todo = plan.new_chunks
+            batches = [todo[i:i + options.batch_size] for i in range(0, len(todo), options.batch_size)]
+            plans[path] = (src, lang, plan, len(chunks))
+            remaining[path] = len(batches)
+            if not batches:
+                _finish_file(path)
+            for batch in batches:
+                _drain(max_in_flight)
+                if path in failed:
+                    break
+                in_flight[embed_pool.submit(_embed, batch)] = ("embed", path, batch)
+
+        _drain(1)
+
+    report.failed_files.extend(str(p) for p in sorted(failed))
+    report.seconds = time.perf_counter() - started
+    for lang in changed_langs:
+        retriever._notify_rules_changed(lang)
+    logger.info(
+        f"[ingest] Xong {report.files} file, {report.chunks} chunk mới/đổi trong {report.seconds:.1f}s "
+        f"({report.chunks_per_second:.1f} chunk/s), giữ nguyên {report.unchanged_chunks}, "
+        f"xoá {report.deleted_chunks}, bỏ qua {report.skipped_files} file, lỗi {len(report.failed_files)}"
+    )
+    return report
@@ -0,0 +1,83 @@
+# retriever/manifest.py
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from langchain_core.documents import Document
+from sqlalchemy import Index, delete
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+
+from config.env import settings
+from utils.resource_cache import resource_cache
+
+
+class ManifestRecord(SQLModel, table=True):
+    __tablename__ = "ingest_manifest"
+    __table_args__ = (Index("ix_ingest_manifest_source", "index_key", "source_path"),)
+
+    index_key: str = Field(primary_key=True)
+    chunk_id: str = Field(primary_key=True)
+    source_path: str
+    language: str
+    content_hash: str
+
+
+@dataclass
+class ManifestPlan:
+    """Kết quả so sánh chunk mới của 1 source với những gì đã ingest."""
+    new_chunks: List[Document] = field(default_factory=list)   # cần embed + upsert
+    removed_ids: List[str] = field(default_factory=list)       # cần xoá khỏi index
+    unchanged: int = 0
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.new_chunks or self.removed_ids)
+
+
+class IngestManifest:
+    """
+    Manifest local (SQLite) các chunk đã ingest theo (index_key, source_path, chunk_id).
+    chunk_id tất định (xem retriever.chunking.assign_chunk_ids) → re-ingest chỉ đụng tới chunk mới/đổi/xoá.
+    """
+
+    def __init__(self, db_url: str):
+        self.engine = create_engine(db_url, connect_args={"check_same_thread": False})
+        SQLModel.metadata.create_all(self.engine, tables=[ManifestRecord.__table__])
+
+    def plan(self, index_key: str, source_path: str, chunks: List[Document]) -> ManifestPlan:
+        with Session(self.engine) as session:
+            existing = set(session.exec(
+                select(ManifestRecord.chunk_id).where(
+                    ManifestRecord.index_key == index_key, ManifestRecord.source_path == source_path
+                )
+            ).all())
+        current: Dict[str, Document] = {c.metadata["chunk_id"]: c for c in chunks}
+        return ManifestPlan(
+            new_chunks=[c for cid, c in current.items() if cid not in existing],
+            removed_ids=sorted(existing - current.keys()),
+            unchanged=len(existing & current.keys()),
+        )
+
+    def commit(self, index_key: str, source_path: str, plan: ManifestPlan) -> None:
+        """Ghi nhận plan đã áp dụng thành công vào index."""
+        with Session(self.engine) as session:
+            if plan.removed_ids:
+                session.execute(delete(ManifestRecord).where(
+                    ManifestRecord.index_key == index_key, ManifestRecord.chunk_id.in_(plan.removed_ids)
+                ))
+            for c in plan.new_chunks:
+                session.merge(ManifestRecord(
+                    index_key=index_key,
+                    chunk_id=c.metadata["chunk_id"],
+                    source_path=source_path,
+                    language=c.metadata.get("language", ""),
+                    content_hash=c.metadata["content_hash"],
+                ))
+            session.commit()
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+
+def get_ingest_manifest() -> IngestManifest:
+    db_url = settings.INGEST_MANIFEST_DB_URL
+    return resource_cache.get_or_create("ingest_manifest", db_url, lambda: IngestManifest(db_url))
@@ -1,7 +1,9 @@
-# retriever/base.py
+# retriever/pinecone/rule/base.py
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import List
+from typing import Callable, Dict, List, Tuple
+
+from langchain_core.documents import Document
 
 @dataclass
 class RuleSnippet:
@@ -14,8 +16,103 @@ class RuleSearchResult:
     hits: int
     snippets: List[RuleSnippet]
 
+def merge_search_results(results: List[RuleSearchResult], k: int) -> RuleSearchResult:
+    """Gộp kết quả của nhiều query: bỏ snippet trùng (giữ score cao nhất), sắp xếp theo score, lấy top k."""
+    best: Dict[Tuple[str, str], RuleSnippet] = {}
+    for res in results:
+        for s in res.snippets:
+            key = (s.source_path, s.summary)
+            if key not in best or s.score > best[key].score:
+                best[key] = s
+    snippets = sorted(best.values(), key=lambda s: s.score, reverse=True)[:k]
+    return RuleSearchResult(hits=len(snippets), snippets=snippets)
+
+
 class BaseRuleRetriever(ABC):
+    def add_rules_changed_listener(self, callback: Callable[[str], None]) -> None:
+        """Đăng ký callback(language), được gọi sau khi rules của một ngôn ngữ được import (lại)."""
+        self.__dict__.setdefault("_rules_changed_listeners", []).append(callback)
+
+    def _notify_rules_changed(self, language: str) -> None:
+        for callback in self.__dict__.get("_rules_changed_listeners", []):
+            callback(language)
+
+    @abstractmethod
+    def search(self, query: str, language: str, k: int = 5, score_threshold: float = 0.25) -> RuleSearchResult:
+        """Tìm các snippet rule liên quan theo query và ngôn ngữ."""
+        raise NotImplementedError
+
+    def search_many(
+        self, queries: List[str], language: str, k: int = 5, score_threshold: float = 0.25
+    ) -> List[RuleSearchResult]:
+        """Tìm nhiều query một lượt (mỗi query một kết quả, cùng thứ tự). Backend override để gom batch."""
+        return [self.search(q, language, k=k, score_threshold=score_threshold) for q in queries]
+
+    @property
+    def backend_identity(self) -> str:
+        """Định danh nơi lưu vector (project/API key, thư mục persist...); backend thật override."""
+        return ""
+
+    @property
+    def manifest_key(self) -> str:
+        """
+        Key của index này trong ingest manifest (backend + định danh backend + index name).
+        Cùng index name nhưng khác project Pinecone / thư mục Chroma là index khác → không dùng chung manifest.
+        """
+        return f"{type(self).__name__}:{self.backend_identity}:{getattr(self, 'index_name', '')}"
+
     @abstractmethod
-    def search(self, query: str, language: str) -> RuleSearchResult:
-        """Retrieve related rule snippets by query and language."""
+    def upsert_embedded(self, chunks: List[Document], vectors: List[List[float]]) -> None:
+        """Lưu các chunk đã embed (cùng thứ tự với vectors), id = metadata["chunk_id"]."""
         raise NotImplementedError
+
+    @abstractmethod
+    def delete_embedded(self, ids: List[str], language: str) -> None:
+        """Xoá các chunk đã lưu theo chunk_id."""
+        raise NotImplementedError
+
+    def import_rules_from_txt(
+        self,
+        file_path: str,
+        *,
+        language: str,
+        source_path: str | None = None,
+        root: str | None = None,
+        chunk_size: int = 300,
+        chunk_overlap: int = 30,
+    ) -> int:
+        """
+        Ingest file rules UTF-8 theo kiểu incremental:
+        - source_path mặc định: đường dẫn tương đối với root (None → thư mục chứa file), cùng helper với
+          retriever.ingest → chunk_id không đổi theo thư mục đang chạy hay entry point
+        - Load + split với chunk_id tất định (retriever.chunking.split_rules_file)
+        - So với ingest manifest: chỉ embed + upsert chunk mới/đã đổi,
+          xoá chunk không còn trong file
+        - Báo cho các listener rules-changed, trả về số chunk đã upsert
+        """
+        from pathlib import Path
+
+        from retriever.chunking import source_path_for, split_rules_file
+        from retriever.manifest import get_ingest_manifest
+
+        lang = (language or "").strip().lower()
+        src = source_path or source_path_for(Path(file_path), Path(root) if root else None)
+        chunks = split_rules_file(
+            file_path, language=lang, source_path=src,
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+        )
+
+        manifest = get_ingest_manifest()
+        plan = manifest.plan(self.manifest_key, src, chunks)
+        if not plan.has_changes:
+            return 0
+
+        if plan.new_chunks:
+            vectors = self.embedding.embed_documents([c.page_content for c in plan.new_chunks])
+            self.upsert_embedded(plan.new_chunks, vectors)
+        if plan.removed_ids:
+            self.delete_embedded(plan.removed_ids, lang)
+        manifest.commit(self.manifest_key, src, plan)
+
+        self._notify_rules_changed(lang)
+        return len(plan.new_chunks)
@@ -1,21 +1,31 @@
 # retriever/pinecone_retriever.py
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Set
+from langchain_core.documents import Document
 from langchain_openai import AzureOpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from pinecone import Pinecone, ServerlessSpec
-from langchain_community.document_loaders import TextLoader
 
 from config.env import settings
+from config.logging import logger
+from retriever.embedding_cache import cached_embeddings
+from utils.resource_cache import fingerprint
 
 from .base import BaseRuleRetriever, RuleSnippet, RuleSearchResult
 
+# Index đã kiểm tra/tạo trong process này → không gọi list_indexes() lại
+_ENSURED_INDEXES: Set[str] = set()
+_ENSURE_LOCK = threading.Lock()
+_UPSERT_BATCH = 100  # giới hạn kích thước request upsert của Pinecone
+_MAX_QUERY_WORKERS = 8
 
-class PineconeRuleRetriever(BaseRuleRetriever):
-    """Simple Pinecone + LangChain retriever using language filter."""
-    
-    def __init__(self, index_name: str):
-        pc = Pinecone(api_key=settings.PINECONE_API_KEY)
+
+def _ensure_index(pc: Pinecone, index_name: str) -> None:
+    """Kiểm tra (và tạo nếu thiếu) index đúng 1 lần mỗi process."""
+    with _ENSURE_LOCK:
+        if index_name in _ENSURED_INDEXES:
+            return
         if index_name not in [index["name"] for index in pc.list_indexes()]:
             pc.create_index(
             name=index_name,
@@ -24,22 +34,41 @@ class PineconeRuleRetriever(BaseRuleRetriever):
                 cloud="aws",
                 region="us-east-1"),
             )
+        _ENSURED_INDEXES.add(index_name)
+
+
+class PineconeRuleRetriever(BaseRuleRetriever):
+    """Simple Pinecone + LangChain retriever using language filter."""
+    
+    def __init__(self, index_name: str):
+        pc = Pinecone(api_key=settings.PINECONE_API_KEY)
+        _ensure_index(pc, index_name)
+        self.index_name = index_name
         self.index = pc.Index(index_name)
-        self.embedding = AzureOpenAIEmbeddings(
+        self._api_key_fingerprint = fingerprint(settings.PINECONE_API_KEY)
+        # Embedding có cache (RAM + SQLite) → query/chunk trùng không gọi Azure lại
+        self.embedding = cached_embeddings(
+            AzureOpenAIEmbeddings(
                 azure_endpoint=settings.AZURE_OPENAI_EMBEDDING_ENDPOINT,
                 api_key=settings.AZURE_OPENAI_EMBEDDING_API_KEY,
                 model=settings.AZURE_OPENAI_EMBED_MODEL,
                 api_version=settings.AZURE_OPENAI_EMBEDDING_VERSION,
+            ),
+            model=settings.AZURE_OPENAI_EMBED_MODEL,
         )
+        # Dùng chung 1 vector store suốt vòng đời retriever
+        self.vector_store = PineconeVectorStore(index=self.index, embedding=self.embedding, text_key="text")
 
-    def search(self, query: str, language: str, k: int = 5, score_threshold: float = 0.25) -> RuleSearchResult:
-        vs = PineconeVectorStore(
-            index=self.index,
-            embedding=self.embedding,
-            text_key="text"
-        )
-        results = vs.similarity_search_with_score(
-            query=query,
+    @property
+    def backend_identity(self) -> str:
+        # API key gắn với 1 project Pinecone
+        return self._api_key_fingerprint
+
+    def _search_by_vector(
+        self, vector: List[float], language: str, k: int, score_threshold: float
+    ) -> RuleSearchResult:
+        results = self.vector_store.similarity_search_by_vector_with_score(
+            vector,
             k=k,
             filter={"language": {"$eq": language}}
         )
@@ -56,48 +85,39 @@ class PineconeRuleRetriever(BaseRuleRetriever):
                 )
             )
         return RuleSearchResult(hits=len(snippets), snippets=snippets)
-    
-    def import_rules_from_txt(
-        self,
-        file_path: str,
-        *,
-        language: str,
-        source_path: str | None = None,
-        chunk_size: int = 300,
-        chunk_overlap: int = 30,
-    ) -> int:
-        """
-        Ingest .txt into Pinecone via LangChain:
-        - Load file (UTF-8)
-        - Split (RecursiveCharacterTextSplitter) → cân bằng độ chính xác/độ trễ
-        - Attach metadata: language (lowercase), source_path
-        - Upsert bằng VectorStore (batch nội bộ)
-        - Trả về số chunk đã ingest
-        """
-        lang = (language or "").strip().lower()
-        loader = TextLoader(file_path, encoding="utf-8")
-        docs = loader.load()
 
-        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        chunks = splitter.split_documents(docs)
-
-        src = source_path or file_path
-        for d in chunks:
-            d.metadata["language"] = lang
-            d.metadata["source_path"] = src
-
-            # làm sạch nhẹ nội dung
-            if d.page_content:
-                d.page_content = d.page_content.strip()
-
-        # loại bỏ chunk rỗng
-        chunks = [c for c in chunks if c.page_content]
+    def search(self, query: str, language: str, k: int = 5, score_threshold: float = 0.25) -> RuleSearchResult:
+        result = self._search_by_vector(self.embedding.embed_query(query), language, k, score_threshold)
+        logger.info(f"[retriever] Embedding cache: {self.embedding.stats()}")
+        return result
 
-        if not chunks:
-            return 0
+    def search_many(
+        self, queries: List[str], language: str, k: int = 5, score_threshold: float = 0.25
+    ) -> List[RuleSearchResult]:
+        """Embed tất cả query trong 1 request (batch), rồi query index song song."""
+        if not queries:
+            return []
+        vectors = self.embedding.embed_documents(queries)
+        with ThreadPoolExecutor(max_workers=min(len(vectors), _MAX_QUERY_WORKERS)) as pool:
+            results = list(pool.map(
+                lambda vec: self._search_by_vector(vec, language, k, score_threshold), vectors
+            ))
+        logger.info(f"[retriever] search_many {len(queries)} query — Embedding cache: {self.embedding.stats()}")
+        return results
 
-        vs = PineconeVectorStore(index=self.index, embedding=self.embedding, text_key="text")
-        vs.add_documents(chunks)
-        return len(chunks)
-    
+    def upsert_embedded(self, chunks: List[Document], vectors: List[List[float]]) -> None:
+        """Upsert thẳng vào index (text lưu ở metadata "text" như PineconeVectorStore)."""
+        records = [
+            {
+                "id": chunk.metadata["chunk_id"],
+                "values": vec,
+                "metadata": {**chunk.metadata, "text": chunk.page_content},
+            }
+            for chunk, vec in zip(chunks, vectors)
+        ]
+        for start in range(0, len(records), _UPSERT_BATCH):
+            self.index.upsert(vectors=records[start:start + _UPSERT_BATCH])
 
+    def delete_embedded(self, ids: List[str], language: str) -> None:
+        for start in range(0, len(ids), _UPSERT_BATCH):
+            self.index.delete(ids=ids[start:start + _UPSERT_BATCH])
@@ -0,0 +1,32 @@
+# stores/factory.py
+import uuid
+
+import streamlit as st
+
+from config.env import settings
+from stores.session_state_store import SessionStateStore
+
+SESSION_QUERY_PARAM = "sid"
+
+
+def get_session_id() -> str:
+    """Id phiên lấy từ query param (?sid=...) → reload trang / restart app vẫn mở lại đúng phiên."""
+    sid = st.query_params.get(SESSION_QUERY_PARAM)
+    if not sid:
+        sid = uuid.uuid4().hex
+        st.query_params[SESSION_QUERY_PARAM] = sid
+    return sid
+
+
+def create_session_store() -> SessionStateStore:
+    """Tạo store theo settings.SESSION_STORE_BACKEND (memory | sqlite)."""
+    backend = (settings.SESSION_STORE_BACKEND or "memory").strip().lower()
+    if backend == "sqlite":
+        from stores.sql_session_store import SqlSessionStateStore
+        return SqlSessionStateStore(
+            settings.SESSION_DB_URL,
+            get_session_id(),
+            page_size=settings.SESSION_HISTORY_PAGE_SIZE,
+            max_in_memory=settings.SESSION_MAX_IN_MEMORY_MESSAGES,
+        )
+    return SessionStateStore()
@@ -1,9 +1,6 @@
 # infra/stores/session_state_store.py
-from dataclasses import dataclass
 import streamlit as st
-from dataclasses import dataclass, field
-from typing import Dict
-from git import List
+from typing import Dict, FrozenSet, List, Optional
 
 
 SESSION_KEYS = {
@@ -12,18 +9,102 @@ SESSION_KEYS = {
     "fixed_code": "fixed_code",
     "chat_messages": "chat_messages",
     "model": "model",
+    "token_counts": "token_counts",
+    "history_summary": "history_summary",
+    "summary_upto": "summary_upto",
 }
 
-@dataclass
+# Các field được store lưu lại → gán giá trị khác sẽ đánh dấu dirty
+TRACKED_FIELDS = ("origin_code", "language", "fixed_code", "chat_messages", "model", "history_summary", "summary_upto")
+_MISSING = object()
+
+
 class SessionState:
-    origin_code: str = ""
-    language: str = "text"
-    fixed_code: str = ""
-    chat_messages: List[Dict[str, str]] = field(default_factory=list)
-    model: str = ""  
+    """
+    State của phiên, có theo dõi field nào đã đổi (dirty) để store chỉ ghi phần thay đổi.
+    - Gán lại cùng giá trị không làm dirty → rerun không có thay đổi thì store.set() không ghi gì.
+    - chat_messages là copy-on-write: list nhận từ store có thể đang dùng chung, thêm message qua
+      append_message() (copy 1 lần rồi mới sửa) thay vì .append() trực tiếp.
+    """
+    __slots__ = TRACKED_FIELDS + ("token_counts", "messages_before", "_dirty", "_owns_messages")
+
+    def __init__(
+        self,
+        origin_code: str = "",
+        language: str = "text",
+        fixed_code: str = "",
+        chat_messages: Optional[List[Dict[str, str]]] = None,
+        model: str = "",
+        token_counts: Optional[Dict[str, int]] = None,
+        messages_before: int = 0,
+        history_summary: str = "",
+        summary_upto: int = 0,
+    ):
+        init = object.__setattr__
+        init(self, "origin_code", origin_code)
+        init(self, "language", language)
+        init(self, "fixed_code", fixed_code)
+        init(self, "chat_messages", chat_messages if chat_messages is not None else [])
+        init(self, "model", model)
+        # Cache số token theo hash nội dung message (TokenBudgeter), đi cùng chat_messages
+        init(self, "token_counts", token_counts if token_counts is not None else {})
+        # Số message cũ hơn chat_messages chưa nạp vào RAM (store phân trang); 0 = đã đủ lịch sử
+        init(self, "messages_before", messages_before)
+        # Tóm tắt cuốn chiếu các message cũ: history_summary phủ các message có chỉ số tuyệt đối < summary_upto
+        init(self, "history_summary", history_summary)
+        init(self, "summary_upto", summary_upto)
+        init(self, "_dirty", set())
+        init(self, "_owns_messages", chat_messages is None)
+
+    def __setattr__(self, name: str, value) -> None:
+        if name in TRACKED_FIELDS:
+            old = getattr(self, name, _MISSING)
+            if old is value or old == value:
+                return
+            self._dirty.add(name)
+            if name == "chat_messages":
+                object.__setattr__(self, "_owns_messages", False)
+        object.__setattr__(self, name, value)
+
+    def __repr__(self) -> str:
+        return (
+            f"SessionState(language={self.language!r}, model={self.model!r}, "
+            f"messages={len(self.chat_messages)}, dirty={sorted(self._dirty)})"
+        )
+
+    @property
+    def dirty(self) -> FrozenSet[str]:
+        return frozenset(self._dirty)
+
+    def mark_clean(self, *fields: str) -> None:
+        """
+        Gọi sau khi store đã ghi (mặc định: mọi field). List message lúc này dùng chung với store
+        → lần sửa sau phải copy.
+        """
+        if fields:
+            self._dirty.difference_update(fields)
+        else:
+            self._dirty.clear()
+        if not fields or "chat_messages" in fields:
+            object.__setattr__(self, "_owns_messages", False)
+
+    def append_message(self, role: str, content: str) -> None:
+        if not self._owns_messages:
+            object.__setattr__(self, "chat_messages", list(self.chat_messages))
+            object.__setattr__(self, "_owns_messages", True)
+        self.chat_messages.append({"role": role, "content": content})
+        self._dirty.add("chat_messages")
+
+    def clear_chat(self) -> None:
+        """Xóa lịch sử chat cùng bản tóm tắt của nó."""
+        self.chat_messages = []
+        self.history_summary = ""
+        self.summary_upto = 0
 
     
 class SessionStateStore:
+    """Store mặc định: chỉ giữ state trong st.session_state (mất khi restart)."""
+
     def get(self) -> SessionState:
         return SessionState(
             origin_code=st.session_state.get(SESSION_KEYS["origin_code"], ""),
@@ -31,11 +112,17 @@ class SessionStateStore:
             fixed_code=st.session_state.get(SESSION_KEYS["fixed_code"], ""),
             chat_messages=st.session_state.get(SESSION_KEYS["chat_messages"], []),
             model=st.session_state.get(SESSION_KEYS["model"], ""),
+            token_counts=st.session_state.setdefault(SESSION_KEYS["token_counts"], {}),
+            history_summary=st.session_state.get(SESSION_KEYS["history_summary"], ""),
+            summary_upto=st.session_state.get(SESSION_KEYS["summary_upto"], 0),
         )
 
     def set(self, state: SessionState) -> None:
-        st.session_state[SESSION_KEYS["origin_code"]] = state.origin_code
-        st.session_state[SESSION_KEYS["language"]] = state.language
-        st.session_state[SESSION_KEYS["fixed_code"]] = state.fixed_code
-        st.session_state[SESSION_KEYS["chat_messages"]] = state.chat_messages
-        st.session_state[SESSION_KEYS["model"]] = state.model
+        """Chỉ ghi các field dirty; token_counts là dict dùng chung (setdefault) nên không cần ghi lại."""
+        for name in state.dirty:
+            st.session_state[SESSION_KEYS[name]] = getattr(state, name)
+        state.mark_clean()
+
+    def load_older_messages(self, state: SessionState, limit: int = 0) -> int:
+        """Toàn bộ lịch sử đã nằm trong RAM → không có gì để nạp thêm."""
+        return 0
@@ -0,0 +1,205 @@
+# stores/sql_session_store.py
+import time
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+from sqlalchemy import Index, delete, func, inspect, text, update
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+
+from config.logging import logger
+from stores.session_state_store import SESSION_KEYS, SessionState, SessionStateStore
+from utils.resource_cache import resource_cache
+
+# Các field scalar của SessionState được lưu vào bảng chat_session
+_SCALAR_FIELDS = ("origin_code", "language", "fixed_code", "model", "history_summary", "summary_upto")
+_SNAPSHOT_KEY = "_sql_session_snapshot"
+
+
+class SessionRecord(SQLModel, table=True):
+    __tablename__ = "chat_session"
+
+    id: str = Field(primary_key=True)
+    origin_code: str = ""
+    language: str = "text"
+    fixed_code: str = ""
+    model: str = ""
+    history_summary: str = ""
+    summary_upto: int = 0
+    updated_at: float = Field(default_factory=time.time)
+
+
+class MessageRecord(SQLModel, table=True):
+    __tablename__ = "chat_message"
+    __table_args__ = (Index("ix_chat_message_session_seq", "session_id", "seq", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: str
+    seq: int                      # thứ tự message trong phiên, bắt đầu từ 0
+    role: str
+    content: str
+    created_at: float = Field(default_factory=time.time)
+
+
+class SessionDB:
+    """Engine SQLite dùng chung cho mọi phiên (cache process-wide qua resource_cache)."""
+
+    def __init__(self, db_url: str):
+        self.engine = create_engine(db_url, connect_args={"check_same_thread": False})
+        SQLModel.metadata.create_all(self.engine, tables=[SessionRecord.__table__, MessageRecord.__table__])
+        self._add_missing_columns()
+
+    def _add_missing_columns(self) -> None:
+        """DB tạo bởi phiên bản cũ → thêm các cột mới của chat_session (create_all không sửa bảng đã có)."""
+        existing = {c["name"] for c in inspect(self.engine).get_columns(SessionRecord.__tablename__)}
+        missing = [c for c in SessionRecord.__table__.columns if c.name not in existing]
+        if not missing:
+            return
+        with self.engine.begin() as conn:
+            for column in missing:
+                default = getattr(SessionState(), column.name, "")
+                conn.execute(text(
+                    f"ALTER TABLE {SessionRecord.__tablename__} ADD COLUMN {column.name} "
+                    f"{column.type.compile(self.engine.dialect)} NOT NULL DEFAULT {default!r}"
+                ))
+        logger.info(f"[session] Thêm cột vào {SessionRecord.__tablename__}: {', '.join(c.name for c in missing)}")
+
+    def close(self) -> None:
+        self.engine.dispose()
+
+
+def get_session_db(db_url: str) -> SessionDB:
+    return resource_cache.get_or_create("session_db", db_url, lambda: SessionDB(db_url))
+
+
+class SqlSessionStateStore(SessionStateStore):
+    """
+    Store SQLite cho SessionState, cùng interface với SessionStateStore.
+    - Nạp lịch sử theo trang (page_size message mới nhất), trang cũ hơn nạp khi cần (load_older_messages).
+    - set() so với snapshot lần ghi trước: chỉ UPDATE cột scalar đã đổi và INSERT message mới thêm vào cuối.
+    - RAM mỗi phiên giữ tối đa max_in_memory message; phần cũ hơn chỉ nằm trong DB.
+    Snapshot để trong st.session_state → rerun không đọc lại DB.
+    """
+
+    def __init__(self, db_url: str, session_id: str, *, page_size: int = 50, max_in_memory: int = 200):
+        self.db = get_session_db(db_url)
+        self.session_id = session_id
+        self.page_size = max(1, page_size)
+        self.max_in_memory = max(self.page_size, max_in_memory)
+
+    # --- snapshot (bản đã ghi gần nhất, nằm trong st.session_state) ---
+    def _snapshot(self) -> Dict[str, Any]:
+        snap = st.session_state.get(_SNAPSHOT_KEY)
+        if snap is None or snap.get("session_id") != self.session_id:
+            snap = self._load()
+            st.session_state[_SNAPSHOT_KEY] = snap
+        return snap
+
+    def _load(self) -> Dict[str, Any]:
+        with Session(self.db.engine) as session:
+            row = session.get(SessionRecord, self.session_id)
+            total = session.exec(
+                select(func.count()).select_from(MessageRecord).where(MessageRecord.session_id == self.session_id)
+            ).one()
+            page = session.exec(
+                select(MessageRecord)
+                .where(MessageRecord.session_id == self.session_id)
+                .order_by(MessageRecord.seq.desc())
+                .limit(self.page_size)
+            ).all()
+        messages = [{"role": m.role, "content": m.content} for m in reversed(page)]
+        source = row if row is not None else SessionState()
+        snap: Dict[str, Any] = {f: getattr(source, f) for f in _SCALAR_FIELDS}
+        snap.update(
+            session_id=self.session_id,
+            exists=row is not None,
+            messages=messages,
+            messages_before=total - len(messages),
+        )
+        logger.info(f"[session] Nạp phiên {self.session_id}: {len(messages)}/{total} message")
+        return snap
+
+    # --- interface store ---
+    def get(self) -> SessionState:
+        snap = self._snapshot()
+        return SessionState(
+            origin_code=snap["origin_code"],
+            language=snap["language"],
+            fixed_code=snap["fixed_code"],
+            model=snap["model"],
+            chat_messages=snap["messages"],  # dùng chung, SessionState copy-on-write khi thêm message
+            messages_before=snap["messages_before"],
+            history_summary=snap["history_summary"],
+            summary_upto=snap["summary_upto"],
+            token_counts=st.session_state.setdefault(SESSION_KEYS["token_counts"], {}),
+        )
+
+    def set(self, state: SessionState) -> None:
+        """Ghi các field dirty trong 1 transaction; không có gì dirty → không đụng DB."""
+        dirty = state.dirty
+        if not dirty:
+            return
+        snap = self._snapshot()
+        changed = {f: getattr(state, f) for f in _SCALAR_FIELDS if f in dirty}
+        appended: List[Dict[str, str]] = []
+        rewrite = False
+        if "chat_messages" in dirty:
+            old, cur = snap["messages"], state.chat_messages
+            if len(cur) >= len(old) and cur[:len(old)] == old:
+                appended = cur[len(old):]
+            else:
+                rewrite = True  # lịch sử bị thay (vd. Clear / đổi code gốc) → ghi lại cả phiên
+
+        base_seq = 0 if rewrite else snap["messages_before"] + len(snap["messages"])
+        with Session(self.db.engine) as session:
+            if not snap["exists"]:
+                session.add(SessionRecord(id=self.session_id, **{f: getattr(state, f) for f in _SCALAR_FIELDS}))
+            elif changed:
+                session.execute(
+                    update(SessionRecord)
+                    .where(SessionRecord.id == self.session_id)
+                    .values(updated_at=time.time(), **changed)
+                )
+            if rewrite:
+                session.execute(delete(MessageRecord).where(MessageRecord.session_id == self.session_id))
+                appended = state.chat_messages
+            for i, m in enumerate(appended):
+                session.add(MessageRecord(
+                    session_id=self.session_id, seq=base_seq + i, role=m["role"], content=m["content"]
+                ))
+            session.commit()
+
+        if rewrite:
+            state.messages_before = 0
+        # Giới hạn số message trong RAM: phần cũ hơn chỉ còn trong DB
+        overflow = len(state.chat_messages) - self.max_in_memory
+        if overflow > 0:
+            state.chat_messages = state.chat_messages[overflow:]
+            state.messages_before += overflow
+
+        snap.update({f: getattr(state, f) for f in _SCALAR_FIELDS})
+        snap.update(exists=True, messages=state.chat_messages, messages_before=state.messages_before)
+        state.mark_clean()
+
+    def load_older_messages(self, state: SessionState, limit: int = 0) -> int:
+        """Nạp thêm 1 trang message cũ hơn vào đầu state.chat_messages; trả về số message đã nạp."""
+        if state.messages_before <= 0:
+            return 0
+        limit = limit or self.page_size
+        first_seq = state.messages_before
+        with Session(self.db.engine) as session:
+            page = session.exec(
+                select(MessageRecord)
+                .where(MessageRecord.session_id == self.session_id, MessageRecord.seq < first_seq)
+                .order_by(MessageRecord.seq.desc())
+                .limit(limit)
+            ).all()
+        older = [{"role": m.role, "content": m.content} for m in reversed(page)]
+        state.messages_before = max(0, first_seq - len(older))
+        snap = self._snapshot()
+        snap.update(messages=older + snap["messages"], messages_before=state.messages_before)
+        # Trang cũ đã có trong DB → không tính là thay đổi cần ghi
+        was_dirty = "chat_messages" in state.dirty
+        state.chat_messages = older + state.chat_messages
+        if not was_dirty:
+            state.mark_clean("chat_messages")
+        return len(older)
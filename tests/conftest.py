@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+class _WordEncoding:
+    """Encoding giả: 1 token mỗi từ → test không cần tải file encoding của tiktoken (chạy offline)."""
+    name = "test-words"
+
+    def encode(self, text: str):
+        return (text or "").split()
+
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    import chat.chat_conversasion as conversation
+    import chat.llm.fake_client as fake_client
+    import utils.tokens as tokens
+    encoding = _WordEncoding()
+    for module in (tokens, conversation, fake_client):
+        monkeypatch.setattr(module, "get_encoding", lambda model: encoding)
+    return encoding
+
+
+@pytest.fixture
+def session_state():
+    """st.session_state (bare mode) sạch cho mỗi test."""
+    import streamlit as st
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    yield st.session_state
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+
+
+class EchoSummaryClient:
+    """ChatClient tối giản: chat_completion trả lại tóm tắt cố định, ghi lại messages đã nhận."""
+
+    def __init__(self, text: str = "tóm tắt"):
+        self.text = text
+        self.calls = []
+
+    def chat_completion(self, *, model, messages, **kwargs):
+        self.calls.append(SimpleNamespace(model=model, messages=messages, kwargs=kwargs))
+        return self.text
+
+
+@pytest.fixture
+def summary_client():
+    return EchoSummaryClient()
@@ -0,0 +1,23 @@
+from chat.answer_cache import RuleAnswerCache
+from retriever.pinecone.rule.base import RuleSnippet
+
+OLD = [RuleSnippet("Tên biến phải rõ nghĩa.", "naming.md", 0.9)]
+NEW = [RuleSnippet("Tên biến dùng snake_case, rõ nghĩa.", "naming.md", 0.9)]
+
+
+def test_changed_rules_miss_without_invalidate():
+    # Import ở process khác (run_import.py) không gọi invalidate → snippet đổi vẫn phải miss
+    cache = RuleAnswerCache()
+    cache.put(language="python", question="Đặt tên biến?", snippets=OLD, answer="Rõ nghĩa.")
+    assert cache.get(language="Python", question="  đặt tên biến ", snippets=OLD) == "Rõ nghĩa."
+    assert cache.get(language="python", question="Đặt tên biến?", snippets=NEW) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_invalidate_only_touches_language():
+    cache = RuleAnswerCache()
+    cache.put(language="python", question="q", snippets=OLD, answer="py")
+    cache.put(language="java", question="q", snippets=OLD, answer="java")
+    cache.invalidate("python")
+    assert cache.get(language="python", question="q", snippets=OLD) is None
+    assert cache.get(language="java", question="q", snippets=OLD) == "java"
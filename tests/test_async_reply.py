@@ -0,0 +1,125 @@
+import asyncio
+import inspect
+import json
+import time
+from types import SimpleNamespace
+
+from streamlit import type_util
+
+from chat.answer_cache import RuleAnswerCache
+from chat.chat_conversasion import ChatConversation
+from chat.llm.fake_client import FakeAsyncChatClient, _chunk
+from chat.llm.streaming import AsyncChatStream
+from config.env import settings
+from retriever.fake.rule.rule_retriever import FakeRuleRetriever
+from stores.session_state_store import SessionState, SessionStateStore
+
+CODE = "def total(xs):\n    s = 0\n    for x in xs:\n        s += x\n    return s\n"
+PATCH = "<<<<<<< SEARCH\n    s = 0\n=======\n    total_sum = 0\n>>>>>>> REPLACE"
+
+
+class _MemoryStore(SessionStateStore):
+    def __init__(self, state: SessionState):
+        self._state = state
+
+    def get(self) -> SessionState:
+        return self._state
+
+    def set(self, state: SessionState) -> None:
+        self._state = state
+        state.mark_clean()
+
+
+async def _aiter(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class _ScriptedAsyncClient(FakeAsyncChatClient):
+    """Lời gọi có tool trả lần lượt các lượt định sẵn; mỗi lời gọi không stream chờ `delay` và đếm số lời gọi đồng thời."""
+
+    def __init__(self, *turns, delay=0.0):
+        super().__init__()
+        self.turns = list(turns)
+        self.requests = []
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+    async def chat_completion_stream(self, *, model, messages, tools=None, tool_choice=None, **kwargs):
+        self.requests.append(SimpleNamespace(messages=list(messages), tool_choice=tool_choice))
+        turn = self.turns.pop(0)
+        if isinstance(turn, str):
+            chunks = [_chunk(content=turn)]
+        else:
+            chunks = [_chunk(tool_calls=[
+                SimpleNamespace(index=i, id=f"call_{i}", type="function",
+                                function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+                for i, (name, args) in enumerate(turn)
+            ])]
+        return AsyncChatStream(_aiter(chunks), started_at=time.perf_counter(), label="test")
+
+    async def chat_completion(self, *, model, messages, tools=None, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        system = messages[0].content or ""
+        if "SEARCH" in system:
+            return PATCH
+        return await super().chat_completion(model=model, messages=messages, tools=tools, **kwargs)
+
+
+def _conversation(client, *, summary_mode="local", retriever=None, **state):
+    state = SessionState(origin_code=CODE, model="gpt-4o-mini", **state)
+    return ChatConversation(
+        client=None, state_store=_MemoryStore(state), rule_retriever=retriever or FakeRuleRetriever(),
+        answer_cache=RuleAnswerCache(), summary_mode=summary_mode, fix_output_mode="patch",
+        async_client_factory=lambda: client,
+    )
+
+
+def test_speculative_summary_overlaps_fix_call(monkeypatch, word_tokens):
+    monkeypatch.setattr(settings, "INTENT_ROUTER_ENABLED", True)
+    client = _ScriptedAsyncClient(delay=0.05)
+    conv = _conversation(client, summary_mode="speculative", language="python")
+    text, state, used_tool = asyncio.run(conv.areply(question="Sửa lỗi trong hàm này giúp mình"))
+    assert client.max_in_flight == 2                  # fix + tóm tắt dự kiến cùng lúc
+    assert text.startswith("✅ Tôi đã thực hiện chỉnh sửa") and used_tool
+    assert "total_sum = 0" in state.fixed_code
+    assert client.closed                              # client async đóng khi lượt kết thúc
+
+
+def test_async_tool_loop_matches_sync_flow(monkeypatch, word_tokens, tmp_path):
+    monkeypatch.setattr(settings, "INTENT_ROUTER_ENABLED", False)
+    rules = tmp_path / "python_naming.md"
+    rules.write_text("Tên biến phải rõ nghĩa, không dùng tên một chữ cái như s hay x.", encoding="utf-8")
+    retriever = FakeRuleRetriever()
+    retriever.load_rules_file(str(rules), language="python")
+    client = _ScriptedAsyncClient(
+        [("run_fix", {"fix_instructions": ["đổi tên biến s"]}), ("search_rule", {"query": "đặt tên biến", "language": "python"})],
+        "Rule: tên biến phải rõ nghĩa.",
+    )
+    conv = _conversation(client, retriever=retriever, language="python")
+    text, state, used_tool = asyncio.run(conv.areply(question="Sửa tên biến và cho mình biết rule đặt tên"))
+    assert text.startswith("✅ Tôi đã thực hiện chỉnh sửa") and text.endswith("Rule: tên biến phải rõ nghĩa.")
+    assert used_tool and "total_sum = 0" in state.fixed_code
+    first, second = client.requests
+    assert (first.tool_choice, second.tool_choice) == ("auto", "none")
+    assert [m.tool_call_id for m in second.messages if m.role == "tool"] == ["call_0", "call_1"]
+
+
+def test_streamlit_runs_async_turn_on_its_own_loop(monkeypatch, word_tokens):
+    monkeypatch.setattr(settings, "INTENT_ROUTER_ENABLED", False)
+    client = _ScriptedAsyncClient("Hàm cộng tổng các phần tử.")
+    turn = _conversation(client, language="python").areply_stream(question="Hàm này làm gì?")
+    stream = aiter(turn)
+    assert inspect.isasyncgen(stream)                 # st.write_stream chỉ nhận async generator
+    assert "".join(type_util.async_generator_to_sync(stream)) == "Hàm cộng tổng các phần tử."
+    assert turn.text == "Hàm cộng tổng các phần tử." and not turn.used_tool and client.closed
@@ -0,0 +1,90 @@
+import ast
+
+from utils.code_chunks import plan_chunked_fix, select_relevant_chunks, split_code_chunks, stitch_chunks
+
+
+def _module(helpers: int = 40) -> str:
+    parts = [
+        "def compute_total(values):\n"
+        "    total = 0\n"
+        "    for v in values:\n"
+        "        total += v\n"
+        "    return total\n"
+    ]
+    for i in range(helpers):
+        parts.append(
+            f"def report_{i}(rows):\n"
+            f"    values = [r * {i} for r in rows]\n"
+            f"    subtotal = compute_total(values)\n"
+            f"    scaled = subtotal / max(1, len(rows))\n"
+            f"    label = 'report {i}'\n"
+            f"    print(label, scaled)\n"
+            f"    return scaled\n"
+        )
+    for i in range(12):
+        parts.append(f"def unrelated_{i}(x):\n    y = x + {i}\n    return y * 2\n")
+    return "\n".join(parts)
+
+
+CODE = _module()
+
+
+def _chunks():
+    return split_code_chunks(CODE, "python", max_chunk_lines=120)
+
+
+def test_fixture_is_large_and_parses():
+    assert len(CODE.splitlines()) >= 365
+    ast.parse(CODE)
+
+
+def test_local_edit_selects_only_the_named_function():
+    selected = select_relevant_chunks(_chunks(), "Thêm type hints cho compute_total")
+    assert [c.name for c in selected] == ["def compute_total"]
+
+
+def test_rename_selects_every_call_site_or_falls_back():
+    instructions = "rename compute_total to calc_total"
+    selected = select_relevant_chunks(_chunks(), instructions)
+    callers = [c for c in _chunks() if "compute_total" in c.text]
+    assert len(callers) == 41 and selected == callers
+
+    # 41/53 hàm phải sửa → vượt max_fraction → fix cả file thay vì ghép 1 chunk đã đổi tên
+    assert plan_chunked_fix(CODE, "python", instructions, min_lines=300) is None
+
+
+def test_new_name_in_instructions_is_cross_cutting():
+    selected = select_relevant_chunks(_chunks(), "Đổi compute_total thành sum_values và cập nhật nơi gọi")
+    assert len(selected) == 41
+
+
+def test_line_reference_selects_containing_chunk():
+    chunks = _chunks()
+    target = next(c for c in chunks if c.name == "def unrelated_3")
+    selected = select_relevant_chunks(chunks, f"Sửa lỗi ở dòng {target.start + 2}")
+    assert selected == [target]
+
+
+def test_stitch_replaces_only_fixed_chunks():
+    chunks = _chunks()
+    target = next(c for c in chunks if c.name == "def unrelated_0")
+    fixed = target.text.replace("y * 2", "y * 3")
+    out = stitch_chunks(CODE, "python", {target: fixed})
+    assert out == CODE.replace("y = x + 0\n    return y * 2", "y = x + 0\n    return y * 3")
+
+
+def test_stitch_rejects_failed_chunk_and_broken_python():
+    chunks = _chunks()
+    a, b = chunks[0], chunks[1]
+    assert stitch_chunks(CODE, "python", {}) is None
+    assert stitch_chunks(CODE, "python", {a: a.text, b: None}) is None
+    assert stitch_chunks(CODE, "python", {a: "def compute_total(values:\n    return 0"}) is None
+
+
+def test_stitch_restores_method_indent():
+    code = "class A:\n" + "".join(f"    def m{i}(self):\n        return {i}\n\n" for i in range(3))
+    chunks = split_code_chunks(code, "python", max_chunk_lines=3)
+    target = next(c for c in chunks if c.name == "def A.m1")
+    out = stitch_chunks(code, "python", {target: "def m1(self):\n    return 10"})
+    assert "    def m1(self):\n        return 10" in out
+    ast.parse(out)
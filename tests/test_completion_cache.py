@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from chat.chat_message import ChatMessage
+from chat.llm.completion_cache import CachedChatClient, CompletionStore, completion_key
+
+MESSAGES = [ChatMessage("system", "Bạn là trợ lý."), ChatMessage("user", "sửa code  \r\n")]
+TOOLS = [{"type": "function", "function": {"name": "run_fix", "parameters": {"type": "object"}}}]
+
+
+def _key(**kwargs):
+    return completion_key(messages=MESSAGES, model="gpt-4o-mini", temperature=0.1, **kwargs)
+
+
+def test_key_covers_every_semantic_kwarg():
+    base = _key(tools=TOOLS, tool_choice="auto")
+    assert _key(tools=TOOLS, tool_choice="auto", parallel_tool_calls=False) != base
+    assert _key(tools=TOOLS, tool_choice="none") != base
+    assert _key(tools=TOOLS, tool_choice={"type": "function", "function": {"name": "run_fix"}}) != base
+    assert _key(tool_choice="auto") != base
+    assert _key(tools=TOOLS, tool_choice="auto", kind="raw") != base
+
+
+def test_key_ignores_non_semantic_fields_and_whitespace():
+    base = _key(tools=TOOLS)
+    assert _key(tools=TOOLS, return_raw=True) == base
+    assert _key(tools=TOOLS, parallel_tool_calls=None) == base       # None = không gửi lên API
+    trimmed = [ChatMessage("system", "Bạn là trợ lý."), ChatMessage("user", "sửa code")]
+    assert completion_key(messages=trimmed, model="gpt-4o-mini", temperature=0.1, tools=TOOLS) == base
+
+
+class _CountingClient:
+    def __init__(self):
+        self.calls = 0
+
+    def chat_completion(self, **kwargs):
+        self.calls += 1
+        return f"answer parallel={kwargs.get('parallel_tool_calls')}"
+
+
+def test_cached_client_separates_parallel_tool_calls(tmp_path):
+    inner = _CountingClient()
+    client = CachedChatClient(inner, CompletionStore(f"sqlite:///{tmp_path / 'c.db'}", max_bytes=1 << 20))
+    kwargs = dict(model="gpt-4o-mini", messages=MESSAGES, temperature=0.1, tools=TOOLS, tool_choice="auto")
+    assert client.chat_completion(**kwargs, parallel_tool_calls=True) == "answer parallel=True"
+    assert client.chat_completion(**kwargs, parallel_tool_calls=False) == "answer parallel=False"
+    assert client.chat_completion(**kwargs, parallel_tool_calls=True) == "answer parallel=True"
+    assert inner.calls == 2 and client.stats.as_dict()["hits"] == 1
+
+
+def test_stats_are_consistent_under_threads(tmp_path):
+    client = CachedChatClient(_CountingClient(), CompletionStore(f"sqlite:///{tmp_path / 'c.db'}", max_bytes=1 << 20))
+    client.chat_completion(model="m", messages=MESSAGES, temperature=0.0)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: client.chat_completion(model="m", messages=MESSAGES, temperature=0.0), range(200)))
+    stats = client.stats.as_dict()
+    assert (stats["hits"], stats["misses"]) == (200, 1)
+
+
+class _AsyncCountingClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def chat_completion(self, **kwargs):
+        self.calls += 1
+        return "fixed"
+
+    async def aclose(self):
+        pass
+
+
+def test_async_client_shares_cache_with_sync(tmp_path):
+    import asyncio
+
+    from chat.llm.completion_cache import CachedAsyncChatClient
+
+    store = CompletionStore(f"sqlite:///{tmp_path / 'c.db'}", max_bytes=1 << 20)
+    kwargs = dict(model="gpt-4o-mini", messages=MESSAGES, temperature=0.1)
+    sync_inner = _CountingClient()
+    CachedChatClient(sync_inner, store).chat_completion(**kwargs)
+    inner = _AsyncCountingClient()
+    client = CachedAsyncChatClient(inner, store)
+    assert asyncio.run(client.chat_completion(**kwargs)) == "answer parallel=None"   # key chung với bản sync
+    assert asyncio.run(client.chat_completion(**kwargs, tools=TOOLS)) == "fixed"
+    assert inner.calls == 1 and client.stats.as_dict()["hits"] == 1
@@ -0,0 +1,79 @@
+from chat.chat_conversasion import ChatConversation
+from chat.history_summary import (
+    HistorySummary,
+    apply_history_summary,
+    plan_history_fold,
+    unsummarized_messages,
+)
+from stores.session_state_store import SessionState
+from stores.sql_session_store import SqlSessionStateStore
+
+
+def _messages(n, start=0):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(start, start + n)]
+
+
+def test_no_fold_when_budget_dropped_nothing():
+    state = SessionState(chat_messages=_messages(30))
+    assert plan_history_fold(state, dropped=0, keep_recent=6) is None
+
+
+def test_fold_keeps_recent_and_covers_dropped_prefix():
+    state = SessionState(chat_messages=_messages(12))
+    fold = plan_history_fold(state, dropped=2, keep_recent=6)
+    assert (fold.start, fold.upto) == (0, 6)
+    assert fold.messages == _messages(6)
+
+    # Budget bỏ nhiều hơn phần ngoài keep_recent → gộp ít nhất toàn bộ phần đã bị bỏ
+    fold = plan_history_fold(state, dropped=9, keep_recent=6)
+    assert (fold.start, fold.upto) == (0, 9)
+
+
+def test_fold_starts_after_existing_summary():
+    state = SessionState(chat_messages=_messages(12), history_summary="cũ", summary_upto=4)
+    assert unsummarized_messages(state) == _messages(8, start=4)
+    fold = plan_history_fold(state, dropped=1, keep_recent=2)
+    assert (fold.previous_summary, fold.start, fold.upto) == ("cũ", 4, 10)
+
+
+def test_apply_rejects_summary_when_history_was_replaced():
+    state = SessionState(chat_messages=_messages(8))
+    summary = HistorySummary("tóm tắt", start=0, upto=4, anchor="message 3")
+    state.chat_messages = _messages(8, start=100)
+    assert not apply_history_summary(state, summary)
+    assert state.summary_upto == 0
+
+
+def test_summary_still_applies_after_paged_reload(tmp_path, session_state, summary_client):
+    db_url = f"sqlite:///{tmp_path / 'session.db'}"
+
+    def open_store():
+        session_state.clear()   # reload trang / restart app → snapshot đọc lại từ DB
+        return SqlSessionStateStore(db_url, "paged", page_size=4, max_in_memory=4)
+
+    store = open_store()
+    state = store.get()
+    for m in _messages(12):
+        state.append_message(m["role"], m["content"])
+    store.set(state)
+    assert (len(state.chat_messages), state.messages_before) == (4, 8)
+
+    store = open_store()
+    state = store.get()
+    assert (state.messages_before, state.summary_upto) == (8, 0)
+
+    # Prompt vừa ngân sách (dropped=0) nhưng 8 message chưa tóm tắt nằm ngoài RAM → vẫn phải gộp, từ summary_upto
+    conv = ChatConversation(client=summary_client, state_store=store)
+    summary = conv.summarize_history(state, dropped=0)
+    assert summary is not None and (summary.start, summary.upto) == (0, 8)
+    transcript = summary_client.calls[0].messages[-1].content
+    assert "message 0" in transcript and "message 7" in transcript and "message 8" not in transcript
+
+    # Kết quả tóm tắt áp ở lần rerun sau (state đọc lại từ store)
+    state = store.get()
+    assert apply_history_summary(state, summary)
+    store.set(state)
+
+    state = open_store().get()
+    assert (state.history_summary, state.summary_upto) == ("tóm tắt", 8)
+    assert conv.summarize_history(state, dropped=0) is None
@@ -0,0 +1,139 @@
+from pathlib import Path
+
+import pytest
+
+from config.env import settings
+from retriever.chunking import source_path_for
+from retriever.fake.rule.rule_retriever import FakeRuleRetriever
+from retriever.ingest import IngestOptions, discover_rule_files, ingest_roots, ingest_rule_files
+from retriever.manifest import get_ingest_manifest
+
+RULES = "\n\n".join(f"Rule {i}: tên biến phải rõ nghĩa, quy tắc số {i}." for i in range(12))
+
+
+class _EmbeddingRetriever(FakeRuleRetriever):
+    """FakeRuleRetriever + embedding giả để chạy ingest thật (không mạng)."""
+
+    def __init__(self):
+        super().__init__(index_name="test-rules")
+        self.embedded = 0
+        self.embedding = self
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [[float(len(t))] for t in texts]
+
+    def stored(self, language):
+        return {doc.metadata["source_path"] for doc, _ in self._chunks.get(language, {}).values()}
+
+
+@pytest.fixture
+def manifest_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "INGEST_MANIFEST_DB_URL", f"sqlite:///{tmp_path / 'manifest.db'}")
+    return get_ingest_manifest()
+
+
+@pytest.fixture
+def rules_dir(tmp_path):
+    root = tmp_path / "rules"
+    (root / "java").mkdir(parents=True)
+    (root / "java" / "naming.md").write_text(RULES, encoding="utf-8")
+    return root
+
+
+def _options(tmp_path, name, **kwargs):
+    return IngestOptions(checkpoint_path=str(tmp_path / f"{name}.json"), chunk_size=80, chunk_overlap=0, **kwargs)
+
+
+def test_source_path_is_posix_relative_to_root(rules_dir, tmp_path, monkeypatch):
+    path = rules_dir / "java" / "naming.md"
+    assert source_path_for(path, rules_dir) == "java/naming.md"
+    assert source_path_for(path) == "naming.md"
+    monkeypatch.chdir(tmp_path)
+    assert source_path_for(Path("rules/java/naming.md"), Path("rules")) == "java/naming.md"
+
+
+def test_reingest_from_other_cwd_does_not_duplicate(rules_dir, tmp_path, monkeypatch, manifest_db):
+    retriever = _EmbeddingRetriever()
+
+    monkeypatch.chdir(rules_dir.parent)
+    first = ingest_rule_files(
+        retriever, discover_rule_files(["rules"]), _options(tmp_path, "a"), roots=ingest_roots(["rules"])
+    )
+    assert first.chunks > 0 and first.files == 1
+
+    # Thư mục chạy khác, đường dẫn tuyệt đối, checkpoint mới → vẫn cùng source_path/chunk_id
+    monkeypatch.chdir(rules_dir / "java")
+    second = ingest_rule_files(
+        retriever, discover_rule_files([str(rules_dir)]), _options(tmp_path, "b"), roots=ingest_roots([str(rules_dir)])
+    )
+    assert (second.chunks, second.unchanged_chunks) == (0, first.chunks)
+    assert retriever.stored("java") == {"java/naming.md"}
+
+
+def test_import_rules_from_txt_matches_ingest_cli(rules_dir, tmp_path, manifest_db):
+    retriever = _EmbeddingRetriever()
+    path = rules_dir / "java" / "naming.md"
+    report = ingest_rule_files(retriever, [path], _options(tmp_path, "cli", language="java"))
+    assert report.chunks > 0
+
+    # Cùng file qua entry point còn lại (gốc mặc định = thư mục chứa file) → không có chunk mới
+    assert retriever.import_rules_from_txt(str(path), language="java", chunk_size=80, chunk_overlap=0) == 0
+    assert retriever.stored("java") == {"naming.md"}
+
+
+def test_in_flight_batches_are_bounded(tmp_path, monkeypatch, manifest_db):
+    import retriever.ingest as ingest
+
+    root = tmp_path / "many"
+    root.mkdir()
+    for i in range(10):
+        (root / f"python_{i:02d}.txt").write_text(RULES.replace("Rule", f"File {i} rule"), encoding="utf-8")
+    retriever = _EmbeddingRetriever()
+    upserted = []
+    upsert = retriever.upsert_embedded
+    monkeypatch.setattr(retriever, "upsert_embedded", lambda chunks, vectors: (upsert(chunks, vectors), upserted.append(1)))
+
+    # Lúc bắt đầu split 1 file: số batch đã gửi của các file trước − số batch đã upsert xong ≤ max_in_flight
+    outstanding, submitted = [], []
+    split = ingest.split_rules_file
+
+    def _split(*args, **kwargs):
+        chunks = split(*args, **kwargs)
+        outstanding.append(sum(submitted) - len(upserted))
+        submitted.append(-(-len(chunks) // 4))
+        return chunks
+    monkeypatch.setattr(ingest, "split_rules_file", _split)
+
+    report = ingest_rule_files(
+        retriever, discover_rule_files([str(root)]),
+        _options(tmp_path, "bounded", batch_size=4, max_in_flight=3, embed_workers=2, upsert_workers=2),
+    )
+    assert report.files == 10 and not report.failed_files
+    assert len(upserted) == sum(submitted)
+    assert max(outstanding) <= 3
+
+
+def test_failed_file_resumes_from_last_upserted_batch(rules_dir, tmp_path, monkeypatch, manifest_db):
+    path = rules_dir / "java" / "naming.md"
+    options = _options(tmp_path, "resume", language="java", batch_size=4, max_in_flight=1, embed_workers=1, upsert_workers=1)
+    retriever = _EmbeddingRetriever()
+    calls = []
+    upsert = retriever.upsert_embedded
+
+    def _flaky(chunks, vectors):
+        calls.append(len(chunks))
+        if len(calls) == 2:
+            raise ValueError("request sai")   # lỗi không tạm thời → không retry
+        upsert(chunks, vectors)
+    monkeypatch.setattr(retriever, "upsert_embedded", _flaky)
+
+    first = ingest_rule_files(retriever, [path], options)
+    assert first.failed_files == [str(path)] and first.chunks == calls[0]
+
+    monkeypatch.setattr(retriever, "upsert_embedded", upsert)
+    retriever.embedded = 0
+    second = ingest_rule_files(retriever, [path], options)
+    assert second.files == 1 and second.unchanged_chunks == calls[0]
+    assert retriever.embedded == second.chunks   # batch đã upsert ở lần trước không embed lại
+    assert first.chunks + second.chunks == len(retriever._chunks["java"])
@@ -0,0 +1,53 @@
+import pytest
+
+from chat.chat_conversasion import _local_tool_group
+from chat.intent_router import classify_intent, is_negated
+from config.env import settings
+from stores.session_state_store import SessionState
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("Sửa lỗi trong hàm này giúp mình", "run_fix"),
+    ("sua loi va them type hints", "run_fix"),
+    ("Refactor đoạn code cho gọn", "run_fix"),
+    ("Quy tắc đặt tên biến trong dự án là gì", "search_rule"),
+    ("best practices naming convention for python", "search_rule"),
+    ("Tại sao cần sửa hàm này?", "chat"),            # câu hỏi → không tự sửa
+    ("Đừng sửa code, chỉ giải thích", "chat"),        # phủ định
+    ("don't change anything, review it", "chat"),
+    ("update", "chat"),                               # chỉ 1 từ khoá yếu
+    ("Xin chào", "chat"),
+])
+def test_classify_intent(question, intent):
+    assert classify_intent(question).intent == intent
+
+
+def test_confident_prediction_scores():
+    pred = classify_intent("Sửa lỗi trong hàm này giúp mình")
+    assert pred.confidence == 1.0 and pred.scores[0] >= 2
+
+
+def test_negation_handles_dung_vs_dung():
+    assert is_negated("đừng sửa hàm này")
+    assert not is_negated("dùng try/except để sửa lỗi đọc file")
+
+
+def test_local_router_dispatches_fix_only_with_code(monkeypatch):
+    monkeypatch.setattr(settings, "INTENT_ROUTER_ENABLED", True)
+    group = _local_tool_group("Sửa lỗi trong hàm này", SessionState(origin_code="x = 1", language="python"))
+    assert group.name == "run_fix" and group.args == {"fix_instructions": ["Sửa lỗi trong hàm này"]}
+    assert _local_tool_group("Sửa lỗi trong hàm này", SessionState()) is None
+
+
+def test_local_router_never_searches_rules_for_text(monkeypatch):
+    monkeypatch.setattr(settings, "INTENT_ROUTER_ENABLED", True)
+    question = "Quy tắc đặt tên biến là gì"
+    group = _local_tool_group(question, SessionState(origin_code="x = 1", language="java"))
+    assert group.name == "search_rule" and group.args["language"] == "java"
+    # Ngôn ngữ chưa nhận diện ("text") → để model hỏi lại thay vì search rule "text" rỗng
+    assert _local_tool_group(question, SessionState(origin_code="x = 1", language="text")) is None
+
+
+def test_local_router_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "INTENT_ROUTER_ENABLED", False)
+    assert _local_tool_group("Sửa lỗi trong hàm này", SessionState(origin_code="x = 1")) is None
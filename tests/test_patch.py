@@ -0,0 +1,89 @@
+from chat.chat_conversasion import _FIX_REPLY_HEADER, _FIX_REPLY_NO_CHANGES, ChatConversation
+from stores.session_state_store import SessionStateStore
+from utils.patch import PatchBlock, apply_patch, is_no_changes, parse_patch
+
+CODE = "\n".join([
+    "def add(a, b):",
+    "    return a + b",
+    "",
+    "class Calc:",
+    "    def mul(self, a, b):",
+    "        return a * b",
+    "",
+    "    def div(self, a, b):",
+    "        return a / b",
+])
+
+
+def _sr(search, replace):
+    return f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE"
+
+
+def test_parse_search_replace_blocks_in_order():
+    text = "```\n" + _sr("    return a + b", "    return b + a") + "\n" + _sr("x", "y") + "\n```"
+    assert parse_patch(text) == [PatchBlock(["    return a + b"], ["    return b + a"]), PatchBlock(["x"], ["y"])]
+
+
+def test_truncated_block_drops_whole_patch():
+    text = _sr("a", "b") + "\n<<<<<<< SEARCH\nc\n=======\nd"
+    assert parse_patch(text) is None
+
+
+def test_parse_unified_diff_keeps_hunk_start():
+    diff = "--- a/x.py\n+++ b/x.py\n@@ -8,2 +8,2 @@\n     def div(self, a, b):\n-        return a / b\n+        return a // b\n"
+    (block,) = parse_patch(diff)
+    assert block.start == 7
+    assert block.search == ["    def div(self, a, b):", "        return a / b", ""]
+
+
+def test_no_changes_only_as_standalone_line():
+    assert parse_patch("NO_CHANGES") == []
+    assert parse_patch("```\nNO_CHANGES\n```") == []
+    assert parse_patch("  `NO_CHANGES`.") == []
+    assert parse_patch("Tôi nghĩ NO_CHANGES là không đúng, hãy xem lại") is None
+    assert parse_patch("NO_CHANGES_FLAG = True") is None
+    assert not is_no_changes("if not NO_CHANGES:")
+
+
+def test_apply_exact_whitespace_and_reindent():
+    assert apply_patch(CODE, parse_patch(_sr("    return a + b", "    return b + a"))) == CODE.replace("a + b", "b + a")
+    # Trailing space khác → vẫn khớp
+    assert apply_patch(CODE, parse_patch(_sr("    return a + b   ", "    return b + a"))) == CODE.replace("a + b", "b + a")
+    # Model bỏ indent của method → REPLACE được dịch lại đúng indent
+    out = apply_patch(CODE, parse_patch(_sr("def mul(self, a, b):\n    return a * b", "def mul(self, a, b):\n    return b * a")))
+    assert "    def mul(self, a, b):\n        return b * a" in out
+
+
+def test_apply_ambiguous_or_missing_search_fails():
+    dup = CODE + "\n\ndef add2(a, b):\n    return a + b"
+    assert apply_patch(dup, parse_patch(_sr("    return a + b", "    return 0"))) is None
+    assert apply_patch(CODE, parse_patch(_sr("    return a - b - c - d", "    return 0"))) is None
+
+
+def test_apply_uses_hunk_line_to_pick_duplicate():
+    dup = CODE + "\n\ndef add2(a, b):\n    return a + b"
+    diff = "@@ -12,1 +12,1 @@\n-    return a + b\n+    return 0\n"
+    out = apply_patch(dup, parse_patch(diff))
+    assert out.splitlines()[1] == "    return a + b" and out.splitlines()[-1] == "    return 0"
+
+
+def _fix_reply(client):
+    conv = ChatConversation(client=client, state_store=SessionStateStore(), summary_mode="local", fix_output_mode="patch")
+    fixed = []
+    reply = "".join(conv._handle_fix_code_stream(
+        model="gpt-4o-mini", language="python", base_code=CODE, fix_instructions="đổi thứ tự phép cộng",
+        on_fixed=fixed.append,
+    ))
+    return reply, fixed
+
+
+def test_no_changes_reply_does_not_claim_an_edit(summary_client):
+    summary_client.text = "NO_CHANGES"
+    reply, fixed = _fix_reply(summary_client)
+    assert reply == _FIX_REPLY_NO_CHANGES and fixed == []
+
+
+def test_applied_patch_reports_edit(summary_client):
+    summary_client.text = _sr("    return a + b", "    return b + a")
+    reply, fixed = _fix_reply(summary_client)
+    assert reply.startswith(_FIX_REPLY_HEADER) and fixed == [CODE.replace("a + b", "b + a")]
@@ -0,0 +1,57 @@
+from chat.answer_cache import get_rule_answer_cache
+from chat.llm.client_factory import CHAT_CLIENT_KIND, invalidate_chat_client
+from retriever.fake.rule.rule_retriever import FakeRuleRetriever
+from retriever.pinecone.rule.base import RuleSnippet
+from utils.resource_cache import ResourceCache, resource_cache
+
+
+class _Closable:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_lru_eviction_does_not_close_shared_resource():
+    cache = ResourceCache(max_per_kind=1)
+    first = cache.get_or_create("client", "a", _Closable)
+    cache.get_or_create("client", "b", _Closable)
+    assert not first.closed                       # phiên khác có thể vẫn đang dùng
+    assert cache.get_or_create("client", "a", _Closable) is not first
+
+
+def test_invalidate_closes_and_recreates():
+    cache = ResourceCache()
+    first = cache.get_or_create("client", "a", _Closable)
+    cache.invalidate("client", "a")
+    assert first.closed
+    assert cache.get_or_create("client", "a", _Closable) is not first
+
+
+def test_invalidate_chat_client_removes_old_settings_key():
+    key = ("openai", "test-fingerprint")
+    client = resource_cache.get_or_create(CHAT_CLIENT_KIND, key, _Closable)
+    invalidate_chat_client(key)
+    assert client.closed
+    assert resource_cache.get_or_create(CHAT_CLIENT_KIND, key, _Closable) is not client
+    resource_cache.invalidate(CHAT_CLIENT_KIND, key)
+
+
+def test_answer_cache_keyed_by_retriever_config():
+    snippets = [RuleSnippet("Tên biến phải rõ nghĩa.", "python_rules.md", 1.0)]
+    first = FakeRuleRetriever(index_name="answer-cache-test")
+    cache = get_rule_answer_cache(first)
+    cache.put(language="python", question="Đặt tên biến?", snippets=snippets, answer="Rõ nghĩa.")
+
+    # Retriever tạo lại cùng cấu hình → cùng cache; khác index → cache khác
+    again = FakeRuleRetriever(index_name="answer-cache-test")
+    assert get_rule_answer_cache(again) is cache
+    assert get_rule_answer_cache(FakeRuleRetriever(index_name="other-index")) is not cache
+    assert cache.get(language="python", question="đặt tên biến", snippets=snippets) == "Rõ nghĩa."
+
+    # Import rules qua retriever tạo lại vẫn invalidate cache dùng chung (listener đăng ký 1 lần mỗi instance)
+    get_rule_answer_cache(again)
+    again._notify_rules_changed("python")
+    assert cache.get(language="python", question="đặt tên biến", snippets=snippets) is None
+    assert len(again.__dict__["_rules_changed_listeners"]) == 1
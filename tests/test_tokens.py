@@ -0,0 +1,68 @@
+import pytest
+
+from chat.chat_message import ChatMessage
+from config.constant import DEFAULT_PROMPT_TOKEN_BUDGET
+from utils.tokens import TokenBudgeter, get_prompt_token_budget
+
+
+@pytest.mark.parametrize("model, expected", [
+    ("gpt-4", 8192 - 2048),
+    ("gpt-4-0613", 8192 - 2048),
+    ("gpt-4-32k", 32768 - 2048),
+    ("gpt-4-1106-preview", 128000 - 2048),
+    ("GPT-4o-mini", 128000 - 2048),
+    ("gpt-4.1-mini-2025-04-14", 1047576 - 2048),
+    ("o1-mini", 128000 - 2048),
+    ("o1-preview-2024-09-12", 128000 - 2048),
+    ("o1-2024-12-17", 200000 - 2048),
+    ("o3-mini", 200000 - 2048),
+])
+def test_budget_uses_model_context_minus_reserve(model, expected):
+    assert get_prompt_token_budget(model, reserve_output=2048) == expected
+
+
+def test_budget_never_exceeds_context_window():
+    assert get_prompt_token_budget("gpt-4", reserve_output=4096) == 4096 < DEFAULT_PROMPT_TOKEN_BUDGET
+    assert get_prompt_token_budget("gpt-4", reserve_output=10000) == 0
+
+
+def test_unknown_or_unrelated_prefix_uses_default():
+    assert get_prompt_token_budget("my-azure-deployment", reserve_output=2048) == DEFAULT_PROMPT_TOKEN_BUDGET
+    assert get_prompt_token_budget("o10-experimental") == DEFAULT_PROMPT_TOKEN_BUDGET
+
+
+def _msg(role, words):
+    return ChatMessage(role=role, content=" ".join(["w"] * words))
+
+
+def test_fit_keeps_longest_suffix_within_budget(word_tokens):
+    budgeter = TokenBudgeter(model="test")
+    base, user = _msg("system", 10), _msg("user", 5)
+    history = [_msg("user" if i % 2 == 0 else "assistant", 10) for i in range(6)]
+
+    # head: (4+1+10) + (4+1+5) + 3 = 28; mỗi message history = 15 → 70 vừa 2 message
+    out = budgeter.fit(base_message=base, history=history, new_user_message=user, max_turns=10, max_tokens=70)
+    assert out == [base] + history[-2:] + [user]
+    assert (budgeter.last_total, budgeter.last_dropped) == (58, 4)
+
+    out = budgeter.fit(base_message=base, history=history, new_user_message=user, max_turns=3, max_tokens=10_000)
+    assert out == [base] + history[-3:] + [user] and budgeter.last_dropped == 3
+
+
+def test_fit_counts_summary_before_history(word_tokens):
+    budgeter = TokenBudgeter(model="test")
+    base, user, summary = _msg("system", 10), _msg("user", 5), _msg("system", 15)
+    history = [_msg("user", 10) for _ in range(4)]
+    out = budgeter.fit(
+        base_message=base, history=history, new_user_message=user,
+        max_turns=10, max_tokens=70, summary_message=summary,
+    )
+    assert out == [base, summary, history[-1], user] and budgeter.last_dropped == 3
+
+
+def test_token_cache_is_bounded_lru(word_tokens):
+    budgeter = TokenBudgeter(model="test", max_entries=3)
+    messages = [ChatMessage(role="user", content=f"m{i}") for i in range(5)]
+    budgeter.fit(base_message=messages[0], history=messages[1:4], new_user_message=messages[4],
+                 max_turns=10, max_tokens=10_000)
+    assert len(budgeter.cache) == 3
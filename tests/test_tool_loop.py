@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from chat.answer_cache import RuleAnswerCache
+from chat.chat_conversasion import ChatConversation, ReplyStream, _ToolGroup
+from chat.llm.fake_client import FakeChatClient, _chunk
+from chat.llm.streaming import ChatStream
+from config.env import settings
+from retriever.fake.rule.rule_retriever import FakeRuleRetriever
+from stores.session_state_store import SessionState, SessionStateStore
+
+CODE = "def total(xs):\n    s = 0\n    for x in xs:\n        s += x\n    return s\n"
+RULES = "Tên biến phải rõ nghĩa, không dùng tên một chữ cái như s hay x."
+
+
+class _MemoryStore(SessionStateStore):
+    def __init__(self, state: SessionState):
+        self._state = state
+
+    def get(self) -> SessionState:
+        return self._state
+
+    def set(self, state: SessionState) -> None:
+        self._state = state
+        state.mark_clean()
+
+
+class _ScriptedClient(FakeChatClient):
+    """Lời gọi có tool trả lần lượt các lượt định sẵn (text hoặc list tool_call); ghi lại messages + tool_choice."""
+
+    def __init__(self, *turns):
+        super().__init__()
+        self.turns = list(turns)
+        self.requests = []
+
+    def chat_completion_stream(self, *, model, messages, tools=None, tool_choice=None, **kwargs):
+        self.requests.append(SimpleNamespace(messages=list(messages), tool_choice=tool_choice))
+        turn = self.turns.pop(0)
+        if isinstance(turn, str):
+            chunks = [_chunk(content=turn)]
+        else:
+            chunks = [_chunk(tool_calls=[
+                SimpleNamespace(index=i, id=f"call_{i}", type="function",
+                                function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+                for i, (name, args) in enumerate(turn)
+            ])]
+        return ChatStream(iter(chunks), started_at=time.perf_counter(), label="test")
+
+    def chat_completion(self, *, model, messages, tools=None, **kwargs):
+        # Prompt fix dạng patch → đổi tên biến s thành total_sum
+        if "SEARCH" in (messages[0].content or ""):
+            return "<<<<<<< SEARCH\n    s = 0\n=======\n    total_sum = 0\n>>>>>>> REPLACE"
+        return super().chat_completion(model=model, messages=messages, tools=tools, **kwargs)
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    path = tmp_path / "python_naming.md"
+    path.write_text(RULES, encoding="utf-8")
+    r = FakeRuleRetriever()
+    r.load_rules_file(str(path), language="python")
+    return r
+
+
+@pytest.fixture
+def no_local_router(monkeypatch):
+    monkeypatch.setattr(settings, "INTENT_ROUTER_ENABLED", False)
+
+
+def _conversation(client, retriever, **state):
+    state = SessionState(origin_code=CODE, model="gpt-4o-mini", **state)
+    return ChatConversation(
+        client=client, state_store=_MemoryStore(state), rule_retriever=retriever,
+        answer_cache=RuleAnswerCache(), summary_mode="local", fix_output_mode="patch",
+    )
+
+
+def test_search_rule_results_go_back_to_model(retriever, no_local_router, word_tokens):
+    client = _ScriptedClient([("search_rule", {"query": "đặt tên biến", "language": "python"})], "Theo rule: đổi s thành total.")
+    turn = _conversation(client, retriever, language="python").reply_stream(question="Rule đặt tên biến là gì?")
+    assert "".join(turn) == "Theo rule: đổi s thành total."
+
+    first, second = client.requests
+    assert (first.tool_choice, second.tool_choice) == ("auto", "none")   # lời gọi cuối không được gọi tool
+    tool_msg = second.messages[-1]
+    assert tool_msg.role == "tool" and tool_msg.tool_call_id == "call_0"
+    assert "RULES (python)" in tool_msg.content and "không dùng tên một chữ cái" in tool_msg.content
+    assert not turn.used_tool
+
+
+def test_search_rule_without_language_asks_model_to_ask_user(retriever, no_local_router, word_tokens):
+    client = _ScriptedClient([("search_rule", {"query": "đặt tên biến"})], "Bạn dùng ngôn ngữ nào?")
+    turn = _conversation(client, retriever, language="text").reply_stream(question="Rule đặt tên biến là gì?")
+    "".join(turn)
+    assert retriever.queries == 0
+    assert "Chưa biết ngôn ngữ" in client.requests[1].messages[-1].content
+
+
+def test_fix_and_rule_in_one_turn(retriever, no_local_router, word_tokens):
+    client = _ScriptedClient(
+        [("run_fix", {"fix_instructions": ["đổi tên biến s"]}), ("search_rule", {"query": "đặt tên biến", "language": "python"})],
+        "Rule: tên biến phải rõ nghĩa.",
+    )
+    conv = _conversation(client, retriever, language="python")
+    turn = conv.reply_stream(question="Sửa tên biến và cho mình biết rule đặt tên")
+    text = "".join(turn)
+    assert text.startswith("✅ Tôi đã thực hiện chỉnh sửa") and text.endswith("Rule: tên biến phải rõ nghĩa.")
+    assert turn.used_tool and "total_sum = 0" in turn.state.fixed_code
+    tool_msgs = [m for m in client.requests[1].messages if m.role == "tool"]
+    assert [m.tool_call_id for m in tool_msgs] == ["call_0", "call_1"]
+
+
+def test_run_fix_only_round_ends_turn(retriever, no_local_router, word_tokens):
+    client = _ScriptedClient([("run_fix", {"fix_instructions": ["đổi tên biến s"]})])
+    turn = _conversation(client, retriever, language="python").reply_stream(question="Đổi tên biến s")
+    assert "".join(turn).startswith("✅") and len(client.requests) == 1
+
+
+class _ThreadCheckedState(SessionState):
+    __slots__ = ()
+    owner = None
+
+    def __setattr__(self, name, value):
+        assert threading.current_thread() is type(self).owner, f"{name} ghi từ worker thread"
+        super().__setattr__(name, value)
+
+
+def test_tool_groups_on_workers_do_not_write_state(retriever, word_tokens):
+    _ThreadCheckedState.owner = threading.current_thread()
+    state = _ThreadCheckedState(origin_code=CODE, language="python", model="gpt-4o-mini")
+    conv = ChatConversation(client=_ScriptedClient(), state_store=_MemoryStore(state), summary_mode="local",
+                            fix_output_mode="patch")
+    conv._rule_retriever = retriever
+    out, results = ReplyStream(state), {}
+    groups = [
+        _ToolGroup("search_rule", [], {"queries": ["đặt tên biến"], "language": "python"}),
+        _ToolGroup("run_fix", [], {"fix_instructions": ["đổi tên biến s"]}),   # chạy trên _TOOL_EXECUTOR
+    ]
+    text = "".join(conv._tool_round_stream(groups, state=state, question="q", out=out, results=results))
+    assert text.startswith("✅") and out.used_tool and "total_sum = 0" in state.fixed_code
+    assert len(results) == 2 and any("RULES (python)" in r for r in results.values())
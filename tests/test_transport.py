@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import chat.llm.transport as transport
+from chat.chat_message import ChatMessage
+from chat.llm.openai_client import OpenAIChatClient
+from config.env import settings
+
+
+def test_request_timeout_keeps_connect_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CONNECT_TIMEOUT_S", 5)
+    timeout = transport.request_timeout(42.0)
+    assert (timeout.read, timeout.connect) == (42.0, 5)
+    assert transport.request_timeout(2.0).connect == 2.0     # connect không vượt deadline còn lại
+
+
+def test_sdk_calls_pass_httpx_timeout(monkeypatch):
+    client = OpenAIChatClient(api_key="sk-test", max_retries=0)
+    seen = []
+
+    def _create(**kwargs):
+        seen.append(kwargs["timeout"])
+        if kwargs.get("stream"):
+            return iter(())
+        message = SimpleNamespace(content="ok", tool_calls=None, role="assistant")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    monkeypatch.setattr(client.client.chat.completions, "create", _create)
+    assert client.chat_completion(model="gpt-4o-mini", messages=[ChatMessage("user", "hi")]) == "ok"
+    list(client.chat_completion_stream(model="gpt-4o-mini", messages=[ChatMessage("user", "hi")]))
+    assert all(isinstance(t, httpx.Timeout) and t.connect == settings.LLM_CONNECT_TIMEOUT_S for t in seen)
+
+
+class _Chunks:
+    def __init__(self, n):
+        self.items = iter(range(n))
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.items)
+
+    def close(self):
+        self.closed = True
+
+
+def test_stream_deadline_enforced_while_reading(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CALL_DEADLINE_S", 10)
+    clock = iter([0.0, 5.0, 11.0])
+    monkeypatch.setattr(transport.time, "monotonic", lambda: next(clock))
+    chunks = _Chunks(5)
+    read = []
+    with pytest.raises(TimeoutError):
+        for chunk in transport.stream_with_deadline(chunks, started=0.0, label="test"):
+            read.append(chunk)
+    assert read == [0, 1] and chunks.closed
+
+
+def test_stream_within_deadline_reads_everything():
+    chunks = _Chunks(3)
+    started = transport.time.monotonic()
+    assert list(transport.stream_with_deadline(chunks, started=started, label="test")) == [0, 1, 2]
+    assert chunks.closed
+
+
+def test_async_retry_policy_retries_transient_errors(monkeypatch):
+    import asyncio
+
+    from utils.retry import RetryPolicy
+
+    policy = RetryPolicy(label="test", max_retries=2, backoff_base_s=0.0, backoff_max_s=0.0, deadline_s=30)
+    attempts = []
+
+    async def _call(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 2:
+            raise TimeoutError("tạm thời")
+        return "ok"
+
+    assert asyncio.run(policy.acall(_call)) == "ok" and len(attempts) == 2
@@ -0,0 +1,263 @@
+import argparse
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import chat.chat_conversasion as conversation
+from chat.answer_cache import RuleAnswerCache
+from chat.chat_conversasion import ChatConversation
+from chat.history_summary import apply_history_summary
+from chat.llm.fake_client import LATENCY_PROFILES, FakeChatClient
+from config.env import settings
+from retriever.fake.rule.rule_retriever import RETRIEVER_LATENCY_PROFILES, FakeRuleRetriever
+from stores.session_state_store import SessionState, SessionStateStore
+
+RULES_DIR = Path(__file__).resolve().parent
+MODEL = "gpt-4o-mini"
+
+
+# ---------- Dữ liệu kịch bản ----------
+def _python_module(functions: int) -> str:
+    parts = ["import math", "from typing import List", ""]
+    for i in range(functions):
+        parts.append(
+            f"def handler_{i}(values: List[float]) -> float:\n"
+            f"    total = 0\n"
+            f"    for v in values:\n"
+            f"        total += math.sqrt(abs(v)) * {i}\n"
+            f"    return total / len(values)\n"
+        )
+    return "\n".join(parts)
+
+
+MEDIUM_CODE = _python_module(20) + "\ndef average(xs):\n    return sum(xs) / len(xs)\n"
+LARGE_CODE = _python_module(500)
+
+
+def _long_history(pairs: int) -> List[Dict[str, str]]:
+    messages = []
+    for i in range(pairs):
+        messages.append({"role": "user", "content": f"Câu hỏi {i}: hàm handler_{i} xử lý giá trị âm thế nào? " * 4})
+        messages.append({"role": "assistant", "content": f"Trả lời {i}: handler_{i} lấy abs trước khi sqrt. " * 12})
+    return messages
+
+
+class Session(NamedTuple):
+    name: str
+    code: str
+    questions: List[str]
+    history: List[Dict[str, str]] = []
+
+
+SESSIONS = [
+    Session("review", MEDIUM_CODE, ["Review code giúp mình", "Giải thích hàm average"]),
+    Session("fix", MEDIUM_CODE, ["Sửa lỗi chia cho 0 trong hàm average", "Thêm type hints cho toàn bộ hàm"]),
+    Session("rule_search", MEDIUM_CODE, ["Quy tắc đặt tên biến trong python là gì?", "Best practice khi xử lý exception?"]),
+    Session("long_history", MEDIUM_CODE, ["Giải thích lại hàm average", "Hàm handler_3 có vấn đề gì?"], _long_history(40)),
+    Session("large_paste", LARGE_CODE, ["Giải thích hàm handler_250", "Sửa lỗi chia cho 0 trong hàm handler_42"]),
+]
+
+
+# ---------- Đo theo stage ----------
+class _Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = defaultdict(list)   # "session/stage" → ms
+
+    def add(self, key: str, ms: float) -> None:
+        with self.lock:
+            self.samples[key].append(ms)
+
+
+def _timed(recorder: _Recorder, stage: str, fn: Callable) -> Callable:
+    """Bọc hàm để ghi thời gian theo "session/stage" (tool chạy ở thread khác nên session lấy từ _Bench)."""
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            recorder.add(f"{_Bench.session}/{stage}", (time.perf_counter() - started) * 1000)
+    return wrapper
+
+
+class _Bench:
+    session = ""
+
+
+class _MemoryStore(SessionStateStore):
+    """Store trong RAM (benchmark chạy ngoài Streamlit)."""
+
+    def __init__(self, state: SessionState):
+        self._state = state
+
+    def get(self) -> SessionState:
+        return self._state
+
+    def set(self, state: SessionState) -> None:
+        self._state = state
+        state.mark_clean()
+
+
+def _instrument(recorder: _Recorder) -> None:
+    for stage, name in (
+        ("intent", "_local_tool_group"),
+        ("system_context", "_system_context_message"),
+        ("build_messages", "_build_messages_with_budget"),
+    ):
+        setattr(conversation, name, _timed(recorder, stage, getattr(conversation, name)))
+
+
+def _run_session(
+    session: Session, *, client: FakeChatClient, retriever: FakeRuleRetriever, recorder: Optional[_Recorder]
+) -> Dict[str, int]:
+    """Chạy 1 lượt kịch bản (state mới), trả về token gửi/nhận và số lời gọi LLM."""
+    _Bench.session = session.name
+    client.reset()
+    state = SessionState(origin_code=session.code, language="python", model=MODEL, chat_messages=list(session.history))
+    store = _MemoryStore(state)
+    conv = ChatConversation(client=client, state_store=store, rule_retriever=retriever, answer_cache=RuleAnswerCache())
+    if recorder is not None:
+        conv._search_rules = _timed(recorder, "retrieve", conv._search_rules)
+
+    for question in session.questions:
+        started = time.perf_counter()
+        first: Optional[float] = None
+        turn = conv.reply_stream(question=question)
+        for delta in turn:
+            if first is None and delta.strip():
+                first = time.perf_counter()
+        done = time.perf_counter()
+        if recorder is not None:
+            recorder.add(f"{session.name}/reply_total", (done - started) * 1000)
+            recorder.add(f"{session.name}/reply_ttft", ((first or done) - started) * 1000)
+        state = turn.state
+        state.append_message("user", question)
+        state.append_message("assistant", turn.text)
+        store.set(state)
+
+        # Lịch sử không vừa ngân sách token → tóm tắt (main.py chạy nền; ở đây đo đồng bộ)
+        started = time.perf_counter()
+        summary = conv.summarize_history(state, dropped=turn.history_dropped)
+        if summary is not None:
+            apply_history_summary(state, summary)
+            if recorder is not None:
+                recorder.add(f"{session.name}/history_summary", (time.perf_counter() - started) * 1000)
+
+    for call in client.calls:
+        if recorder is not None:
+            recorder.add(f"{session.name}/llm:{call.kind}", call.seconds * 1000)
+    return {
+        "prompt_tokens": sum(c.prompt_tokens for c in client.calls),
+        "completion_tokens": sum(c.completion_tokens for c in client.calls),
+        "llm_calls": len(client.calls),
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline ChatConversation (fake LLM + fake retriever).")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default="instant", help="Độ trễ fake LLM.")
+    parser.add_argument("--retriever-profile", choices=sorted(RETRIEVER_LATENCY_PROFILES), default="instant")
+    parser.add_argument("--session", action="append", help="Chỉ chạy session này (lặp lại được).")
+    parser.add_argument("--no-intent-router", action="store_true", help="Tắt router intent local.")
+    parser.add_argument("--fix-output", choices=["patch", "full"], default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Ghi kết quả (JSON) để làm baseline.")
+    parser.add_argument("--baseline", help="So p95 với file JSON từ --save, đánh dấu stage chậm hơn --tolerance.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Bỏ qua chênh lệch p95 nhỏ hơn ngần này (ms).")
+    args = parser.parse_args()
+
+    if args.no_intent_router:
+        settings.INTENT_ROUTER_ENABLED = False
+    if args.fix_output:
+        settings.FIX_OUTPUT_MODE = args.fix_output
+    sessions = [s for s in SESSIONS if not args.session or s.name in args.session]
+
+    client = FakeChatClient(LATENCY_PROFILES[args.profile], seed=args.seed)
+    retriever = FakeRuleRetriever(latency=RETRIEVER_LATENCY_PROFILES[args.retriever_profile], seed=args.seed)
+    retriever.load_rules_file(str(RULES_DIR / "python_rule.txt"), language="python", source_path="python_rule.txt")
+
+    # Warm-up (import, tiktoken, regex compile) không tính vào số liệu
+    for session in sessions:
+        _run_session(session, client=client, retriever=retriever, recorder=None)
+
+    # Bộ nhớ: 1 lượt riêng dưới tracemalloc (chậm hơn nhiều nên không lẫn vào số liệu thời gian)
+    memory: Dict[str, Dict[str, float]] = {}
+    for session in sessions:
+        tracemalloc.start()
+        _run_session(session, client=client, retriever=retriever, recorder=None)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory[session.name] = {"peak_kb": round(peak / 1024, 1), "retained_kb": round(current / 1024, 1)}
+
+    recorder = _Recorder()
+    _instrument(recorder)
+    usage: Dict[str, Dict[str, int]] = {}
+    for session in sessions:
+        for _ in range(args.runs):
+            usage[session.name] = _run_session(session, client=client, retriever=retriever, recorder=recorder)
+
+    results = {
+        key: {
+            "n": len(values),
+            "p50": round(statistics.median(values), 3),
+            "p95": round(_percentile(values, 0.95), 3),
+            "p99": round(_percentile(values, 0.99), 3),
+        }
+        for key, values in sorted(recorder.samples.items())
+    }
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["stages"] if args.baseline else {}
+
+    print(f"profile={args.profile}, retriever={args.retriever_profile}, runs={args.runs}, "
+          f"intent_router={settings.INTENT_ROUTER_ENABLED}, fix_output={settings.FIX_OUTPUT_MODE}\n")
+    print(f"{'session/stage':<36}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    regressions = 0
+    for key, r in results.items():
+        mark = ""
+        base = baseline.get(key)
+        if (
+            base and base["p95"] > 0
+            and r["p95"] > base["p95"] * (1 + args.tolerance)
+            and r["p95"] - base["p95"] >= args.min_delta_ms
+        ):
+            mark = f"  ▲ {r['p95'] / base['p95'] - 1:+.0%} vs baseline"
+            regressions += 1
+        print(f"{key:<36}{r['n']:>5}{r['p50']:>10.2f}{r['p95']:>10.2f}{r['p99']:>10.2f}{mark}")
+
+    print(f"\n{'session':<16}{'LLM calls':>10}{'prompt tok':>12}{'output tok':>12}{'peak KB':>10}{'retained KB':>13}")
+    for name, u in usage.items():
+        m = memory[name]
+        print(f"{name:<16}{u['llm_calls']:>10}{u['prompt_tokens']:>12}{u['completion_tokens']:>12}"
+              f"{m['peak_kb']:>10.1f}{m['retained_kb']:>13.1f}")
+    if args.baseline:
+        print(f"\n{regressions} stage chậm hơn baseline quá {args.tolerance:.0%} (p95)")
+
+    if args.save:
+        Path(args.save).write_text(
+            json.dumps({"stages": results, "usage": usage, "memory": memory}, ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+        print(f"Đã ghi kết quả vào {args.save}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Chạy offline hoàn toàn; tiktoken cần sẵn file encoding trong cache (chạy app 1 lần có mạng hoặc đặt TIKTOKEN_CACHE_DIR).
+# Usage:
+# PYTHONPATH=. python3 tmp/script/bench_chat.py
+# PYTHONPATH=. python3 tmp/script/bench_chat.py --profile azure --retriever-profile pinecone --runs 5
+# PYTHONPATH=. python3 tmp/script/bench_chat.py --save tmp/bench_base.json
+# PYTHONPATH=. python3 tmp/script/bench_chat.py --baseline tmp/bench_base.json --tolerance 0.15
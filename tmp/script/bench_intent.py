@@ -0,0 +1,179 @@
+import argparse
+import statistics
+import time
+from typing import List, Tuple
+
+from chat.intent_router import classify_intent
+
+# (câu hỏi, intent đúng): "chat" = để model trả lời/định tuyến (router local không được tự chạy tool)
+SAMPLES: List[Tuple[str, str]] = [
+    # run_fix
+    ("Sửa lỗi NullPointerException trong hàm parse giúp mình", "run_fix"),
+    ("fix the bug", "run_fix"),
+    ("Fix the off-by-one error in the loop", "run_fix"),
+    ("sua loi index out of range", "run_fix"),
+    ("Refactor hàm main cho gọn hơn", "run_fix"),
+    ("Thêm type hints cho toàn bộ hàm", "run_fix"),
+    ("Add docstrings to every public function", "run_fix"),
+    ("Thêm xử lý lỗi khi đọc file", "run_fix"),
+    ("Tối ưu vòng lặp lồng nhau trong hàm search", "run_fix"),
+    ("optimize this query builder", "run_fix"),
+    ("Đổi tên biến x thành total_count", "run_fix"),
+    ("rename getData to fetch_user_data", "run_fix"),
+    ("Viết lại hàm này bằng list comprehension", "run_fix"),
+    ("Chuyển sang dùng f-string", "run_fix"),
+    ("Clean up the imports", "run_fix"),
+    ("Dọn dẹp code thừa giúp mình", "run_fix"),
+    ("Thêm logging cho các nhánh except", "run_fix"),
+    ("Sửa giúp mình lỗi SQL injection ở hàm login được không?", "run_fix"),
+    ("Replace the print statements with logger calls", "run_fix"),
+    ("Xoá các biến không dùng", "run_fix"),
+    ("rewrite it with async/await", "run_fix"),
+    ("Thêm kiểm tra None cho tham số user", "run_fix"),
+    ("Cập nhật code dùng pathlib thay cho os.path", "run_fix"),
+    ("Remove the global variables", "run_fix"),
+    ("fix luôn phần xử lý ngày tháng", "run_fix"),
+    # search_rule
+    ("Quy tắc đặt tên biến trong python là gì?", "search_rule"),
+    ("what's the naming convention for constants", "search_rule"),
+    ("Best practice khi xử lý exception trong Java?", "search_rule"),
+    ("Có rule nào về độ dài hàm không?", "search_rule"),
+    ("Coding standard của team về comment", "search_rule"),
+    ("PEP8 quy định import như thế nào?", "search_rule"),
+    ("Quy ước đặt tên class", "search_rule"),
+    ("Có nên dùng biến global không?", "search_rule"),
+    ("Is it ok to catch Exception broadly?", "search_rule"),
+    ("style guide cho indent là gì", "search_rule"),
+    ("Nguyên tắc viết unit test của dự án", "search_rule"),
+    ("Guidelines for logging sensitive data", "search_rule"),
+    ("Nên đặt tên hàm theo snake_case hay camelCase?", "search_rule"),
+    ("Should I use static methods here according to our rules?", "search_rule"),
+    ("chuan dat ten file la gi", "search_rule"),
+    # chat (giải thích, đánh giá, tham chiếu lượt trước, lẫn nhiều việc)
+    ("Giải thích hàm này làm gì", "chat"),
+    ("Tại sao đoạn code này chạy chậm?", "chat"),
+    ("What does the decorator on line 10 do?", "chat"),
+    ("Review code giúp mình", "chat"),
+    ("Đánh giá chất lượng code này", "chat"),
+    ("Làm lại như trên nhưng ngắn hơn", "chat"),
+    ("Áp dụng gợi ý của bạn đi", "chat"),
+    ("Tiếp tục", "chat"),
+    ("Cảm ơn bạn", "chat"),
+    ("Hàm này có lỗi không?", "chat"),
+    ("Code này có vấn đề gì?", "chat"),
+    ("Độ phức tạp thuật toán là bao nhiêu?", "chat"),
+    ("Sửa tên biến theo convention của team", "chat"),
+    ("fix it again", "chat"),
+    ("Tại sao lại phải sửa chỗ này?", "chat"),
+    ("How does the retry logic work?", "chat"),
+    ("Xin chào", "chat"),
+    ("Bản fix vừa rồi thay đổi những gì?", "chat"),
+    ("Explain the difference between the two versions", "chat"),
+    ("Code này viết bằng ngôn ngữ gì", "chat"),
+]
+
+# Tập ngoài mẫu (không dùng khi chỉnh regex): phủ định, hỏi cách sửa, liệt kê, từ khoá yếu đơn lẻ.
+# Mọi câu ở đây phải để LLM quyết định — router local chạy thẳng tool là sai.
+HOLDOUT: List[Tuple[str, str]] = [
+    ("don't change anything, just list the bugs", "chat"),
+    ("Đừng sửa gì cả, chỉ liệt kê lỗi", "chat"),
+    ("how to fix this error", "chat"),
+    ("update me on what changed", "chat"),
+    ("Liệt kê các chỗ cần sửa", "chat"),
+    ("Không cần fix, giải thích thôi", "chat"),
+    ("Explain how to fix it", "chat"),
+    ("Do not modify the code, only point out the problems", "chat"),
+    ("Chưa cần sửa đâu, mình chỉ muốn hiểu lỗi", "chat"),
+    ("dung sua gi het, chi ra loi thoi", "chat"),
+    ("Where should I fix the memory leak?", "chat"),
+    ("Sửa chỗ nào thì hết lỗi?", "chat"),
+    ("Cho mình biết cần refactor những gì", "chat"),
+    ("Change log của bản này là gì", "chat"),
+    ("remove?", "chat"),
+    ("convert", "chat"),
+    ("Can you explain why the fix works", "chat"),
+    ("Không được đổi tên hàm public, chỉ review thôi", "chat"),
+    ("List all the places that need a fix", "chat"),
+    ("Không nên thay thế thư viện, giải thích cách dùng đúng", "chat"),
+]
+
+
+def _route(question: str, threshold: float, min_score: int) -> str:
+    pred = classify_intent(question, min_score=min_score)
+    return pred.intent if pred.intent != "chat" and pred.confidence >= threshold else "llm"
+
+
+def _evaluate(
+    samples: List[Tuple[str, str]], threshold: float, min_score: int
+) -> Tuple[int, int, List[Tuple[str, str, str]]]:
+    """(số câu chạy thẳng tool, số câu chạy thẳng đúng, danh sách định tuyến sai)."""
+    routed = correct = 0
+    wrong: List[Tuple[str, str, str]] = []
+    for question, label in samples:
+        got = _route(question, threshold, min_score)
+        if got == "llm":
+            continue
+        routed += 1
+        if got == label:
+            correct += 1
+        else:
+            wrong.append((question, label, got))
+    return routed, correct, wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark router intent local trên tập câu hỏi có nhãn.")
+    parser.add_argument("--threshold", type=float, default=None, help="Mặc định: settings.INTENT_ROUTER_MIN_CONFIDENCE.")
+    parser.add_argument("--min-score", type=int, default=None, help="Mặc định: settings.INTENT_ROUTER_MIN_SCORE.")
+    parser.add_argument("--llm-ms", type=float, default=1500, help="Latency ước tính 1 lời gọi LLM định tuyến (ms).")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    if args.threshold is None or args.min_score is None:
+        from config.env import settings
+        if args.threshold is None:
+            args.threshold = settings.INTENT_ROUTER_MIN_CONFIDENCE
+        if args.min_score is None:
+            args.min_score = settings.INTENT_ROUTER_MIN_SCORE
+
+    print(f"{'threshold':>10}{'coverage':>10}{'precision':>11}{'sai':>6}")
+    for threshold in (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9):
+        routed, correct, wrong = _evaluate(SAMPLES, threshold, args.min_score)
+        precision = correct / routed if routed else 1.0
+        mark = "  ←" if abs(threshold - args.threshold) < 1e-9 else ""
+        print(f"{threshold:>10.1f}{routed / len(SAMPLES):>10.0%}{precision:>11.0%}{len(wrong):>6}{mark}")
+
+    routed, correct, wrong = _evaluate(SAMPLES, args.threshold, args.min_score)
+    print(f"\nNgưỡng {args.threshold}, điểm tối thiểu {args.min_score}: "
+          f"{routed}/{len(SAMPLES)} câu chạy thẳng tool, {correct} đúng")
+    for question, label, got in wrong:
+        print(f"  ≠ {question!r}: nhãn {label}, router → {got}")
+
+    # Tập ngoài mẫu: chỉ có câu phải để LLM quyết định → mọi câu chạy thẳng tool đều là định tuyến sai
+    _, _, holdout_wrong = _evaluate(HOLDOUT, args.threshold, args.min_score)
+    print(f"Ngoài mẫu: {len(holdout_wrong)}/{len(HOLDOUT)} câu định tuyến sai")
+    for question, label, got in holdout_wrong:
+        print(f"  ≠ {question!r}: nhãn {label}, router → {got}")
+
+    timings = []
+    for _ in range(args.repeat):
+        for question, _ in SAMPLES:
+            t0 = time.perf_counter()
+            classify_intent(question)
+            timings.append((time.perf_counter() - t0) * 1e6)
+    timings.sort()
+    p99 = timings[min(len(timings) - 1, int(0.99 * len(timings)))]
+    print(f"Latency classify_intent: p50={statistics.median(timings):.1f}µs, p99={p99:.1f}µs")
+    print(
+        f"Tiết kiệm ước tính: {correct} × {args.llm_ms:.0f}ms = {correct * args.llm_ms / 1000:.1f}s "
+        f"trên {len(SAMPLES)} câu (trung bình {correct * args.llm_ms / len(SAMPLES):.0f}ms/câu); "
+        f"{len(wrong)} câu định tuyến sai"
+    )
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Usage:
+# PYTHONPATH=. python3 tmp/script/bench_intent.py
+# PYTHONPATH=. python3 tmp/script/bench_intent.py --threshold 0.7 --llm-ms 2000
@@ -0,0 +1,80 @@
+import argparse
+import statistics
+import time
+from typing import Callable, List
+
+from config.constant import LANGUAGE_OPTIONS
+from utils import language
+from utils.language import guess_lang_from_code
+
+# Snippet mẫu cho từng ngôn ngữ trong LANGUAGE_OPTIONS ("text" → kỳ vọng không nhận diện được)
+SAMPLES = {
+    "python": "import os\n\ndef main(argv):\n    if argv:\n        return 1\n",
+    "javascript": "const add = (a, b) => {\n  return a + b;\n};\nfunction run(x) { return add(x, 1); }\n",
+    "typescript": "interface User { id: number }\ntype Id = number;\nconst users: Array<User> = [];\n",
+    "java": "package com.example;\n\npublic class App {\n  public static void main(String[] args) {}\n}\n",
+    "csharp": "using System;\nnamespace Demo {\n  public class App { }\n}\n",
+    "cpp": "#include <vector>\ntemplate <typename T>\nstd::vector<T> make() { return {}; }\n",
+    "go": "package main\n\nimport (\n  \"fmt\"\n)\n\nfunc main() { fmt.Println(1) }\n",
+    "rust": "fn main() {\n    let mut v = Vec::new();\n    v.push(std::io::stdin());\n}\n",
+    "php": "<?php\necho 'hi';\n",
+    "ruby": "require 'json'\n\ndef greet(name)\n  puts name\nend\n",
+    "swift": "import Foundation\n\nfunc greet(_ name: String) {\n  let msg = name\n}\n",
+    "kotlin": "import kotlin.math.max\n\nfun main() {\n  val x = max(1, 2)\n}\n",
+    "bash": "#!/bin/bash\nif [ -f a ]; then\n  echo \"ok\"\nfi\n",
+    "sql": "SELECT id, name\nFROM users\nWHERE id = 1;\n",
+    "html": "<!DOCTYPE html>\n<html>\n<body><p>Hi</p></body>\n</html>\n",
+    "css": ".btn {\n  color: red;\n  display: block;\n}\n",
+    "json": "{\n  \"name\": \"demo\",\n  \"version\": 1\n}\n",
+    "yaml": "services:\n  - web\n  - db\nversion: 3\n",
+    "text": "Ghi chú cuộc họp tuần này, không có code.\n",
+}
+
+
+def _timeit(fn: Callable[[], object], repeat: int, setup: Callable[[], None] = lambda: None) -> List[float]:
+    out = []
+    for _ in range(repeat):
+        setup()
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def _inflate(snippet: str, target_chars: int) -> str:
+    return snippet * max(1, target_chars // len(snippet))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark guess_lang_from_code cho mọi ngôn ngữ trong LANGUAGE_OPTIONS.")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--big-chars", type=int, default=1_000_000, help="Kích thước input lớn (ký tự).")
+    args = parser.parse_args()
+
+    print(f"{'language':<12}{'detected':<12}{'cold µs':>10}{'memo µs':>10}{'1MB cold ms':>14}")
+    mismatches = 0
+    for lang in LANGUAGE_OPTIONS:
+        code = SAMPLES[lang]
+        big = _inflate(code, args.big_chars)
+        detected = guess_lang_from_code(code)
+        expected = None if lang == "text" else lang
+        mismatches += detected != expected
+
+        cold = _timeit(lambda: guess_lang_from_code(code), args.repeat, setup=language._memo.clear)
+        warm = _timeit(lambda: guess_lang_from_code(code), args.repeat)
+        big_cold = _timeit(lambda: guess_lang_from_code(big), max(1, args.repeat // 5), setup=language._memo.clear)
+        mark = "" if detected == expected else "  ≠"
+        print(
+            f"{lang:<12}{str(detected):<12}{statistics.median(cold) * 1000:>10.1f}"
+            f"{statistics.median(warm) * 1000:>10.1f}{statistics.median(big_cold):>14.2f}{mark}"
+        )
+    print(f"Không khớp kỳ vọng: {mismatches}/{len(LANGUAGE_OPTIONS)}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Usage:
+# PYTHONPATH=. python3 tmp/script/bench_language.py
+# PYTHONPATH=. python3 tmp/script/bench_language.py --repeat 200 --big-chars 2000000
@@ -1,20 +1,67 @@
-from anyio import Path
-from retriever.pinecone.rule.rule_retriever import PineconeRuleRetriever
+import argparse
+from pathlib import Path
+
+from retriever.factory import create_rule_retriever
+from retriever.ingest import IngestCheckpoint, IngestOptions, discover_rule_files, ingest_roots, ingest_rule_files
 
 
 INDEX_NAME = "code-rules"
-FILE_NAME= "python_rule.txt"
-LANGUAGE="python"
-FILE_PATH = str(Path(__file__).with_name(FILE_NAME)) 
+DEFAULT_PATTERNS = [str(Path(__file__).with_name("*_rule.txt"))]
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = IngestOptions()
+    parser = argparse.ArgumentParser(description="Ingest file rules (thư mục / glob / file) vào rule retriever.")
+    parser.add_argument("paths", nargs="*", default=DEFAULT_PATTERNS, help="Thư mục, glob (hỗ trợ **) hoặc file rules.")
+    parser.add_argument("--index", default=INDEX_NAME, help="Tên index/collection.")
+    parser.add_argument("--language", default=None, help="Ép ngôn ngữ cho mọi file (mặc định: suy luận từ tên file).")
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size, help="Số chunk mỗi request embedding.")
+    parser.add_argument("--embed-workers", type=int, default=defaults.embed_workers)
+    parser.add_argument("--upsert-workers", type=int, default=defaults.upsert_workers)
+    parser.add_argument("--max-in-flight", type=int, default=defaults.max_in_flight, help="Số batch tối đa đang chờ embed/upsert.")
+    parser.add_argument("--max-retries", type=int, default=defaults.max_retries)
+    parser.add_argument("--chunk-size", type=int, default=defaults.chunk_size)
+    parser.add_argument("--chunk-overlap", type=int, default=defaults.chunk_overlap)
+    parser.add_argument("--checkpoint", default=defaults.checkpoint_path, help="File checkpoint để resume.")
+    parser.add_argument("--restart", action="store_true", help="Bỏ checkpoint cũ, ingest lại từ đầu.")
+    return parser.parse_args()
+
 
 def main():
-    retriever = PineconeRuleRetriever(index_name=INDEX_NAME)
-    count = retriever.import_rules_from_txt(
-        file_path=FILE_PATH,
-        language=LANGUAGE,
-        source_path=FILE_NAME
+    args = parse_args()
+    options = IngestOptions(
+        batch_size=args.batch_size,
+        embed_workers=args.embed_workers,
+        upsert_workers=args.upsert_workers,
+        max_in_flight=args.max_in_flight,
+        max_retries=args.max_retries,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        checkpoint_path=args.checkpoint,
+        language=args.language,
+    )
+    files = discover_rule_files(args.paths)
+    if not files:
+        print("⚠️ Không tìm thấy file rules nào.")
+        return
+
+    retriever = create_rule_retriever(index_name=args.index)
+    if args.restart:
+        IngestCheckpoint(options.checkpoint_path, retriever.manifest_key).reset()
+
+    def _progress(report):
+        print(f"\r… {report.chunks} chunks, {report.files} files, {report.chunks_per_second:.1f} chunks/s", end="", flush=True)
+
+    report = ingest_rule_files(retriever, files, options, roots=ingest_roots(args.paths), on_progress=_progress)
+    print()
+    print(
+        f"✅ Imported {report.chunks} new/changed chunks from {report.files} files into index '{args.index}' "
+        f"in {report.seconds:.1f}s ({report.chunks_per_second:.1f} chunks/s); "
+        f"{report.unchanged_chunks} chunks unchanged, {report.deleted_chunks} deleted; "
+        f"skipped {report.skipped_files} unchanged files, failed {len(report.failed_files)}."
     )
-    print(f"✅ Imported {count} chunks from '{FILE_PATH}' into index '{INDEX_NAME}' (lang={LANGUAGE}).")
+    for path in report.failed_files:
+        print(f"❌ {path}")
 
 
 if __name__ == "__main__":
@@ -22,4 +69,5 @@ if __name__ == "__main__":
 
 
 # Usage:
-# PYTHONPATH=. python3 tmp/script/run_import.py
\ No newline at end of file
+# PYTHONPATH=. python3 tmp/script/run_import.py                      # các *_rule.txt cạnh script
+# PYTHONPATH=. python3 tmp/script/run_import.py rules/ "docs/**/*.md" --batch-size 128 --embed-workers 8
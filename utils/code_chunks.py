@@ -0,0 +1,329 @@
+import ast
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+class CodeChunk(NamedTuple):
+    start: int   # dòng đầu (0-based, tính cả)
+    end: int     # dòng cuối (0-based, không tính)
+    name: str    # "def foo", "class A", "A.method", "module"… — dùng để chọn vùng liên quan và log
+    text: str
+
+
+# Heuristic indent (ngôn ngữ không parse được bằng ast)
+_CLOSING_RE = re.compile(r"^(?:[}\])]|(?:end|else|elif|except|catch|finally|fi|done|esac)\b)")
+_CONTINUATION_SUFFIXES = ("{", "(", "[", ",", ":", "\\", "=", "+", "&&", "||")
+_ATTACH_PREFIXES = ("@", "#", "//", "/*", "*", "--")   # annotation/comment đi cùng dòng phía sau
+_KEYWORDS = {"if", "for", "while", "switch", "catch", "return", "elif", "else"}
+_DECL_NAME_RE = re.compile(
+    r"\b(?:def|class|function|func|fn|fun|interface|struct|enum|trait|impl|module|namespace|type)\s+([A-Za-z_]\w*)"
+)
+_CALL_NAME_RE = re.compile(r"([A-Za-z_]\w*)\s*\(")
+_IDENT_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_BACKTICK_RE = re.compile(r"`([^`]+)`")
+# "dòng 12", "lines 3-5", "L40" — có \b ở đầu để không khớp "html5", "model 4o", "parse_level 2"
+_LINE_REF_RE = re.compile(r"\b(?:(?i:dòng|lines?)|L(?=\d))\s*(\d+)(?:\s*[-–]\s*(\d+))?")
+# Đổi tên / đổi chữ ký / thay thế / di chuyển → sửa cả nơi dùng, không chỉ chunk định nghĩa
+_CROSS_CUTTING_RE = re.compile(
+    r"\b(?:renam\w*|đổi tên|doi ten|signature|chữ ký|tham số|parameters?|arguments?|replace\w*|thay thế"
+    r"|move|chuyển|inline|extract|tách)\b",
+    re.IGNORECASE,
+)
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+# ---------- Tách chunk: Python (ast) ----------
+def _python_units(body: List[ast.stmt], lo: int, hi: int, prefix: str, max_lines: int) -> List[Tuple[int, int, str]]:
+    """Chia [lo, hi) theo các statement của body; comment/dòng trống phía trên đi cùng statement phía sau."""
+    units: List[Tuple[int, int, str]] = []
+    cursor = lo
+    for node in body:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+        end = node.end_lineno
+        start = max(start, cursor)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            name = f"{prefix}{node.name}"
+            if isinstance(node, ast.ClassDef) and end - cursor > max_lines and node.body:
+                # Class lớn → tách tiếp theo method, phần header là 1 chunk riêng
+                body_start = min([node.body[0].lineno] + [
+                    d.lineno for d in getattr(node.body[0], "decorator_list", [])
+                ]) - 1
+                units.append((cursor, body_start, f"class {name}"))
+                units.extend(_python_units(node.body, body_start, end, f"{name}.", max_lines))
+            else:
+                kind = "class" if isinstance(node, ast.ClassDef) else "def"
+                units.append((cursor, end, f"{kind} {name}"))
+        else:
+            units.append((cursor, end, ""))
+        cursor = end
+    if cursor < hi:
+        units.append((cursor, hi, ""))
+    return units
+
+
+# ---------- Tách chunk: heuristic theo indent ----------
+def _unit_name(head: str) -> str:
+    """Tên khai báo (hàm/class…) của dòng đầu đơn vị; câu lệnh thường → ""."""
+    m = _DECL_NAME_RE.search(head)
+    if m:
+        return m.group(1)
+    m = _CALL_NAME_RE.search(head)
+    if m and head.rstrip().endswith("{") and m.group(1) not in _KEYWORDS:
+        return m.group(1)   # vd. "public static void main(String[] args) {"
+    return ""
+
+
+def _indent_units(lines: List[str], lo: int, hi: int, max_lines: int) -> List[Tuple[int, int, str]]:
+    rows = [i for i in range(lo, hi) if lines[i].strip()]
+    if not rows:
+        return [(lo, hi, "")]
+    level = min(_indent(lines[i]) for i in rows)
+
+    starts = [lo]
+    prev = None
+    for i in rows:
+        stripped = lines[i].strip()
+        if (
+            prev is not None
+            and _indent(lines[i]) == level
+            and not _CLOSING_RE.match(stripped)
+            and not prev.endswith(_CONTINUATION_SUFFIXES)
+            and not prev.startswith(_ATTACH_PREFIXES)
+        ):
+            starts.append(i)
+        prev = stripped
+
+    units: List[Tuple[int, int, str]] = []
+    for k, s in enumerate(starts):
+        e = starts[k + 1] if k + 1 < len(starts) else hi
+        head = next((
+            lines[i].strip() for i in range(s, e)
+            if lines[i].strip() and not lines[i].strip().startswith(_ATTACH_PREFIXES)
+        ), "")
+        name = _unit_name(head)
+        deeper = [i for i in range(s, e) if lines[i].strip() and _indent(lines[i]) > level]
+        if e - s > max_lines and deeper:
+            # Đơn vị quá lớn (vd. class Java bọc cả file) → tách tiếp phần thân sâu hơn
+            a, b = deeper[0], deeper[-1] + 1
+            units.append((s, a, name))
+            units.extend(_indent_units(lines, a, b, max_lines))
+            if b < e:
+                units.append((b, e, ""))
+        else:
+            units.append((s, e, name))
+    return units
+
+
+def split_code_chunks(code: str, language: str, max_chunk_lines: int = 120) -> List[CodeChunk]:
+    """
+    Chia code thành các chunk liên tiếp phủ toàn bộ file, theo ranh giới hàm/class:
+    Python dùng ast (lỗi cú pháp → heuristic indent), ngôn ngữ khác dùng heuristic indent.
+    Các statement rời ở cấp module liền nhau được gộp thành 1 chunk "module".
+    """
+    lines = code.splitlines()
+    units: Optional[List[Tuple[int, int, str]]] = None
+    if (language or "").lower() == "python":
+        try:
+            units = _python_units(ast.parse(code).body, 0, len(lines), "", max_chunk_lines)
+        except (SyntaxError, ValueError):
+            units = None
+    if units is None:
+        units = _indent_units(lines, 0, len(lines), max_chunk_lines)
+
+    merged: List[Tuple[int, int, str]] = []
+    for s, e, name in units:
+        if s >= e:
+            continue
+        if merged and not name and not merged[-1][2] and e - merged[-1][0] <= max_chunk_lines:
+            merged[-1] = (merged[-1][0], e, "")
+        else:
+            merged.append((s, e, name))
+    return [CodeChunk(s, e, name or "module", "\n".join(lines[s:e])) for s, e, name in merged]
+
+
+# ---------- Chọn chunk liên quan tới yêu cầu fix ----------
+def _is_identifier_like(tok: str) -> bool:
+    return "_" in tok or any(c.isdigit() for c in tok) or (tok[:1].islower() and any(c.isupper() for c in tok[1:]))
+
+
+def _instruction_terms(instructions: str, defined: Set[str]) -> Set[str]:
+    terms = {t for t in _IDENT_RE.findall(instructions) if t in defined or (len(t) >= 3 and _is_identifier_like(t))}
+    for quoted in _BACKTICK_RE.findall(instructions):
+        terms.update(t for t in _IDENT_RE.findall(quoted) if len(t) >= 2)
+    return terms
+
+
+def _line_refs(instructions: str) -> List[Tuple[int, int]]:
+    refs = []
+    for m in _LINE_REF_RE.finditer(instructions):
+        a = int(m.group(1))
+        b = int(m.group(2) or a)
+        refs.append((min(a, b) - 1, max(a, b)))
+    return refs
+
+
+def _defined_name(chunk: CodeChunk) -> str:
+    """Tên hàm/class mà chunk định nghĩa ("def A.run" → "run"); chunk module → ""."""
+    return "" if chunk.name == "module" else chunk.name.split(" ")[-1].split(".")[-1]
+
+
+def _is_cross_cutting(instructions: str, terms: Set[str], used: Set[str]) -> bool:
+    """Yêu cầu kiểu đổi tên/đổi chữ ký, hoặc nêu identifier chưa có trong file (tên mới) → ảnh hưởng nơi dùng."""
+    return bool(_CROSS_CUTTING_RE.search(instructions)) or any(t not in used for t in terms)
+
+
+def select_relevant_chunks(chunks: List[CodeChunk], instructions: str) -> List[CodeChunk]:
+    """
+    Chunk liên quan tới yêu cầu: ưu tiên chunk định nghĩa hàm/class được nêu tên hoặc chứa dòng được nêu;
+    không có → chunk chứa identifier được nêu.
+    Yêu cầu cắt ngang (đổi tên, đổi chữ ký, tên mới…) → thêm mọi chunk dùng tới identifier được nêu
+    (nơi gọi, import, kế thừa); quá nhiều thì plan_chunked_fix tự chuyển sang fix cả file.
+    """
+    idents = {c: set(_IDENT_RE.findall(c.text)) for c in chunks}
+    used = set().union(*idents.values()) if idents else set()
+    terms = _instruction_terms(instructions, {_defined_name(c) for c in chunks} - {""})
+    refs = _line_refs(instructions)
+    direct = [
+        c for c in chunks
+        if _defined_name(c) in terms or any(a < c.end and b > c.start for a, b in refs)
+    ]
+    if not direct:
+        return [c for c in chunks if terms & idents[c]]
+    if not _is_cross_cutting(instructions, terms, used):
+        return direct
+    names = (terms & used) | {_defined_name(c) for c in direct} - {""}
+    return [c for c in chunks if c in direct or names & idents[c]]
+
+
+class ChunkedFixPlan(NamedTuple):
+    chunks: List[CodeChunk]     # toàn bộ file (để dựng dàn ý)
+    selected: List[CodeChunk]   # các chunk cần gửi cho LLM
+
+
+def plan_chunked_fix(
+    code: str,
+    language: str,
+    instructions: str,
+    *,
+    min_lines: int = 300,
+    max_chunk_lines: int = 120,
+    max_fraction: float = 0.5,
+) -> Optional[ChunkedFixPlan]:
+    """
+    Kế hoạch fix theo chunk; None → nên fix cả file
+    (file nhỏ, không xác định được vùng liên quan, hoặc vùng liên quan chiếm quá max_fraction file).
+    """
+    total = len(code.splitlines())
+    if total < min_lines or not (instructions or "").strip():
+        return None
+    chunks = split_code_chunks(code, language, max_chunk_lines)
+    if len(chunks) < 2:
+        return None
+    selected = select_relevant_chunks(chunks, instructions)
+    if not selected or sum(c.end - c.start for c in selected) > max_fraction * total:
+        return None
+    return ChunkedFixPlan(chunks, selected)
+
+
+def file_outline(chunks: Iterable[CodeChunk], max_items: int = 60) -> str:
+    names = [f"- dòng {c.start + 1}–{c.end}: {c.name}" for c in chunks]
+    if len(names) > max_items:
+        names = names[:max_items] + [f"- … ({len(names) - max_items} phần khác)"]
+    return "\n".join(names)
+
+
+def _reindent(fixed: str, original: str) -> str:
+    """Model hay bỏ indent chung của đoạn (vd. method trong class) → thêm lại nếu bị mất."""
+    def min_indent(text: str) -> int:
+        rows = [l for l in text.splitlines() if l.strip()]
+        return min((_indent(l) for l in rows), default=0)
+
+    base = min_indent(original)
+    if base and min_indent(fixed) == 0:
+        pad = original.splitlines()[next(i for i, l in enumerate(original.splitlines()) if l.strip())][:base]
+        return "\n".join((pad + l) if l.strip() else l for l in fixed.splitlines())
+    return fixed
+
+
+def stitch_chunks(code: str, language: str, fixes: Dict[CodeChunk, Optional[str]]) -> Optional[str]:
+    """
+    Ghép các chunk đã fix vào đúng vị trí.
+    None nếu có chunk fix lỗi (ghép một phần sẽ bỏ sót yêu cầu) hoặc kết quả Python không còn parse được
+    → caller fix cả file.
+    """
+    if not fixes or any(fixed is None for fixed in fixes.values()):
+        return None
+    lines = code.splitlines()
+    for chunk in sorted(fixes, key=lambda c: c.start, reverse=True):
+        fixed = fixes[chunk]
+        # Giữ nguyên dòng trống bao quanh chunk gốc (model thường cắt bỏ)
+        original = chunk.text.split("\n")
+        lead = next((i for i, l in enumerate(original) if l.strip()), len(original))
+        trail = next((i for i, l in enumerate(reversed(original)) if l.strip()), 0)
+        body = _reindent(fixed, chunk.text).splitlines()
+        while body and not body[0].strip():
+            body.pop(0)
+        while body and not body[-1].strip():
+            body.pop()
+        lines[chunk.start:chunk.end] = original[:lead] + body + original[len(original) - trail:]
+    out = "\n".join(lines) + ("\n" if code.endswith("\n") else "")
+    if (language or "").lower() == "python":
+        try:
+            ast.parse(out)
+        except SyntaxError:
+            return None
+    return out
+
+
+# ---------- Dàn ý code (import, class, chữ ký hàm) ----------
+_IMPORT_PREFIXES = ("import ", "from ", "#include", "using ", "package ", "require", "use ", "extern crate")
+
+
+def _python_outline(code: str) -> List[Tuple[int, str]]:
+    lines = code.splitlines()
+    out: List[Tuple[int, str]] = []
+
+    def visit(body: List[ast.stmt], depth: int) -> None:
+        for node in body:
+            if depth == 0 and isinstance(node, (ast.Import, ast.ImportFrom)):
+                out.append((node.lineno, lines[node.lineno - 1].strip()))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                header = lines[node.lineno - 1].strip()
+                out.append((node.lineno, "    " * depth + header + ("" if header.endswith(":") else " …")))
+                if isinstance(node, ast.ClassDef):
+                    visit(node.body, depth + 1)
+
+    visit(ast.parse(code).body, 0)
+    return out
+
+
+def _generic_outline(code: str) -> List[Tuple[int, str]]:
+    out: List[Tuple[int, str]] = []
+    for no, line in enumerate(code.splitlines(), start=1):
+        stripped = line.strip()
+        if stripped.startswith(_IMPORT_PREFIXES):
+            out.append((no, line.rstrip()))
+        elif stripped.startswith(_ATTACH_PREFIXES[1:]):
+            continue   # comment (annotation "@" vẫn giữ nếu là khai báo)
+        elif _unit_name(stripped):
+            out.append((no, line.rstrip()))
+    return out
+
+
+def outline_code(code: str, language: str, max_items: int = 200) -> str:
+    """Dàn ý dạng 'L<số dòng>: <dòng khai báo>' gồm import, class, chữ ký hàm/method."""
+    items: Optional[List[Tuple[int, str]]] = None
+    if (language or "").lower() == "python":
+        try:
+            items = _python_outline(code)
+        except (SyntaxError, ValueError):
+            items = None
+    if items is None:
+        items = _generic_outline(code)
+    rows = [f"L{no}: {text}" for no, text in items[:max_items]]
+    if len(items) > max_items:
+        rows.append(f"… ({len(items) - max_items} khai báo khác)")
+    return "\n".join(rows)
@@ -1,43 +1,27 @@
 import difflib
 import html
+import re
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import zip_longest
+from typing import Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
 
-# ---------- GitHub-like unified diff renderer ----------
-def make_github_like_unified_html(a: str, b: str, filename_a="original", filename_b="fixed", n=3) -> str:
-    """
-    Tạo unified diff và render HTML với màu giống GitHub:
-      - dòng thêm: xanh nhạt
-      - dòng xoá: đỏ nhạt
-      - meta (@@, --- +++) xanh nhạt
-      - context: nền trắng
-    """
-    udiff = list(difflib.unified_diff(
-        a.splitlines(keepends=False),
-        b.splitlines(keepends=False),
-        fromfile=filename_a, tofile=filename_b, n=n
-    ))
-
-    if not udiff:
-        return """
-        <div class="diff-gh">
-          <div class="diff-meta">No changes</div>
-        </div>
-        """
+Opcode = Tuple[str, int, int, int, int]
 
-    # Escape HTML và gán class theo ký hiệu đầu dòng
-    lines_html = []
-    for raw in udiff:
-        esc = html.escape(raw)
-        if raw.startswith('+++') or raw.startswith('---') or raw.startswith('@@'):
-            lines_html.append(f'<div class="diff-line meta">{esc}</div>')
-        elif raw.startswith('+'):
-            lines_html.append(f'<div class="diff-line add">{esc}</div>')
-        elif raw.startswith('-'):
-            lines_html.append(f'<div class="diff-line del">{esc}</div>')
-        else:
-            # space hoặc các dòng khác
-            lines_html.append(f'<div class="diff-line ctx">{esc}</div>')
+# Tổng số dòng (a + b) từ ngưỡng này dùng patience diff trên hash dòng thay cho difflib (O(n²) khi sửa nhiều)
+FAST_DIFF_MIN_LINES = 2000
+# Vùng không có dòng neo (unique) nhỏ hơn ngưỡng này (số ô a×b) vẫn được difflib so khớp chi tiết
+_SMALL_REGION_CELLS = 250_000
+# Số dòng diff mỗi trang HTML → diff lớn không đẩy hàng MB HTML vào component mỗi lần rerun
+DIFF_ROWS_PER_PAGE = 400
+# Giới hạn chi phí highlight trong dòng: số ô (token a × token b) tối đa cho mỗi cặp dòng
+INTRALINE_MAX_CELLS = 20_000
+DIFF_LAYOUTS = ("unified", "split")
+INTRALINE_MODES = ("word", "char", "none")
+_DIFF_CACHE_SIZE = 16
+_HTML_CACHE_SIZE = 32
 
-    styles = """
+_DIFF_STYLES = """
     <style>
       .diff-wrapper {
         border: 1px solid #e1e4e8;
@@ -62,6 +46,15 @@ def make_github_like_unified_html(a: str, b: str, filename_a="original", filenam
         padding: 8px 12px;
         font-weight: 600;
       }
+      .diff-line .hl-add { background: #acf2bd; border-radius: 2px; }
+      .diff-line .hl-del { background: #fdb8c0; border-radius: 2px; }
+      .diff-split { border-collapse: collapse; width: 100%; table-layout: fixed; }
+      .diff-split td { vertical-align: top; overflow: hidden; }
+      .diff-split td.ln {
+        width: 48px; padding: 2px 6px; text-align: right;
+        color: #6a737d; background: #fafbfc; user-select: none;
+      }
+      .diff-split td.empty { background: #f6f8fa; }
       .section-title {
         margin: 10px 0 6px;
         font-weight: 600;
@@ -69,9 +62,431 @@ def make_github_like_unified_html(a: str, b: str, filename_a="original", filenam
       }
     </style>
     """
+
+_NO_CHANGES_HTML = """
+        <div class="diff-gh">
+          <div class="diff-meta">No changes</div>
+        </div>
+        """
+
+
+class DiffRow(NamedTuple):
+    kind: str                      # "meta" | "ctx" | "add" | "del"
+    text: str                      # nội dung dòng (không có ký hiệu +/-/space)
+    old_no: Optional[int] = None   # số dòng bên a (1-based)
+    new_no: Optional[int] = None   # số dòng bên b (1-based)
+
+
+# ---------- Tính diff (patience cho input lớn) ----------
+def _patience_matches(a: Sequence[int], b: Sequence[int]) -> List[Tuple[int, int]]:
+    """Các cặp dòng (i, j) khớp nhau, neo theo dòng xuất hiện đúng 1 lần ở cả 2 phía (patience diff)."""
+    matches: List[Tuple[int, int]] = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo, blo = alo + 1, blo + 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi, bhi = ahi - 1, bhi - 1
+            matches.append((ahi, bhi))
+        if alo >= ahi or blo >= bhi:
+            continue
+
+        count_a: Dict[int, int] = {}
+        for i in range(alo, ahi):
+            count_a[a[i]] = count_a.get(a[i], 0) + 1
+        count_b: Dict[int, int] = {}
+        pos_b: Dict[int, int] = {}
+        for j in range(blo, bhi):
+            count_b[b[j]] = count_b.get(b[j], 0) + 1
+            pos_b[b[j]] = j
+        pairs = [(i, pos_b[a[i]]) for i in range(alo, ahi) if count_a[a[i]] == 1 and count_b.get(a[i]) == 1]
+
+        if not pairs:
+            if (ahi - alo) * (bhi - blo) <= _SMALL_REGION_CELLS:
+                sm = difflib.SequenceMatcher(None, a[alo:ahi], b[blo:bhi], autojunk=False)
+                for i, j, size in sm.get_matching_blocks():
+                    matches.extend((alo + i + k, blo + j + k) for k in range(size))
+            continue  # vùng lớn không có neo → coi là thay thế cả khối
+
+        # Dãy con tăng dài nhất theo j (patience sorting)
+        tails: List[int] = []
+        tail_idx: List[int] = []
+        prev = [-1] * len(pairs)
+        for idx, (_, j) in enumerate(pairs):
+            k = bisect_left(tails, j)
+            if k == len(tails):
+                tails.append(j)
+                tail_idx.append(idx)
+            else:
+                tails[k] = j
+                tail_idx[k] = idx
+            prev[idx] = tail_idx[k - 1] if k else -1
+        anchors = []
+        idx = tail_idx[-1]
+        while idx != -1:
+            anchors.append(pairs[idx])
+            idx = prev[idx]
+        anchors.reverse()
+
+        i0, j0 = alo, blo
+        for i, j in anchors:
+            matches.append((i, j))
+            stack.append((i0, i, j0, j))
+            i0, j0 = i + 1, j + 1
+        stack.append((i0, ahi, j0, bhi))
+
+    matches.sort()
+    return matches
+
+
+def _matches_to_opcodes(matches: List[Tuple[int, int]], n_a: int, n_b: int) -> List[Opcode]:
+    opcodes: List[Opcode] = []
+    i = j = 0
+    k = 0
+    while k <= len(matches):
+        mi, mj = matches[k] if k < len(matches) else (n_a, n_b)
+        if i < mi and j < mj:
+            opcodes.append(("replace", i, mi, j, mj))
+        elif i < mi:
+            opcodes.append(("delete", i, mi, j, j))
+        elif j < mj:
+            opcodes.append(("insert", i, i, j, mj))
+        if k == len(matches):
+            break
+        # gộp các dòng khớp liên tiếp thành 1 khối equal
+        size = 1
+        while k + size < len(matches) and matches[k + size] == (mi + size, mj + size):
+            size += 1
+        opcodes.append(("equal", mi, mi + size, mj, mj + size))
+        i, j = mi + size, mj + size
+        k += size
+    return opcodes
+
+
+def diff_opcodes(a_lines: List[str], b_lines: List[str]) -> List[Opcode]:
+    """Opcodes kiểu SequenceMatcher; input lớn dùng patience diff trên hash dòng."""
+    if len(a_lines) + len(b_lines) < FAST_DIFF_MIN_LINES:
+        return difflib.SequenceMatcher(None, a_lines, b_lines, autojunk=False).get_opcodes()
+    ids: Dict[Hashable, int] = {}
+    a_ids = [ids.setdefault(line, len(ids)) for line in a_lines]
+    b_ids = [ids.setdefault(line, len(ids)) for line in b_lines]
+    return _matches_to_opcodes(_patience_matches(a_ids, b_ids), len(a_lines), len(b_lines))
+
+
+def _group_opcodes(codes: List[Opcode], n: int) -> List[List[Opcode]]:
+    """Chia opcodes thành hunk với n dòng context (giống SequenceMatcher.get_grouped_opcodes)."""
+    codes = list(codes) or [("equal", 0, 1, 0, 1)]
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+    groups, group = [], []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            groups.append(group)
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        groups.append(group)
+    return groups
+
+
+def _format_range(start: int, stop: int) -> str:
+    beginning, length = start + 1, stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+_diff_cache: "OrderedDict[tuple, List[DiffRow]]" = OrderedDict()
+_html_cache: "OrderedDict[tuple, str]" = OrderedDict()
+
+
+def _cache_put(cache: OrderedDict, key, value, max_size: int) -> None:
+    cache[key] = value
+    if len(cache) > max_size:
+        cache.popitem(last=False)
+
+
+def _content_key(a: str, b: str, n: int) -> tuple:
+    return (len(a), hash(a), len(b), hash(b), n)
+
+
+def unified_diff_rows(a: str, b: str, n: int = 3) -> List[DiffRow]:
+    """Các dòng unified diff (header @@ + dòng ctx/add/del), memo theo (hash(a), hash(b), n)."""
+    key = _content_key(a, b, n)
+    rows = _diff_cache.get(key)
+    if rows is not None:
+        _diff_cache.move_to_end(key)
+        return rows
+
+    a_lines, b_lines = a.splitlines(), b.splitlines()
+    rows = []
+    for group in _group_opcodes(diff_opcodes(a_lines, b_lines), n):
+        first, last = group[0], group[-1]
+        rows.append(DiffRow(
+            "meta", f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@"
+        ))
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                rows.extend(DiffRow("ctx", a_lines[i1 + k], i1 + k + 1, j1 + k + 1) for k in range(i2 - i1))
+                continue
+            if tag in ("replace", "delete"):
+                rows.extend(DiffRow("del", a_lines[i], old_no=i + 1) for i in range(i1, i2))
+            if tag in ("replace", "insert"):
+                rows.extend(DiffRow("add", b_lines[j], new_no=j + 1) for j in range(j1, j2))
+    _cache_put(_diff_cache, key, rows, _DIFF_CACHE_SIZE)
+    return rows
+
+
+def diff_page_count(a: str, b: str, n: int = 3, rows_per_page: int = DIFF_ROWS_PER_PAGE) -> int:
+    rows = unified_diff_rows(a, b, n)
+    return max(1, -(-len(rows) // rows_per_page))
+
+
+# ---------- Highlight trong dòng (word / char) ----------
+_TOKEN_RE = re.compile(r"\w+|\s+|[^\w\s]")
+
+
+def _tokens(line: str, granularity: str) -> List[str]:
+    return list(line) if granularity == "char" else _TOKEN_RE.findall(line)
+
+
+def intraline_spans(
+    old: str, new: str, granularity: str = "word"
+) -> Optional[Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]]:
+    """
+    Các khoảng ký tự [start, end) khác nhau giữa 2 dòng được ghép cặp (old, new).
+    Char vượt INTRALINE_MAX_CELLS thì hạ xuống word; word vẫn vượt → None (không highlight dòng này).
+    """
+    if granularity == "char" and len(old) * len(new) > INTRALINE_MAX_CELLS:
+        granularity = "word"
+    ta, tb = _tokens(old, granularity), _tokens(new, granularity)
+    if len(ta) * len(tb) > INTRALINE_MAX_CELLS:
+        return None
+    offsets_a, offsets_b = [0], [0]
+    for t in ta:
+        offsets_a.append(offsets_a[-1] + len(t))
+    for t in tb:
+        offsets_b.append(offsets_b[-1] + len(t))
+
+    spans_a: List[Tuple[int, int]] = []
+    spans_b: List[Tuple[int, int]] = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, ta, tb, autojunk=False).get_opcodes():
+        if tag == "equal":
+            continue
+        if i1 < i2:
+            spans_a.append((offsets_a[i1], offsets_a[i2]))
+        if j1 < j2:
+            spans_b.append((offsets_b[j1], offsets_b[j2]))
+    return spans_a, spans_b
+
+
+def _highlight(text: str, spans: List[Tuple[int, int]], cls: str) -> str:
+    out, pos = [], 0
+    for start, end in spans:
+        out.append(html.escape(text[pos:start]))
+        out.append(f'<span class="{cls}">{html.escape(text[start:end])}</span>')
+        pos = end
+    out.append(html.escape(text[pos:]))
+    return "".join(out)
+
+
+def _change_runs(rows: List[DiffRow]) -> List[Tuple[int, int, int]]:
+    """Các khối thay đổi (start, số dòng del, số dòng add): dãy del liền ngay sau là dãy add."""
+    runs, i = [], 0
+    while i < len(rows):
+        if rows[i].kind not in ("del", "add"):
+            i += 1
+            continue
+        start = i
+        while i < len(rows) and rows[i].kind == "del":
+            i += 1
+        n_del = i - start
+        while i < len(rows) and rows[i].kind == "add":
+            i += 1
+        runs.append((start, n_del, i - start - n_del))
+    return runs
+
+
+def _rows_text_html(rows: List[DiffRow], intraline: str) -> List[str]:
+    """HTML (đã escape) cho text từng dòng; chỉ cặp dòng del/add ghép được mới chạy highlight trong dòng."""
+    out = [html.escape(r.text) for r in rows]
+    if intraline == "none":
+        return out
+    for start, n_del, n_add in _change_runs(rows):
+        for k in range(min(n_del, n_add)):
+            i_del, i_add = start + k, start + n_del + k
+            spans = intraline_spans(rows[i_del].text, rows[i_add].text, intraline)
+            if spans is None:
+                continue
+            out[i_del] = _highlight(rows[i_del].text, spans[0], "hl-del")
+            out[i_add] = _highlight(rows[i_add].text, spans[1], "hl-add")
+    return out
+
+
+def _page_rows(a: str, b: str, n: int, page: int, rows_per_page: int) -> List[DiffRow]:
+    return unified_diff_rows(a, b, n)[page * rows_per_page:(page + 1) * rows_per_page]
+
+
+# ---------- GitHub-like unified diff renderer ----------
+_ROW_PREFIX = {"add": "+", "del": "-", "ctx": " ", "meta": ""}
+
+
+def make_github_like_unified_html(
+    a: str,
+    b: str,
+    filename_a="original",
+    filename_b="fixed",
+    n=3,
+    page: int = 0,
+    rows_per_page: int = DIFF_ROWS_PER_PAGE,
+    intraline: str = "none",
+) -> str:
+    """
+    Tạo unified diff và render HTML với màu giống GitHub:
+      - dòng thêm: xanh nhạt
+      - dòng xoá: đỏ nhạt
+      - meta (@@, --- +++) xanh nhạt
+      - context: nền trắng
+    Chỉ render trang `page` (rows_per_page dòng); diff và HTML từng trang được memo.
+    intraline: "word" | "char" → tô đậm phần khác nhau trong cặp dòng xoá/thêm.
+    """
+    key = ("unified", _content_key(a, b, n), filename_a, filename_b, page, rows_per_page, intraline)
+    cached = _html_cache.get(key)
+    if cached is not None:
+        _html_cache.move_to_end(key)
+        return cached
+
+    if not unified_diff_rows(a, b, n):
+        return _NO_CHANGES_HTML
+
+    rows = _page_rows(a, b, n, page, rows_per_page)
+    # Escape HTML và gán class theo loại dòng
+    lines_html = [
+        f'<div class="diff-line meta">--- {html.escape(filename_a)}</div>',
+        f'<div class="diff-line meta">+++ {html.escape(filename_b)}</div>',
+    ]
+    for row, text_html in zip(rows, _rows_text_html(rows, intraline)):
+        lines_html.append(f'<div class="diff-line {row.kind}">{_ROW_PREFIX[row.kind]}{text_html}</div>')
+
     body = f"""
     <div class="diff-gh">
       {''.join(lines_html)}
     </div>
     """
-    return styles + body
\ No newline at end of file
+    out = _DIFF_STYLES + body
+    _cache_put(_html_cache, key, out, _HTML_CACHE_SIZE)
+    return out
+
+
+# ---------- Side-by-side diff renderer ----------
+def _split_cells(row: Optional[DiffRow], text_html: str, side: str) -> str:
+    if row is None:
+        return '<td class="ln empty"></td><td class="diff-line empty"></td>'
+    no = row.old_no if side == "a" else row.new_no
+    return f'<td class="ln">{no or ""}</td><td class="diff-line {row.kind}">{text_html}</td>'
+
+
+def make_side_by_side_html(
+    a: str,
+    b: str,
+    filename_a="original",
+    filename_b="fixed",
+    n=3,
+    page: int = 0,
+    rows_per_page: int = DIFF_ROWS_PER_PAGE,
+    intraline: str = "word",
+) -> str:
+    """
+    Render diff 2 cột (a | b) có số dòng; khối xoá/thêm được ghép cặp theo thứ tự,
+    dòng thừa của một bên để trống bên kia. Phân trang + memo giống make_github_like_unified_html.
+    """
+    key = ("split", _content_key(a, b, n), filename_a, filename_b, page, rows_per_page, intraline)
+    cached = _html_cache.get(key)
+    if cached is not None:
+        _html_cache.move_to_end(key)
+        return cached
+
+    if not unified_diff_rows(a, b, n):
+        return _NO_CHANGES_HTML
+
+    rows = _page_rows(a, b, n, page, rows_per_page)
+    texts = _rows_text_html(rows, intraline)
+    trs = [
+        f'<tr><td class="diff-line meta" colspan="2">{html.escape(filename_a)}</td>'
+        f'<td class="diff-line meta" colspan="2">{html.escape(filename_b)}</td></tr>'
+    ]
+    i = 0
+    while i < len(rows):
+        row = rows[i]
+        if row.kind == "meta":
+            trs.append(f'<tr><td class="diff-line meta" colspan="4">{texts[i]}</td></tr>')
+            i += 1
+        elif row.kind == "ctx":
+            trs.append(f"<tr>{_split_cells(row, texts[i], 'a')}{_split_cells(row, texts[i], 'b')}</tr>")
+            i += 1
+        else:
+            start = i
+            while i < len(rows) and rows[i].kind == "del":
+                i += 1
+            dels = list(range(start, i))
+            while i < len(rows) and rows[i].kind == "add":
+                i += 1
+            adds = list(range(dels[-1] + 1 if dels else start, i))
+            for d, ad in zip_longest(dels, adds):
+                left = _split_cells(rows[d], texts[d], "a") if d is not None else _split_cells(None, "", "a")
+                right = _split_cells(rows[ad], texts[ad], "b") if ad is not None else _split_cells(None, "", "b")
+                trs.append(f"<tr>{left}{right}</tr>")
+
+    body = f"""
+    <div class="diff-gh">
+      <table class="diff-split">{''.join(trs)}</table>
+    </div>
+    """
+    out = _DIFF_STYLES + body
+    _cache_put(_html_cache, key, out, _HTML_CACHE_SIZE)
+    return out
+
+
+# ---------- Tóm tắt thay đổi cục bộ (không gọi LLM) ----------
+def summarize_diff(a: str, b: str, max_hunks: int = 5, max_chars: int = 80) -> List[str]:
+    """
+    Tóm tắt thay đổi giữa a và b từ diff, mỗi phần tử là một dòng tóm tắt (không có '- ' ở đầu):
+      - dòng tổng: số vùng thay đổi, số dòng thêm/xoá
+      - mỗi vùng: khoảng dòng (theo b) + dòng đầu tiên được thêm/sửa
+    """
+    a_lines = a.splitlines()
+    b_lines = b.splitlines()
+    hunks = [op for op in diff_opcodes(a_lines, b_lines) if op[0] != "equal"]
+    if not hunks:
+        return ["Không có thay đổi nào so với bản trước."]
+
+    added = sum(j2 - j1 for tag, _, _, j1, j2 in hunks if tag in ("insert", "replace"))
+    removed = sum(i2 - i1 for tag, i1, i2, _, _ in hunks if tag in ("delete", "replace"))
+    lines = [f"Thay đổi {len(hunks)} vùng code: +{added} / -{removed} dòng."]
+
+    for tag, i1, i2, j1, j2 in hunks[:max_hunks]:
+        if tag == "delete":
+            sample = next((l.strip() for l in a_lines[i1:i2] if l.strip()), "")
+            where, verb = (f"dòng {i1 + 1}" if i2 - i1 == 1 else f"dòng {i1 + 1}–{i2}"), "Xoá"
+        else:
+            sample = next((l.strip() for l in b_lines[j1:j2] if l.strip()), "")
+            where = f"dòng {j1 + 1}" if j2 - j1 == 1 else f"dòng {j1 + 1}–{j2}"
+            verb = "Thêm" if tag == "insert" else "Sửa"
+        if len(sample) > max_chars:
+            sample = sample[: max_chars - 1] + "…"
+        lines.append(f"{verb} {where}" + (f": `{sample}`" if sample else ""))
+
+    if len(hunks) > max_hunks:
+        lines.append(f"… và {len(hunks) - max_hunks} vùng thay đổi khác (xem Diff).")
+    return lines
+
@@ -1,5 +1,8 @@
+import hashlib
 import re
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 _MAP = {
     ".py": "python",
@@ -128,21 +131,139 @@ _LANGUAGE_PATTERNS: Dict[str, List[re.Pattern]] = {
     ],
 }
 
+# Input lớn chỉ quét phần đầu + phần cuối (cắt theo ranh giới dòng)
+_SAMPLE_HEAD_CHARS = 32 * 1024
+_SAMPLE_TAIL_CHARS = 8 * 1024
+_MEMO_MAX_ENTRIES = 128
+_JSON_START = re.compile(r"\s*[{\[]")
+_memo: "OrderedDict[Tuple[bool, bytes], Optional[str]]" = OrderedDict()
+
+
+def _sample(code: str) -> str:
+    if len(code) <= _SAMPLE_HEAD_CHARS + _SAMPLE_TAIL_CHARS:
+        return code
+    head = code[:_SAMPLE_HEAD_CHARS]
+    tail = code[-_SAMPLE_TAIL_CHARS:]
+    head = head[: head.rfind("\n") + 1] or head
+    tail = tail[tail.find("\n") + 1:] or tail
+    return head + tail
+
+
+def _required_literal(pattern: re.Pattern) -> str:
+    """
+    Chuỗi literal dài nhất bắt buộc có trong mọi match (chỉ xét phần top-level của pattern).
+    Dùng để lọc nhanh bằng `in` trước khi chạy regex; "" = không lọc được.
+    """
+    src, runs, cur, i = pattern.pattern, [], "", 0
+    while i < len(src):
+        c = src[i]
+        if c == "\\":
+            esc = src[i + 1]
+            lit = "\n" if esc == "n" else (esc if not esc.isalnum() else None)
+            i += 2
+        elif c in "[(":
+            close, depth = ("]" if c == "[" else ")"), 0
+            while i < len(src):
+                if src[i] == "\\":
+                    i += 2
+                    continue
+                depth += src[i] == c
+                depth -= src[i] == close
+                i += 1
+                if depth == 0:
+                    break
+            lit = None
+        elif c == "|":
+            return ""
+        elif c in ".^$":
+            lit, i = None, i + 1
+        else:
+            lit, i = c, i + 1
+        quant = src[i] if i < len(src) and src[i] in "?*+{" else ""
+        if quant:
+            i = src.index("}", i) + 1 if quant == "{" else i + 1
+            i += i < len(src) and src[i] == "?"  # quantifier lazy
+        if lit is not None and quant not in ("?", "*", "{"):
+            cur += lit
+        if lit is None or quant:
+            runs.append(cur)
+            cur = ""
+    runs.append(cur)
+    best = max(runs, key=len)
+    return best.lower() if pattern.flags & re.IGNORECASE else best
+
+
+_LITERALS: Dict[str, List[str]] = {
+    lang: [_required_literal(p) for p in patterns] for lang, patterns in _LANGUAGE_PATTERNS.items()
+}
+
+
+@lru_cache(maxsize=None)
+def _combined(lang: str, indices: Tuple[int, ...]) -> re.Pattern:
+    """Gộp các pattern (theo index) của 1 ngôn ngữ thành 1 regex; flags giữ bằng inline flag (?im:...)."""
+    parts = []
+    for i in indices:
+        p = _LANGUAGE_PATTERNS[lang][i]
+        flags = ("i" if p.flags & re.IGNORECASE else "") + ("m" if p.flags & re.MULTILINE else "")
+        parts.append(f"(?P<p{i}>(?{flags}:{p.pattern}))" if flags else f"(?P<p{i}>{p.pattern})")
+    return re.compile("|".join(parts))
+
+
+def _score(lang: str, text: str, lowered: str) -> int:
+    """
+    Số pattern của ngôn ngữ có match trong text (giống pattern.search từng cái).
+    Pattern thiếu literal bắt buộc bị loại ngay; các pattern còn lại quét chung 1 regex,
+    mỗi lần tìm thấy 1 pattern thì tìm tiếp phần còn lại từ đúng vị trí đó → không bỏ sót match cùng vị trí.
+    """
+    patterns = _LANGUAGE_PATTERNS[lang]
+    remaining = tuple(
+        i for i, lit in enumerate(_LITERALS[lang])
+        if lit in (lowered if patterns[i].flags & re.IGNORECASE else text)
+    )
+    total = len(remaining)
+    pos = 0
+    while remaining:
+        m = _combined(lang, remaining).search(text, pos)
+        if m is None:
+            break
+        found = int(m.lastgroup[1:])
+        remaining = tuple(i for i in remaining if i != found)
+        pos = m.start()
+    return total - len(remaining)
+
+
+def _detect(text: str, allow_json: bool) -> Optional[str]:
+    # Hoà điểm → ngôn ngữ khai báo trước thắng; json chỉ hợp lệ khi code bắt đầu bằng { hoặc [
+    best_lang, best_score = None, 0
+    langs = [lang for lang in _LANGUAGE_PATTERNS if allow_json or lang != "json"]
+    lowered = text.lower()
+    for n, lang in enumerate(langs):
+        score = _score(lang, text, lowered)
+        if score > best_score:
+            best_lang, best_score = lang, score
+        # Dừng sớm: các ngôn ngữ còn lại (đứng sau, thua khi hoà) không thể vượt điểm hiện tại
+        if best_score and all(len(_LANGUAGE_PATTERNS[rest]) <= best_score for rest in langs[n + 1:]):
+            break
+    return best_lang
+
+
 def guess_lang_from_code(code: str) -> Optional[str]:
-    if not code or not code.strip():
+    """
+    Đoán ngôn ngữ theo số pattern match. Input lớn chỉ lấy mẫu đầu/cuối; kết quả memo theo hash của mẫu
+    → rerun Streamlit với cùng code không quét lại.
+    """
+    if not code or code.isspace():
         return None
 
-    scores = {lang: 0 for lang in _LANGUAGE_PATTERNS}
-    for lang, patterns in _LANGUAGE_PATTERNS.items():
-        for pattern in patterns:
-            if pattern.search(code):
-                scores[lang] += 1
-
-    ordered = sorted(scores.items(), key=lambda item: item[1], reverse=True)
-    for lang, score in ordered:
-        if score == 0:
-            return None
-        if lang == "json" and not code.lstrip().startswith(("{", "[")):
-            continue
-        return lang
-    return None
+    text = _sample(code)
+    allow_json = _JSON_START.match(code) is not None
+    key = (allow_json, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+    if key in _memo:
+        _memo.move_to_end(key)
+        return _memo[key]
+
+    lang = _detect(text, allow_json)
+    _memo[key] = lang
+    if len(_memo) > _MEMO_MAX_ENTRIES:
+        _memo.popitem(last=False)
+    return lang
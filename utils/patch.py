@@ -0,0 +1,229 @@
+import difflib
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from config.logging import logger
+
+# Ngưỡng giống nhau (SequenceMatcher.ratio) tối thiểu để chấp nhận khớp mờ 1 khối SEARCH
+FUZZY_MATCH_THRESHOLD = 0.88
+# Chênh lệch tối thiểu giữa vị trí tốt nhất và nhì → tránh áp patch vào chỗ mơ hồ
+_FUZZY_MIN_MARGIN = 0.03
+# Giới hạn chi phí khớp mờ: số cửa sổ × số dòng SEARCH
+_FUZZY_MAX_CELLS = 2_000_000
+
+NO_CHANGES_MARKER = "NO_CHANGES"
+
+_SEARCH_RE = re.compile(r"^<{5,}\s*SEARCH\s*$")
+_DIVIDER_RE = re.compile(r"^={5,}\s*$")
+_REPLACE_RE = re.compile(r"^>{5,}\s*REPLACE\s*$")
+_HUNK_RE = re.compile(r"^@@.*@@")
+_HUNK_START_RE = re.compile(r"^@@\s*-(\d+)")
+# NO_CHANGES phải đứng riêng 1 dòng (cho phép ``` / dấu chấm bao quanh) — không khớp "NO_CHANGES_FLAG = 1" trong code
+_NO_CHANGES_RE = re.compile(rf"^[ \t`*]*{NO_CHANGES_MARKER}[ \t`*.]*$", re.MULTILINE)
+
+
+class PatchBlock(NamedTuple):
+    search: List[str]    # các dòng cần tìm trong code hiện tại
+    replace: List[str]   # các dòng thay thế
+    start: Optional[int] = None   # dòng bắt đầu (0-based) theo header @@ -start của unified diff
+
+
+# ---------- Parse output của model ----------
+def _parse_search_replace(lines: List[str]) -> Optional[List[PatchBlock]]:
+    """None → có khối dở dang (output bị cắt): không áp nửa chừng các khối phía trước."""
+    blocks: List[PatchBlock] = []
+    i = 0
+    while i < len(lines):
+        if not _SEARCH_RE.match(lines[i]):
+            i += 1
+            continue
+        j = i + 1
+        while j < len(lines) and not _DIVIDER_RE.match(lines[j]):
+            j += 1
+        k = j + 1
+        while k < len(lines) and not _REPLACE_RE.match(lines[k]):
+            k += 1
+        if k >= len(lines):
+            return None
+        blocks.append(PatchBlock(lines[i + 1:j], lines[j + 1:k]))
+        i = k + 1
+    return blocks
+
+
+def _parse_unified_diff(lines: List[str]) -> List[PatchBlock]:
+    """
+    Mỗi hunk @@ → 1 khối: SEARCH = context + dòng '-', REPLACE = context + dòng '+'.
+    Số dòng -start của header được giữ lại để chọn đúng chỗ khi SEARCH khớp nhiều nơi.
+    """
+    blocks: List[PatchBlock] = []
+    search: Optional[List[str]] = None
+    replace: List[str] = []
+    start: Optional[int] = None
+    for line in lines:
+        if _HUNK_RE.match(line):
+            if search is not None:
+                blocks.append(PatchBlock(search, replace, start))
+            search, replace = [], []
+            m = _HUNK_START_RE.match(line)
+            start = max(int(m.group(1)) - 1, 0) if m else None
+        elif search is None or line.startswith(("--- ", "+++ ", "\\ No newline")):
+            continue
+        elif line.startswith("-"):
+            search.append(line[1:])
+        elif line.startswith("+"):
+            replace.append(line[1:])
+        else:
+            ctx = line[1:] if line.startswith(" ") else line
+            search.append(ctx)
+            replace.append(ctx)
+    if search is not None:
+        blocks.append(PatchBlock(search, replace, start))
+    return blocks
+
+
+def parse_patch(text: str) -> Optional[List[PatchBlock]]:
+    """
+    Parse output dạng SEARCH/REPLACE hoặc unified diff (có thể nằm trong ```).
+    [] → model báo không cần sửa (NO_CHANGES); None → không nhận diện được patch.
+    """
+    lines = (text or "").replace("\r\n", "\n").split("\n")
+    blocks = _parse_search_replace(lines)
+    if blocks is None:
+        logger.info("[patch] Khối SEARCH/REPLACE dở dang (output bị cắt) → bỏ cả patch")
+        return None
+    if not blocks and any(_HUNK_RE.match(l) for l in lines):
+        blocks = _parse_unified_diff([l for l in lines if not l.startswith("```")])
+    if blocks:
+        return blocks
+    return [] if is_no_changes(text) else None
+
+
+def is_no_changes(text: Optional[str]) -> bool:
+    """Model trả lời NO_CHANGES (đứng riêng 1 dòng) → không cần sửa gì."""
+    return bool(_NO_CHANGES_RE.search(text or ""))
+
+
+# ---------- Áp patch ----------
+def _norm(line: str) -> str:
+    return " ".join(line.split())
+
+
+def _find_exact(lines: List[str], search: List[str], key=lambda l: l) -> List[int]:
+    keyed = [key(l) for l in lines]
+    target = [key(l) for l in search]
+    n = len(target)
+    return [i for i in range(len(keyed) - n + 1) if keyed[i] == target[0] and keyed[i:i + n] == target]
+
+
+def _find_fuzzy(lines: List[str], search: List[str]) -> Optional[int]:
+    n = len(search)
+    windows = len(lines) - n + 1
+    if windows <= 0 or windows * n > _FUZZY_MAX_CELLS:
+        return None
+    target = "\n".join(_norm(l) for l in search)
+    normed = [_norm(l) for l in lines]
+    matcher = difflib.SequenceMatcher(None, autojunk=False)
+    matcher.set_seq2(target)
+    scored: List[Tuple[float, int]] = []
+    for i in range(windows):
+        matcher.set_seq1("\n".join(normed[i:i + n]))
+        if matcher.real_quick_ratio() < FUZZY_MATCH_THRESHOLD or matcher.quick_ratio() < FUZZY_MATCH_THRESHOLD:
+            continue
+        scored.append((matcher.ratio(), i))
+    scored.sort(reverse=True)
+    if not scored or scored[0][0] < FUZZY_MATCH_THRESHOLD:
+        return None
+    if len(scored) > 1 and scored[0][0] - scored[1][0] < _FUZZY_MIN_MARGIN and abs(scored[0][1] - scored[1][1]) >= n:
+        return None
+    return scored[0][1]
+
+
+def _leading_ws(line: str) -> str:
+    return line[: len(line) - len(line.lstrip())]
+
+
+def _reindent(replace: List[str], search: List[str], matched: List[str]) -> List[str]:
+    """Model sai indent chung (vd. bỏ indent của method) → dịch REPLACE theo độ lệch giữa SEARCH và bản khớp."""
+    s_first = next((l for l in search if l.strip()), "")
+    m_first = next((l for l in matched if l.strip()), "")
+    s_ws, m_ws = _leading_ws(s_first), _leading_ws(m_first)
+    if m_ws.startswith(s_ws) and m_ws != s_ws:
+        extra = m_ws[len(s_ws):]
+        return [extra + l if l.strip() else l for l in replace]
+    if s_ws.startswith(m_ws) and m_ws != s_ws:
+        extra = s_ws[len(m_ws):]
+        return [l[len(extra):] if l.startswith(extra) else l for l in replace]
+    return replace
+
+
+def _pick(found: List[int], hint: int, expected: Optional[int]) -> Optional[int]:
+    """
+    Nhiều chỗ khớp: có số dòng từ hunk → chỗ gần nhất (đồng hạng → mơ hồ);
+    không có → chỗ duy nhất sau khối trước (hint). Không phân định được → None.
+    """
+    if expected is not None:
+        ranked = sorted(found, key=lambda i: abs(i - expected))
+        if abs(ranked[0] - expected) < abs(ranked[1] - expected):
+            return ranked[0]
+        return None
+    after = [i for i in found if i >= hint]
+    return after[0] if len(after) == 1 else None
+
+
+def _locate(
+    lines: List[str], block: PatchBlock, hint: int, expected: Optional[int] = None
+) -> Optional[Tuple[int, bool]]:
+    """(vị trí, có phải khớp chính xác) của khối SEARCH; nhiều chỗ khớp mà không phân định được → None."""
+    for key, exact in ((lambda l: l, True), (lambda l: l.rstrip(), True), (_norm, False)):
+        found = _find_exact(lines, block.search, key)
+        if len(found) == 1:
+            return found[0], exact
+        if found:
+            pos = _pick(found, hint, expected)
+            if pos is None:
+                logger.info(f"[patch] SEARCH khớp {len(found)} chỗ {found}, không phân định được")
+                return None
+            return pos, exact
+    pos = _find_fuzzy(lines, block.search)
+    return (pos, False) if pos is not None else None
+
+
+def apply_patch(code: str, blocks: List[PatchBlock]) -> Optional[str]:
+    """
+    Áp lần lượt các khối SEARCH/REPLACE vào code: khớp chính xác → bỏ qua khác biệt khoảng trắng → khớp mờ.
+    Bất kỳ khối nào không định vị được → None (caller fallback sang xin cả file).
+    """
+    lines = code.split("\n")
+    hint = 0
+    shift = 0   # số dòng lệch so với file gốc do các khối trước (để dùng số dòng của hunk)
+    for n, block in enumerate(blocks, start=1):
+        search = list(block.search)
+        trimmed = 0
+        while search and not search[0].strip():
+            search.pop(0)
+            trimmed += 1
+        while search and not search[-1].strip():
+            search.pop()
+        if not search:
+            logger.info(f"[patch] Khối {n}: SEARCH rỗng → không áp được")
+            return None
+        expected = block.start + trimmed + shift if block.start is not None else None
+        located = _locate(lines, PatchBlock(search, block.replace), hint, expected)
+        if located is None:
+            logger.info(f"[patch] Khối {n}: không tìm thấy đoạn SEARCH ({len(search)} dòng)")
+            return None
+        pos, exact = located
+        matched = lines[pos:pos + len(search)]
+        replace = block.replace if exact else _reindent(block.replace, search, matched)
+        # Bỏ dòng trống thừa ở 2 đầu REPLACE tương ứng với phần đã cắt khỏi SEARCH
+        replace = list(replace)
+        if block.search and not block.search[0].strip():
+            while replace and not replace[0].strip():
+                replace.pop(0)
+        if block.search and not block.search[-1].strip():
+            while replace and not replace[-1].strip():
+                replace.pop()
+        lines[pos:pos + len(search)] = replace
+        hint = pos + len(replace)
+        shift += len(replace) - len(search)
+    return "\n".join(lines)
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from config.logging import logger
+
+
+def fingerprint(secret: Optional[str]) -> str:
+    """
+    Trả về dấu vân tay ngắn (sha256) của secret để dùng làm cache key.
+    Không bao giờ giữ API key gốc trong key/log.
+    """
+    if not secret:
+        return ""
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:16]
+
+
+class ResourceCache:
+    """
+    Cache process-wide cho các object đắt (LLM client, retriever...) để dùng lại qua các lần Streamlit rerun.
+    - Mỗi loại resource (kind) có một bucket LRU riêng, giới hạn max_per_kind phần tử.
+    - Key do caller tự build (provider, endpoint, fingerprint API key, index...), đổi settings → key mới.
+    - LRU đẩy ra chỉ bỏ tham chiếu trong cache, KHÔNG close(): phiên khác có thể vẫn đang giữ object
+      (vd: stream đang đọc dở) → object tự được thu hồi khi không còn ai dùng.
+    - invalidate() (caller chủ động gỡ, vd: Settings đổi cấu hình) gỡ resource và gọi close() nếu object hỗ trợ.
+    """
+
+    def __init__(self, max_per_kind: int = 8):
+        self._lock = threading.RLock()
+        self._items: Dict[str, "OrderedDict[Hashable, Any]"] = {}
+        self._pending: Dict[Tuple[str, Hashable], Future] = {}   # (kind, key) đang khởi tạo
+        self._max_per_kind = max_per_kind
+
+    def get_or_create(self, kind: str, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Lấy resource theo (kind, key), chưa có → gọi factory() NGOÀI lock chung.
+        Các phiên cùng xin 1 key đang khởi tạo thì chờ chung 1 Future (không gọi network khởi tạo 2 lần);
+        key khác (vd: retriever trong khi LLM client đang khởi tạo) không bị chặn.
+        """
+        with self._lock:
+            bucket = self._items.setdefault(kind, OrderedDict())
+            if key in bucket:
+                bucket.move_to_end(key)
+                return bucket[key]
+            pending = self._pending.get((kind, key))
+            owner = pending is None
+            if owner:
+                pending = self._pending[(kind, key)] = Future()
+        if not owner:
+            return pending.result()
+
+        logger.info(f"[cache] Khởi tạo resource mới: {kind}")
+        try:
+            value = factory()
+        except BaseException as e:
+            with self._lock:
+                self._pending.pop((kind, key), None)
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            bucket = self._items.setdefault(kind, OrderedDict())
+            bucket[key] = value
+            while len(bucket) > self._max_per_kind:
+                bucket.popitem(last=False)
+                logger.info(f"[cache] LRU bỏ resource cũ: {kind}")
+            self._pending.pop((kind, key), None)
+        pending.set_result(value)
+        return value
+
+    def invalidate(self, kind: str, key: Optional[Hashable] = None) -> None:
+        """Gỡ một resource (theo key) hoặc toàn bộ bucket của kind."""
+        with self._lock:
+            bucket = self._items.get(kind)
+            if not bucket:
+                return
+            if key is None:
+                evicted = list(bucket.values())
+                bucket.clear()
+            else:
+                evicted = [bucket.pop(key)] if key in bucket else []
+        for value in evicted:
+            logger.info(f"[cache] Invalidate resource: {kind}")
+            _close_quietly(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            kinds = list(self._items)
+        for kind in kinds:
+            self.invalidate(kind)
+
+
+def _close_quietly(value: Any) -> None:
+    close = getattr(value, "close", None)
+    if not callable(close):
+        return
+    try:
+        close()
+    except Exception as e:
+        logger.warning(f"[cache] Lỗi khi đóng resource: {e}")
+
+
+resource_cache = ResourceCache()
@@ -0,0 +1,210 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from config.logging import logger
+
+T = TypeVar("T")
+
+_RETRY_STATUS = {408, 409, 429}   # + mọi mã 5xx
+# Lỗi không có status code (SDK OpenAI/Pinecone, httpx.TransportError và lớp con...) → so theo tên class
+_RETRYABLE_NAMES = ("RateLimit", "Timeout", "APIConnection", "ServiceUnavailable", "InternalServer", "TransportError")
+
+
+# ---------- Phân loại lỗi ----------
+def status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429/408/409/5xx, lỗi kết nối hoặc timeout → thử lại; lỗi 4xx khác (key sai, request sai) → không."""
+    status = status_code(exc)
+    if status is not None:
+        return status in _RETRY_STATUS or status >= 500
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return any(name in cls.__name__ for cls in type(exc).__mro__ for name in _RETRYABLE_NAMES)
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Đọc retry-after-ms / retry-after (giây hoặc HTTP date) từ response lỗi."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        ms = headers.get("retry-after-ms")
+        if ms is not None:
+            return max(0.0, float(ms) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# ---------- Circuit breaker ----------
+class CircuitBreaker:
+    """
+    closed → (failure_threshold lỗi liên tiếp) → open: từ chối ngay trong reset_timeout giây
+    → half-open: cho 1 lời gọi thử; thành công → closed, lỗi → open lại.
+    """
+
+    def __init__(self, name: str, *, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def before_call(self) -> None:
+        """Mạch mở → RuntimeError ngay (không chờ timeout của provider)."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._probing:
+                raise RuntimeError(
+                    f"[retry] Circuit breaker '{self.name}' đang mở, thử lại sau {max(remaining, 0):.0f}s"
+                )
+            self._probing = True   # half-open: chỉ 1 lời gọi thử
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"[retry] Circuit breaker '{self.name}' đóng lại")
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.info(f"[retry] Circuit breaker '{self.name}' mở sau {self._failures} lỗi liên tiếp")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+# ---------- Retry / backoff ----------
+class RetryPolicy:
+    """
+    Gọi 1 request với deadline tổng (deadline_s), timeout mỗi lần thử ≤ phần thời gian còn lại,
+    retry lỗi tạm thời với exponential backoff + full jitter và circuit breaker (tuỳ chọn).
+    Retry-After của provider được tôn trọng nguyên vẹn; chờ theo nó mà vượt deadline → trả lỗi ngay.
+    fn nhận timeout (giây) của lần thử hiện tại.
+    """
+
+    def __init__(
+        self,
+        *,
+        label: str,
+        max_retries: int,
+        backoff_base_s: float,
+        backoff_max_s: float,
+        deadline_s: float = float("inf"),
+        attempt_timeout_s: float = float("inf"),
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.label = label   # tiền tố log, vd: "[llm] openai", "[ingest] embed"
+        self.breaker = breaker
+        self.max_retries = max(0, max_retries)
+        self.deadline_s = deadline_s
+        self.attempt_timeout_s = attempt_timeout_s
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+
+    def _next_delay(self, attempt: int, exc: BaseException, started: float) -> Optional[float]:
+        """Thời gian chờ trước lần thử kế; None → không thử lại (hết lượt, lỗi không tạm thời, hết deadline)."""
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return None
+        if self.breaker is not None and self.breaker.state == "open":   # mạch vừa mở → trả lỗi gốc
+            return None
+        remaining = self.deadline_s - (time.monotonic() - started)
+        hinted = retry_after_seconds(exc)
+        if hinted is not None:
+            if hinted >= remaining - 1.0:
+                logger.info(f"{self.label}: Retry-After {hinted:.1f}s vượt deadline còn {remaining:.1f}s → không thử lại")
+                return None
+            delay = hinted + random.uniform(0, self.backoff_base_s)
+        else:
+            delay = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+        if delay >= remaining - 1.0:   # không còn đủ thời gian cho 1 lần thử có nghĩa
+            return None
+        logger.info(
+            f"{self.label}: lỗi tạm thời ({status_code(exc) or type(exc).__name__}), "
+            f"thử lại lần {attempt + 1}/{self.max_retries} sau {delay:.2f}s"
+        )
+        return delay
+
+    def _attempt_timeout(self, started: float) -> float:
+        remaining = self.deadline_s - (time.monotonic() - started)
+        return max(1.0, min(self.attempt_timeout_s, remaining))
+
+    def call(self, fn: Callable[[float], T]) -> T:
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = fn(self._attempt_timeout(started))
+            except Exception as exc:
+                if self.breaker is not None:
+                    if is_retryable(exc):
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()   # provider vẫn phản hồi (lỗi do request)
+                delay = self._next_delay(attempt, exc, started)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    async def acall(self, fn: Callable[[float], Awaitable[T]]) -> T:
+        """Bản async của call(): cùng deadline/backoff/breaker, chờ bằng asyncio.sleep (không chặn event loop)."""
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = await fn(self._attempt_timeout(started))
+            except Exception as exc:
+                if self.breaker is not None:
+                    if is_retryable(exc):
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                delay = self._next_delay(attempt, exc, started)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
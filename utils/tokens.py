@@ -1,7 +1,37 @@
-from typing import List
+import hashlib
+from functools import lru_cache
+from typing import Dict, List, Optional
+
 import tiktoken
 
 from chat.chat_message import ChatMessage
+from config.constant import DEFAULT_PROMPT_TOKEN_BUDGET, MODEL_CONTEXT_TOKENS
+
+_MESSAGE_OVERHEAD = 4   # overhead mỗi message theo format OpenAI
+_REPLY_OVERHEAD = 3     # overhead cho assistant trả lời
+
+
+@lru_cache(maxsize=32)
+def get_encoding(model: str) -> "tiktoken.Encoding":
+    """Resolve encoding 1 lần cho mỗi model (encoding_for_model khá tốn khi gọi lặp lại)."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")  # fallback an toàn
+
+
+def get_prompt_token_budget(model: str, reserve_output: int = 0) -> int:
+    """
+    Budget token cho prompt theo bảng MODEL_CONTEXT_TOKENS (so khớp prefix dài nhất),
+    trừ phần dành cho output. Model không có trong bảng → DEFAULT_PROMPT_TOKEN_BUDGET.
+    Budget không bao giờ vượt context - reserve_output (gpt-4 8192 - 2048 → 6144, không phải 8000).
+    """
+    name = (model or "").strip().lower()
+    matches = [k for k in MODEL_CONTEXT_TOKENS if name.startswith(k) and name[len(k):len(k) + 1] in ("", "-", ":")]
+    if not matches:
+        return DEFAULT_PROMPT_TOKEN_BUDGET
+    context = MODEL_CONTEXT_TOKENS[max(matches, key=len)]
+    return max(context - max(reserve_output, 0), 0)
 
 
 def count_tokens_tiktoken(messages: List[ChatMessage], model: str) -> int:
@@ -9,17 +39,82 @@ def count_tokens_tiktoken(messages: List[ChatMessage], model: str) -> int:
     Đếm token chính xác với tiktoken, dựa trên schema chat.
     Hỗ trợ tốt với các model ChatCompletion như gpt-3.5, gpt-4, gpt-4o...
     """
-    try:
-        enc = tiktoken.encoding_for_model(model)
-    except KeyError:
-        enc = tiktoken.get_encoding("cl100k_base")  # fallback an toàn
+    enc = get_encoding(model)
 
     tokens = 0
     for msg in messages:
         # Count tokens for role + content
-        tokens += 4  # overhead mỗi message theo format OpenAI
+        tokens += _MESSAGE_OVERHEAD
         tokens += len(enc.encode(msg.role))
         tokens += len(enc.encode(msg.content or ""))
 
-    tokens += 3  # overhead cho assistant trả lời
-    return tokens
\ No newline at end of file
+    tokens += _REPLY_OVERHEAD
+    return tokens
+
+
+class TokenBudgeter:
+    """
+    Chọn lịch sử chat vừa budget token trong 1 lượt:
+    - Token của từng message được cache theo hash(encoding, role, content) → mỗi nội dung chỉ encode 1 lần,
+      cache này nằm cùng SessionState.chat_messages nên sống qua các lượt hỏi.
+    - Cộng dồn token từ message mới nhất về cũ (suffix sum), dừng ngay khi vượt budget.
+    """
+
+    def __init__(self, *, model: str, cache: Optional[Dict[str, int]] = None, max_entries: int = 512):
+        self.model = model
+        self.encoding = get_encoding(model)
+        self.cache: Dict[str, int] = cache if cache is not None else {}
+        self.max_entries = max_entries
+        self.last_total = 0
+        self.last_dropped = 0   # số message history bị bỏ ở lần fit gần nhất
+
+    def count(self, msg: ChatMessage) -> int:
+        content = msg.content or ""
+        key = hashlib.blake2b(
+            f"{self.encoding.name}\0{msg.role}\0{content}".encode("utf-8"), digest_size=16
+        ).hexdigest()
+        tokens = self.cache.get(key)
+        if tokens is None:
+            tokens = _MESSAGE_OVERHEAD + len(self.encoding.encode(msg.role)) + len(self.encoding.encode(content))
+        else:
+            del self.cache[key]  # đưa về cuối → giữ thứ tự LRU
+        self.cache[key] = tokens
+        return tokens
+
+    def fit(
+        self,
+        *,
+        base_message: ChatMessage,
+        history: List[ChatMessage],
+        new_user_message: ChatMessage,
+        max_turns: int,
+        max_tokens: int,
+        summary_message: Optional[ChatMessage] = None,
+    ) -> List[ChatMessage]:
+        """
+        Trả về [base] + [summary] + suffix dài nhất (≤ max_turns) của history + [user] mà tổng token ≤ max_tokens.
+        summary_message (tóm tắt các lượt cũ) luôn được giữ, tính vào budget trước history.
+        """
+        head = [base_message] + ([summary_message] if summary_message is not None else [])
+        total = sum(self.count(m) for m in head) + self.count(new_user_message) + _REPLY_OVERHEAD
+        candidates = history[-max_turns:] if max_turns > 0 else []
+
+        keep = 0
+        for msg in reversed(candidates):
+            tokens = self.count(msg)
+            if total + tokens > max_tokens:
+                break
+            total += tokens
+            keep += 1
+
+        self._prune()
+        kept = candidates[len(candidates) - keep:] if keep else []
+        self.last_total = total
+        self.last_dropped = len(history) - keep
+        return head + kept + [new_user_message]
+
+    def _prune(self) -> None:
+        # Bỏ các entry ít dùng nhất (đầu dict) để cache không phình theo số lần sửa code
+        overflow = len(self.cache) - self.max_entries
+        for key in list(self.cache)[:max(overflow, 0)]:
+            del self.cache[key]